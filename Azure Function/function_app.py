@@ -6,13 +6,53 @@ import logging
 import re
 import os
 import html
-from urllib.parse import urlencode, urlparse, parse_qs
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError
-from datetime import datetime, date
+import http.client
+import base64
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import functools
+import random
+import warnings
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlparse, parse_qs, quote, unquote, urljoin
+from urllib.request import getproxies, proxy_bypass
+from datetime import datetime, date, timezone
+from email.utils import parsedate_to_datetime
+from pandas.tseries.api import guess_datetime_format
 
 app = func.FunctionApp()
 
+# =============================================================================
+# APP SETTINGS NUMÉRICOS
+# =============================================================================
+
+
+def _get_env_number(name, default, cast):
+    raw = os.environ.get(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return cast(raw.strip())
+    except ValueError:
+        logging.warning("App setting %s inválido (%r); usando o padrão %s", name, raw, default)
+        return default
+
+
+def get_env_int(name, default):
+    """App setting inteiro; ausente, vazio ou inválido -> default (inválido gera warning)."""
+    return _get_env_number(name, default, int)
+
+
+def get_env_float(name, default):
+    """App setting numérico (float); ausente, vazio ou inválido -> default."""
+    return _get_env_number(name, default, float)
+
+
 # =============================================================================
 # PAYLOAD DEFAULTS - Ensures all adaptive card tokens are always present
 # =============================================================================
@@ -108,6 +148,73 @@ def parse_number(val, default=0.0):
         return default
 
 
+_NUMBER_JUNK_RE = re.compile(r"[^0-9.\-]")
+_NUMBER_VALID_RE = re.compile(r"-?(?:\d+\.?\d*|\.\d+)")
+_COMMA_DECIMAL_TABLE = str.maketrans({".": None, ",": "."})
+_COMMA_THOUSANDS_TABLE = str.maketrans({",": None})
+
+
+def _scan_number_strings(s):
+    """Aplica as regras de parse_number a uma Series de textos distintos.
+
+    Moeda, espaços e tokens NULL_LIKE não têm dígitos nem separadores, então
+    caem na limpeza final (_NUMBER_JUNK_RE) sem passadas extras.
+    """
+    has_percent = s.str.contains("%", regex=False)
+
+    # pt-BR (1.234,56 ou 12,5) vs US (1,234.56)
+    comma_decimal = (s.str.rfind(",") > s.str.rfind(".")).to_numpy()
+    s = s.copy()
+    s[comma_decimal] = s[comma_decimal].str.translate(_COMMA_DECIMAL_TABLE)
+    s[~comma_decimal] = s[~comma_decimal].str.translate(_COMMA_THOUSANDS_TABLE)
+
+    s = s.str.replace(_NUMBER_JUNK_RE, "", regex=True)
+    valid = s.str.fullmatch(_NUMBER_VALID_RE).to_numpy(dtype=bool)
+    values = np.full(len(s), np.nan)
+    values[valid] = s[valid].astype("float64").to_numpy()
+    return values, has_percent.to_numpy(dtype=bool)
+
+
+def scan_number_series(series):
+    """Parse vetorizado de uma coluna numérica (mesmas regras de parse_number).
+
+    Cada texto distinto é processado uma única vez. Retorna
+    (valores, tem_percentual): valores é float64 com NaN onde a célula é
+    nula/inválida; tem_percentual marca as células texto que continham '%'.
+    """
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return series.astype("float64"), pd.Series(False, index=series.index)
+
+    raw = series.to_numpy(dtype=object)
+    values = np.full(len(raw), np.nan)
+    has_percent = np.zeros(len(raw), dtype=bool)
+
+    is_str = series.map(type).isin((str, np.str_)).to_numpy()
+    other = ~is_str & series.notna().to_numpy()
+
+    if is_str.any():
+        codes, uniques = pd.factorize(raw[is_str])
+        parsed, percent = _scan_number_strings(pd.Series(uniques, dtype=object).astype(str))
+        values[is_str] = parsed[codes]
+        has_percent[is_str] = percent[codes]
+
+    if other.any():
+        # Números nativos (int/float/bool/numpy) de payloads JSON mistos
+        numeric = pd.to_numeric(pd.Series(raw[other]), errors="coerce").to_numpy(dtype="float64")
+        leftover = np.isnan(numeric)
+        if leftover.any():
+            numeric[leftover] = [parse_number(v, default=np.nan) for v in raw[other][leftover]]
+        values[other] = numeric
+
+    return pd.Series(values, index=series.index), pd.Series(has_percent, index=series.index)
+
+
+def parse_number_series(series, default=0.0):
+    """Equivalente vetorizado de series.apply(parse_number)."""
+    values, _ = scan_number_series(series)
+    return values.fillna(default)
+
+
 def to_native(val):
     if val is None:
         return None
@@ -162,18 +269,96 @@ def normalize_frame(df):
     return df
 
 
+# =============================================================================
+# CACHE DE RESULTADOS - consolidar / consolidar-v2
+# =============================================================================
+
+RESULT_CACHE_TTL_SECONDS = get_env_int("RESULT_CACHE_TTL_SECONDS", 600)
+RESULT_CACHE_MAX_ENTRIES = get_env_int("RESULT_CACHE_MAX_ENTRIES", 32)
+RESULT_CACHE_MAX_BYTES = get_env_int("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+_RESULT_CACHE = OrderedDict()  # chave -> (expira_em, corpo_json)
+_RESULT_CACHE_LOCK = threading.Lock()
+_RESULT_CACHE_BYTES = 0
+
+
+def result_cache_key(route, body, hoje):
+    """Hash estável do body normalizado + dia de referência (janelas usam `hoje`)."""
+    payload = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    digest = hashlib.sha256()
+    digest.update(f"{route}|{hoje.strftime('%Y-%m-%d')}|".encode("utf-8"))
+    digest.update(payload.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def result_cache_bypass(req):
+    """Header X-Cache-Bypass: true (ou Cache-Control: no-cache) força recálculo."""
+    raw = req.headers.get("x-cache-bypass") or ""
+    if raw.strip().lower() in ("1", "true", "yes", "y", "on"):
+        return True
+    return "no-cache" in (req.headers.get("cache-control") or "").lower()
+
+
+def result_cache_get(key):
+    if RESULT_CACHE_TTL_SECONDS <= 0:
+        return None
+    with _RESULT_CACHE_LOCK:
+        entry = _RESULT_CACHE.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            _result_cache_discard(key)
+            return None
+        _RESULT_CACHE.move_to_end(key)
+        return entry[1]
+
+
+def result_cache_put(key, body_text):
+    global _RESULT_CACHE_BYTES
+    size = len(body_text)
+    if RESULT_CACHE_TTL_SECONDS <= 0 or size > RESULT_CACHE_MAX_BYTES:
+        return
+    with _RESULT_CACHE_LOCK:
+        _result_cache_discard(key)
+        _RESULT_CACHE[key] = (time.monotonic() + RESULT_CACHE_TTL_SECONDS, body_text)
+        _RESULT_CACHE_BYTES += size
+        now = time.monotonic()
+        for old_key in [k for k, (expira_em, _) in _RESULT_CACHE.items() if expira_em <= now]:
+            _result_cache_discard(old_key)
+        while len(_RESULT_CACHE) > RESULT_CACHE_MAX_ENTRIES or _RESULT_CACHE_BYTES > RESULT_CACHE_MAX_BYTES:
+            _result_cache_discard(next(iter(_RESULT_CACHE)))
+
+
+def _result_cache_discard(key):
+    """Remove a entrada (chamar com _RESULT_CACHE_LOCK)."""
+    global _RESULT_CACHE_BYTES
+    entry = _RESULT_CACHE.pop(key, None)
+    if entry is not None:
+        _RESULT_CACHE_BYTES -= len(entry[1])
+
+
 @app.route(route="consolidar", auth_level=func.AuthLevel.FUNCTION)
 def consolidar_pipeline(req: func.HttpRequest) -> func.HttpResponse:
     """
     Recebe dados do SharePoint e retorna métricas agregadas para o report C-Level.
     TOLERANTE: Funciona mesmo com ofertas ou atualizações vazias.
     IDEMPOTENTE: Pode rodar múltiplas vezes no dia sem problemas.
+    CACHE: bodies idênticos no mesmo dia reutilizam o resultado (X-Cache-Bypass: true recalcula).
     """
     logging.info("Iniciando consolidação do pipeline...")
 
     try:
         # Recebe dados do Power Automate
         req_body = req.get_json()
+
+        cache_key = result_cache_key("consolidar", req_body, datetime.now())
+        cached = None if result_cache_bypass(req) else result_cache_get(cache_key)
+        if cached is not None:
+            logging.info("Consolidação servida do cache (%s)", cache_key[:12])
+            return func.HttpResponse(
+                cached, status_code=200, mimetype="application/json", headers={"X-Cache": "HIT"}
+            )
+
         ofertas = req_body.get("ofertas", [])
         atualizacoes = req_body.get("atualizacoes", [])
 
@@ -205,7 +390,6 @@ def consolidar_pipeline(req: func.HttpRequest) -> func.HttpResponse:
                 "data_geracao": data_geracao,
             }
             logging.info("Consolidação: Nenhum dado recebido")
-            resultado = to_native_obj(resultado)
             return func.HttpResponse(
                 json.dumps(resultado, ensure_ascii=False),
                 status_code=200,
@@ -270,7 +454,6 @@ def consolidar_pipeline(req: func.HttpRequest) -> func.HttpResponse:
                 "Consolidação (apenas atualizações): %s registros",
                 len(df_atualizacoes),
             )
-            resultado = to_native_obj(resultado)
             return func.HttpResponse(
                 json.dumps(resultado, ensure_ascii=False),
                 status_code=200,
@@ -294,7 +477,7 @@ def consolidar_pipeline(req: func.HttpRequest) -> func.HttpResponse:
                 None,
             )
         if valor_col and valor_col in df_ofertas.columns:
-            df_ofertas[valor_col] = df_ofertas[valor_col].apply(parse_number)
+            df_ofertas[valor_col] = parse_number_series(df_ofertas[valor_col])
             valor_total = float(df_ofertas[valor_col].sum())
         else:
             valor_total = 0.0
@@ -339,10 +522,15 @@ def consolidar_pipeline(req: func.HttpRequest) -> func.HttpResponse:
                     .reset_index()
                 )
                 top_mercados.columns = ["mercado", "valor"]
+                top_mercados = frame_to_records(
+                    top_mercados, [("mercado", "mercado", "native"), ("valor", "valor", "float")]
+                )
             else:
                 top_mercados = df_ofertas[market_col].value_counts().head(5).reset_index()
                 top_mercados.columns = ["mercado", "quantidade"]
-            top_mercados = top_mercados.to_dict("records")
+                top_mercados = frame_to_records(
+                    top_mercados, [("mercado", "mercado", "native"), ("quantidade", "quantidade", "int")]
+                )
 
         # Top 5 Arquitetos
         assignee_col = next((c for c in df_ofertas.columns if "assignee" in c.lower()), None)
@@ -351,7 +539,9 @@ def consolidar_pipeline(req: func.HttpRequest) -> func.HttpResponse:
             df_ofertas[assignee_col] = df_ofertas[assignee_col].apply(extract_choice_value)
             top_arquitetos = df_ofertas[assignee_col].value_counts().head(5).reset_index()
             top_arquitetos.columns = ["arquiteto", "projetos"]
-            top_arquitetos = top_arquitetos.to_dict("records")
+            top_arquitetos = frame_to_records(
+                top_arquitetos, [("arquiteto", "arquiteto", "native"), ("projetos", "projetos", "int")]
+            )
 
         # Taxa de resposta (se tiver atualizações)
         taxa_resposta = 0.0
@@ -404,11 +594,13 @@ def consolidar_pipeline(req: func.HttpRequest) -> func.HttpResponse:
             len(df_atualizacoes),
         )
 
-        resultado = to_native_obj(resultado)
+        corpo = json.dumps(resultado, ensure_ascii=False)
+        result_cache_put(cache_key, corpo)
         return func.HttpResponse(
-            json.dumps(resultado, ensure_ascii=False),
+            corpo,
             status_code=200,
             mimetype="application/json",
+            headers={"X-Cache": "MISS"},
         )
 
     except Exception as e:
@@ -423,8 +615,12 @@ def consolidar_pipeline(req: func.HttpRequest) -> func.HttpResponse:
 @app.route(route="health", auth_level=func.AuthLevel.ANONYMOUS)
 def health_check(req: func.HttpRequest) -> func.HttpResponse:
     """Health check endpoint"""
-    resultado = {"status": "healthy", "timestamp": datetime.now().isoformat()}
-    resultado = to_native_obj(resultado)
+    resultado = {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "http": get_http_metrics(),
+        "rate_limits": get_rate_limit_state(),
+    }
     return func.HttpResponse(
         json.dumps(resultado, ensure_ascii=False),
         status_code=200,
@@ -449,6 +645,47 @@ def format_brl(value):
         return "R$ 0,00"
 
 
+_BRL_SEPARATORS_TABLE = str.maketrans({",": ".", ".": ","})
+
+
+def format_brl_series(series):
+    """Equivalente de series.apply(format_brl) para colunas numéricas."""
+    nums = pd.to_numeric(series, errors="coerce").astype("float64").tolist()
+    return [
+        f"R$ {num:,.2f}".translate(_BRL_SEPARATORS_TABLE) if num == num else "R$ 0,00"
+        for num in nums
+    ]
+
+
+# Conversores coluna -> lista de valores nativos usados por frame_to_records
+RECORD_FORMATTERS = {
+    "str": lambda s: [str(v) for v in s.tolist()],
+    "int": lambda s: [int(v) for v in s.tolist()],
+    "float": lambda s: [float(v) for v in s.tolist()],
+    "round1": lambda s: s.to_numpy(dtype="float64").round(1).tolist(),
+    "pct1": lambda s: [f"{v}%" for v in s.to_numpy(dtype="float64").round(1).tolist()],
+    "brl": format_brl_series,
+    "dia_mes": lambda s: [v.strftime("%d/%m") if pd.notna(v) else "N/A" for v in s.tolist()],
+    "native": lambda s: [None if pd.isna(v) else to_native(v) for v in s.tolist()],
+}
+
+
+def frame_to_records(df, fields, n=None):
+    """
+    Converte as (n primeiras) linhas de df em lista de dicts nativos, coluna a coluna.
+
+    fields: [(chave, coluna, formato)] com formato em RECORD_FORMATTERS;
+    coluna None preenche a chave com "N/A".
+    """
+    if n is not None:
+        df = df.head(n)
+    columns = {
+        key: ["N/A"] * len(df) if col is None else RECORD_FORMATTERS[fmt](df[col])
+        for key, col, fmt in fields
+    }
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
 def parse_date_safe(val):
     """Parse seguro de data, retorna None se inválido"""
     if is_null_like(val):
@@ -456,12 +693,120 @@ def parse_date_safe(val):
     try:
         if isinstance(val, (datetime, date)):
             return val if isinstance(val, datetime) else datetime.combine(val, datetime.min.time())
+        if isinstance(val, str):
+            return _parse_date_text(val)
         dt = pd.to_datetime(val, errors="coerce", dayfirst=True)
         return dt.to_pydatetime() if pd.notna(dt) else None
     except Exception:
         return None
 
 
+@functools.lru_cache(maxsize=8192)
+def _parse_date_text(text):
+    """pd.to_datetime(dayfirst=True) célula a célula, memoizado por texto bruto."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        dt = pd.to_datetime(text, errors="coerce", dayfirst=True)
+    return dt.to_pydatetime() if pd.notna(dt) else None
+
+
+# Formatos que o pandas não consegue inferir (ano com 2 dígitos) e que o
+# dateutil resolve com dayfirst=True. Ex.: export JIRA "31/12/27 13:18".
+DATE_FALLBACK_FORMATS = ("%d/%m/%y %H:%M", "%d/%m/%y %H:%M:%S", "%d/%m/%y")
+DATE_FORMAT_SAMPLE_SIZE = 20
+
+
+def _swap_day_month(fmt):
+    return fmt.replace("%d", "\0").replace("%m", "%d").replace("\0", "%m")
+
+
+def infer_date_formats(texts):
+    """Detecta o formato dominante de uma coluna de datas (texto).
+
+    Retorna a cadeia [dayfirst, monthfirst] a aplicar em bloco, reproduzindo
+    pd.to_datetime(dayfirst=True): dia primeiro quando válido, senão mês
+    primeiro. Lista vazia quando nenhum formato domina a amostra.
+    """
+    sample = [t for t in texts[:DATE_FORMAT_SAMPLE_SIZE] if t.strip().lower() not in NULL_LIKE]
+    if not sample:
+        return []
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        guessed = Counter(guess_datetime_format(t, dayfirst=True) for t in sample)
+
+    fmt = guessed.most_common(1)[0][0]
+    if fmt is None:
+        sample_series = pd.Series(sample, dtype=object)
+        for candidate in DATE_FALLBACK_FORMATS:
+            parsed = pd.to_datetime(sample_series, format=candidate, errors="coerce")
+            if parsed.notna().sum() * 2 > len(sample):
+                fmt = candidate
+                break
+    if fmt is None:
+        return []
+
+    if "%d" not in fmt or "%m" not in fmt:
+        return [fmt]
+    if fmt.index("%m") < fmt.index("%d"):
+        fmt = _swap_day_month(fmt)
+    return [fmt, _swap_day_month(fmt)]
+
+
+def _parse_date_texts(texts):
+    """Parse de textos distintos: formato dominante em bloco, outliers célula a célula."""
+    parsed = np.full(len(texts), None, dtype=object)
+    pending = np.ones(len(texts), dtype=bool)
+    series = pd.Series(texts, dtype=object)
+
+    for fmt in infer_date_formats(texts):
+        if not pending.any():
+            break
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            try:
+                bulk = pd.to_datetime(series[pending], format=fmt, errors="coerce")
+            except (ValueError, TypeError):
+                break
+        if not pd.api.types.is_datetime64_any_dtype(bulk.dtype):
+            # Offsets mistos: deixa para o parse célula a célula
+            break
+        ok = bulk.notna()
+        if "%y" in fmt:
+            # dateutil resolve anos de 2 dígitos numa janela de ±50 anos
+            this_year = date.today().year
+            ok &= (bulk.dt.year >= this_year - 50) & (bulk.dt.year < this_year + 50)
+        positions = np.flatnonzero(pending)[ok.to_numpy()]
+        parsed[positions] = [ts.to_pydatetime() for ts in bulk[ok]]
+        pending[positions] = False
+
+    for pos in np.flatnonzero(pending):
+        parsed[pos] = parse_date_safe(texts[pos])
+    return parsed
+
+
+def parse_date_series(series):
+    """Equivalente vetorizado de series.apply(parse_date_safe).
+
+    Cada texto distinto é processado uma única vez; o formato dominante da
+    coluna é detectado uma vez e aplicado em bloco.
+    """
+    raw = series.to_numpy(dtype=object)
+    result = np.full(len(raw), None, dtype=object)
+
+    is_str = series.map(type).isin((str, np.str_)).to_numpy()
+    other = ~is_str & series.notna().to_numpy()
+
+    if is_str.any():
+        codes, uniques = pd.factorize(raw[is_str])
+        result[is_str] = _parse_date_texts(uniques)[codes]
+    if other.any():
+        result[other] = [parse_date_safe(v) for v in raw[other]]
+
+    # Mesma inferência de dtype de Series.apply (datetime64 quando possível)
+    return pd.Series(result, index=series.index, dtype=object).infer_objects()
+
+
 # Status categories for business logic (atualizado 2025-12-25 per business requirements)
 # 1. Em Desenvolvimento = Arquiteto trabalhando na proposta
 STATUS_EM_DESENVOLVIMENTO = {"Under Study", "On Offer", "Proposal", "Presale", 
@@ -480,6 +825,307 @@ STATUS_LOST = {"Lost", "Rejected", "lost", "rejected"}
 # 5. Canceladas = Cliente abandonou, sem resposta por 60-90 dias, ou cancelada por KAM/DN
 STATUS_CANCELADAS = {"Cancelled", "Abandoned", "cancelled", "abandoned"}
 
+# Ordem de prioridade das categorias (um status em dois conjuntos fica na primeira)
+STATUS_CATEGORIAS = (
+    ("desenvolvimento", STATUS_EM_DESENVOLVIMENTO),
+    ("entregue", STATUS_ENTREGUE),
+    ("won", STATUS_WON),
+    ("lost", STATUS_LOST),
+    ("canceladas", STATUS_CANCELADAS),
+)
+CATEGORIA_OUTRO = "outro"
+CATEGORIA_DTYPE = pd.CategoricalDtype(
+    [name for name, _ in STATUS_CATEGORIAS] + [CATEGORIA_OUTRO]
+)
+
+
+def build_status_lookup(extra=None):
+    """
+    Monta a tabela status (lowercase) -> categoria.
+
+    `extra` acrescenta status por categoria, ex.: {"won": ["Closed Won"]}.
+    Um status avulso ({"won": "Closed Won"}) vale como lista de um item.
+    """
+    extra = extra or {}
+    unknown = set(extra) - {name for name, _ in STATUS_CATEGORIAS}
+    if unknown:
+        logging.warning("Categorias de status desconhecidas ignoradas: %s", sorted(unknown))
+
+    lookup = {}
+    for name, statuses in STATUS_CATEGORIAS:
+        extras = extra.get(name) or []
+        if isinstance(extras, str):
+            extras = [extras]
+        for status in list(statuses) + list(extras):
+            lookup.setdefault(str(status).strip().lower(), name)
+    return lookup
+
+
+def load_status_lookup():
+    """Tabela padrão + status extras de STATUS_CATEGORIAS_EXTRA (JSON)."""
+    raw = os.environ.get("STATUS_CATEGORIAS_EXTRA", "").strip()
+    extra = None
+    if raw:
+        try:
+            extra = json.loads(raw)
+            if not isinstance(extra, dict):
+                raise ValueError("esperado objeto JSON {categoria: [status, ...]}")
+        except ValueError as e:
+            logging.warning("STATUS_CATEGORIAS_EXTRA inválido, ignorando: %s", e)
+            extra = None
+    return build_status_lookup(extra)
+
+
+STATUS_CATEGORIA_LOOKUP = load_status_lookup()
+
+
+def categorize_status_series(series):
+    """Categoriza uma coluna de status (já limpa) em CATEGORIA_DTYPE."""
+    codes, uniques = pd.factorize(series.astype(str).str.strip().str.lower())
+    categorias = [STATUS_CATEGORIA_LOOKUP.get(s, CATEGORIA_OUTRO) for s in uniques]
+    return pd.Series(
+        pd.Categorical(np.asarray(categorias, dtype=object)[codes], dtype=CATEGORIA_DTYPE),
+        index=series.index,
+    )
+
+
+# Janelas (dias) sempre calculadas para os blocos de resultados do card
+RESULT_WINDOWS_DEFAULT = (7, 15, 30)
+
+
+def parse_result_windows(raw):
+    """Janelas padrão + janelas extras pedidas no body (ex.: [7, 15, 30, 90])."""
+    janelas = set(RESULT_WINDOWS_DEFAULT)
+    for value in raw or []:
+        try:
+            dias = int(value)
+        except (TypeError, ValueError):
+            logging.warning("Janela de resultados inválida ignorada: %s", value)
+            continue
+        if dias > 0:
+            janelas.add(dias)
+    return sorted(janelas)
+
+
+def aggregate_result_windows(df, updated, windows, hoje, key_col=None):
+    """
+    Agrega as ofertas por (_categoria, janela) em uma única passada.
+
+    Uma oferta entra na janela de N dias quando `updated >= hoje - N dias`.
+    Retorna {(categoria, dias): {"linhas", "unicos", "valor", "margem_soma"}},
+    onde "unicos" conta valores distintos de key_col (ou linhas, sem key_col).
+    """
+    janelas = sorted(set(windows))
+    if not pd.api.types.is_datetime64_any_dtype(updated.dtype):
+        updated = pd.to_datetime(updated, errors="coerce")
+
+    # Cada linha vai para o "balde" da menor janela que a contém; as janelas
+    # maiores são obtidas pela soma acumulada dos baldes.
+    idade = (pd.Timestamp(hoje) - updated).to_numpy()
+    limites = pd.to_timedelta(janelas, unit="D").to_numpy()
+    balde = np.searchsorted(limites, idade, side="left")
+    balde[pd.isna(idade)] = len(janelas)
+    dentro = balde < len(janelas)
+
+    base = pd.DataFrame({
+        "categoria": df["_categoria"].to_numpy()[dentro],
+        "balde": balde[dentro],
+        "valor": df["_valor"].to_numpy()[dentro],
+        "margem": df["_margem"].to_numpy()[dentro] if "_margem" in df.columns else 0.0,
+    })
+    categorias = base["categoria"].astype(CATEGORIA_DTYPE)
+    grade = pd.MultiIndex.from_product(
+        [CATEGORIA_DTYPE.categories, range(len(janelas))], names=["categoria", "balde"]
+    )
+
+    agregado = (
+        base.assign(categoria=categorias)
+        .groupby(["categoria", "balde"], observed=True)
+        .agg(linhas=("valor", "size"), valor=("valor", "sum"), margem_soma=("margem", "sum"))
+        .reindex(grade, fill_value=0)
+    )
+    if key_col:
+        # Uma chave conta na janela da sua atualização mais recente
+        chaves = pd.DataFrame({
+            "categoria": categorias,
+            "chave": df[key_col].to_numpy()[dentro],
+            "balde": base["balde"],
+        })
+        primeiro_balde = chaves.groupby(["categoria", "chave"], observed=True)["balde"].min()
+        agregado["unicos"] = (
+            primeiro_balde.groupby(level="categoria", observed=True)
+            .value_counts()
+            .reindex(grade, fill_value=0)
+        )
+    else:
+        agregado["unicos"] = agregado["linhas"]
+
+    acumulado = agregado.groupby(level="categoria", observed=False).cumsum()
+    return {
+        (categoria, janelas[balde_idx]): row
+        for (categoria, balde_idx), row in zip(acumulado.index, acumulado.to_dict("records"))
+    }
+
+
+# =============================================================================
+# MERGE DE SNAPSHOT NO SERVIDOR - consolidar-v2 com estado persistido por chave
+# =============================================================================
+# O flow pode mandar só o que mudou ("modo": "incremental"); a Function junta
+# com o último snapshot guardado e recalcula o card sobre o conjunto completo.
+# Reduz o payload enviado pelo flow, não o processamento: cada chamada relê o
+# estado inteiro e refaz todas as métricas (sem "modo" não há custo extra).
+#
+# Ofertas ficam por JiraKey e atualizações pelo ID do item no SharePoint, cada
+# uma na sua tabela com o mesmo esquema (estado, chave, atualizado, dados).
+#
+# O estado é um SQLite local (CONSOLIDAR_STATE_PATH ou $HOME/data). No Azure,
+# $HOME é um compartilhamento SMB sem lock confiável entre instâncias: use o
+# merge só com a Function limitada a uma instância
+# (WEBSITE_MAX_DYNAMIC_APPLICATION_SCALE_OUT=1) ou aponte CONSOLIDAR_STATE_PATH
+# para um disco que não seja compartilhado.
+
+CONSOLIDAR_STATE_MODES = ("snapshot", "incremental")
+# tabela -> (campo do body, campo de remoções, campos de chave, campos de data)
+CONSOLIDAR_STATE_TABLES = {
+    "ofertas": ("ofertas", "removidas", ("JiraKey", "Key", "Title"), ("JiraUpdated", "Updated", "ModifiedDate")),
+    "atualizacoes": ("atualizacoes", "atualizacoes_removidas", ("ID", "Id", "Title"), ("Modified", "Modificado")),
+}
+_CONSOLIDAR_STATE_LOCK = threading.Lock()
+
+
+def get_data_file_path(env_name, filename):
+    """Arquivo local de dados: env_name, ou $HOME/data no Azure (storage persistente)."""
+    path = os.environ.get(env_name)
+    if path:
+        return path
+    base = os.environ.get("HOME") if os.environ.get("WEBSITE_INSTANCE_ID") else None
+    return os.path.join(base or tempfile.gettempdir(), "data", filename)
+
+
+def get_consolidar_state_path():
+    return get_data_file_path("CONSOLIDAR_STATE_PATH", "consolidar_state.sqlite")
+
+
+def _open_consolidar_state(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    for table in CONSOLIDAR_STATE_TABLES:
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                estado TEXT NOT NULL,
+                chave TEXT NOT NULL,
+                atualizado TEXT,
+                dados TEXT NOT NULL,
+                PRIMARY KEY (estado, chave)
+            )
+            """
+        )
+    return conn
+
+
+def _consolidar_state_key(record, key_fields):
+    for field in key_fields:
+        value = extract_choice_value(record.get(field))
+        if not is_null_like(value):
+            return str(value)
+    return None
+
+
+def _consolidar_state_updated(record, updated_fields):
+    for field in updated_fields:
+        if field in record:
+            dt = parse_date_safe(record[field])
+            return dt.isoformat() if dt else None
+    return None
+
+
+def _consolidar_state_rows(body, table, estado_id, modo):
+    """Valida a parte do body de uma tabela; devolve (linhas para upsert, chaves removidas)."""
+    campo, campo_removidas, key_fields, updated_fields = CONSOLIDAR_STATE_TABLES[table]
+    records = body.get(campo) or []
+    removidas = body.get(campo_removidas) or []
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError(f"{campo} deve ser uma lista de objetos")
+    if not isinstance(removidas, list):
+        raise ValueError(f"{campo_removidas} deve ser uma lista de chaves ({key_fields[0]})")
+
+    rows = []
+    for record in records:
+        chave = _consolidar_state_key(record, key_fields)
+        if chave is None:
+            raise ValueError(f"Item de {campo} sem {key_fields[0]} não pode ser usado no modo {modo}")
+        rows.append((estado_id, chave, _consolidar_state_updated(record, updated_fields), json.dumps(record, ensure_ascii=False)))
+    return rows, [str(k) for k in removidas if not is_null_like(k)]
+
+
+def merge_consolidar_snapshot(body):
+    """
+    Junta o body ao snapshot persistido e devolve (ofertas, atualizacoes, info)
+    completas, como se o flow tivesse mandado a carga inteira.
+
+    - modo "snapshot": substitui o estado pelas ofertas e atualizações recebidas;
+    - modo "incremental": upsert dos itens alterados desde o watermark e
+      remoção das chaves listadas em "removidas" / "atualizacoes_removidas".
+
+    Itens repetidos com a mesma chave ficam só com a última versão recebida.
+    Body inválido levanta ValueError (a rota responde 400).
+    """
+    modo = str(body.get("modo") or "").strip().lower()
+    if modo not in CONSOLIDAR_STATE_MODES:
+        raise ValueError(f"modo inválido: {modo!r} (use {', '.join(CONSOLIDAR_STATE_MODES)})")
+    estado_id = str(body.get("estado_id") or "default")
+    alteracoes = {table: _consolidar_state_rows(body, table, estado_id, modo) for table in CONSOLIDAR_STATE_TABLES}
+
+    itens = {}
+    watermarks = {}
+    with _CONSOLIDAR_STATE_LOCK:
+        conn = _open_consolidar_state(get_consolidar_state_path())
+        try:
+            with conn:
+                for table, (rows, removidas) in alteracoes.items():
+                    if modo == "snapshot":
+                        conn.execute(f"DELETE FROM {table} WHERE estado = ?", (estado_id,))
+                    conn.executemany(
+                        f"""
+                        INSERT INTO {table} (estado, chave, atualizado, dados) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (estado, chave)
+                        DO UPDATE SET atualizado = excluded.atualizado, dados = excluded.dados
+                        """,
+                        rows,
+                    )
+                    conn.executemany(
+                        f"DELETE FROM {table} WHERE estado = ? AND chave = ?",
+                        [(estado_id, chave) for chave in removidas],
+                    )
+            for table in CONSOLIDAR_STATE_TABLES:
+                itens[table] = [
+                    json.loads(dados)
+                    for (dados,) in conn.execute(
+                        f"SELECT dados FROM {table} WHERE estado = ? ORDER BY rowid", (estado_id,)
+                    )
+                ]
+                (watermarks[table],) = conn.execute(
+                    f"SELECT MAX(atualizado) FROM {table} WHERE estado = ?", (estado_id,)
+                ).fetchone()
+        finally:
+            conn.close()
+
+    info = {
+        "modo": modo,
+        "estado_id": estado_id,
+        "ofertas_recebidas": len(alteracoes["ofertas"][0]),
+        "removidas": len(alteracoes["ofertas"][1]),
+        "ofertas_no_estado": len(itens["ofertas"]),
+        "watermark": watermarks["ofertas"],
+        "atualizacoes_recebidas": len(alteracoes["atualizacoes"][0]),
+        "atualizacoes_removidas": len(alteracoes["atualizacoes"][1]),
+        "atualizacoes_no_estado": len(itens["atualizacoes"]),
+        "watermark_atualizacoes": watermarks["atualizacoes"],
+    }
+    logging.info("Snapshot do consolidar-v2 atualizado: %s", info)
+    return itens["ofertas"], itens["atualizacoes"], info
+
 
 @app.route(route="consolidar-v2", auth_level=func.AuthLevel.FUNCTION)
 def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
@@ -491,10 +1137,21 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
     - Entregas da semana (últimos 7 dias) com range de datas
     - Agenda próxima semana (próximos 7 dias) com range de datas
     - Resultados 7 e 30 dias (Won/Lost) com margens
+      (janelas extras via body: "janelas_resultados": [90] -> resultados_90_dias)
     - Top 5 mercados e arquitetos (por valor e quantidade)
     - Top 5 ofertas com maiores/menores margens
     - Lista de arquitetos pendentes
     - Card HTML formatado para Teams
+    
+    Merge de snapshot no servidor (opcional): "modo": "snapshot" grava a carga
+    completa (ofertas e atualizações); "modo": "incremental" envia só os itens
+    alterados desde o watermark + "removidas": [JiraKey, ...] e
+    "atualizacoes_removidas": [ID, ...]. O card é recalculado sobre o estado
+    completo (reduz o payload, não o processamento; SQLite local: só para
+    execução em uma única instância). Body inválido nesses modos -> 400.
+    
+    Sem "modo", bodies idênticos no mesmo dia reutilizam o resultado em cache
+    (header X-Cache-Bypass: true força o recálculo).
     """
     logging.info("Iniciando consolidação V2 C-Level...")
     
@@ -505,6 +1162,28 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
         ofertas = req_body.get("ofertas", [])
         atualizacoes = req_body.get("atualizacoes", [])
         
+        # O merge de snapshot altera o estado, então nunca é servido do cache
+        cache_key = None
+        if not req_body.get("modo"):
+            cache_key = result_cache_key("consolidar-v2", req_body, datetime.now())
+            cached = None if result_cache_bypass(req) else result_cache_get(cache_key)
+            if cached is not None:
+                logging.info("Consolidação V2 servida do cache (%s)", cache_key[:12])
+                return func.HttpResponse(
+                    cached, status_code=200, mimetype="application/json", headers={"X-Cache": "HIT"}
+                )
+        
+        estado_incremental = None
+        if req_body.get("modo"):
+            try:
+                ofertas, atualizacoes, estado_incremental = merge_consolidar_snapshot(req_body)
+            except ValueError as e:
+                return func.HttpResponse(
+                    json.dumps({"error": str(e), "success": False}, ensure_ascii=False),
+                    status_code=400,
+                    mimetype="application/json",
+                )
+        
         df_ofertas = pd.DataFrame(ofertas) if ofertas else pd.DataFrame()
         df_atualizacoes = pd.DataFrame(atualizacoes) if atualizacoes else pd.DataFrame()
         df_ofertas = normalize_frame(df_ofertas)
@@ -534,13 +1213,15 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
             "status": "sem_dados",
             "total_ofertas_recebidas": 0,
         }
+        if estado_incremental:
+            resultado_base["estado_incremental"] = estado_incremental
         
         if df_ofertas.empty:
             resultado_base["mensagem"] = "Nenhuma oferta recebida"
             # Merge with defaults to ensure all card tokens are present
             resultado_completo = merge_with_defaults(resultado_base)
             return func.HttpResponse(
-                json.dumps(to_native_obj(resultado_completo), ensure_ascii=False),
+                json.dumps(resultado_completo, ensure_ascii=False),
                 status_code=200,
                 mimetype="application/json",
             )
@@ -574,76 +1255,76 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
         
         # Parse de valores e datas
         if valor_col:
-            df_ofertas["_valor"] = df_ofertas[valor_col].apply(parse_number)
+            df_ofertas["_valor"] = parse_number_series(df_ofertas[valor_col])
         else:
             df_ofertas["_valor"] = 0.0
             
         if prazo_col:
-            df_ofertas["_prazo"] = df_ofertas[prazo_col].apply(parse_date_safe)
+            df_ofertas["_prazo"] = parse_date_series(df_ofertas[prazo_col])
         else:
             df_ofertas["_prazo"] = None
             
         if updated_col:
-            df_ofertas["_updated"] = df_ofertas[updated_col].apply(parse_date_safe)
+            df_ofertas["_updated"] = parse_date_series(df_ofertas[updated_col])
         else:
             df_ofertas["_updated"] = None
         
         # Parse margem - já vem como percentual (0-100)
         if margem_col:
-            df_ofertas["_margem"] = df_ofertas[margem_col].apply(lambda x: parse_number(x, default=0.0))
+            df_ofertas["_margem"] = parse_number_series(df_ofertas[margem_col], default=0.0)
         else:
             df_ofertas["_margem"] = 0.0
         
         # Parse datas para tempo de ciclo
         if data_recebimento_col:
-            df_ofertas["_data_recebimento"] = df_ofertas[data_recebimento_col].apply(parse_date_safe)
+            df_ofertas["_data_recebimento"] = parse_date_series(df_ofertas[data_recebimento_col])
         else:
             df_ofertas["_data_recebimento"] = None
             
         if data_entrega_col:
-            df_ofertas["_data_entrega"] = df_ofertas[data_entrega_col].apply(parse_date_safe)
+            df_ofertas["_data_entrega"] = parse_date_series(df_ofertas[data_entrega_col])
         else:
             df_ofertas["_data_entrega"] = None
         
         # Parse Budget de Horas
         if budget_col:
-            df_ofertas["_budget_horas"] = df_ofertas[budget_col].apply(lambda x: parse_number(x, default=0.0))
+            df_ofertas["_budget_horas"] = parse_number_series(df_ofertas[budget_col], default=0.0)
         else:
             df_ofertas["_budget_horas"] = 0.0
             
         if horas_consumidas_col:
-            df_ofertas["_horas_consumidas"] = df_ofertas[horas_consumidas_col].apply(lambda x: parse_number(x, default=0.0))
+            df_ofertas["_horas_consumidas"] = parse_number_series(df_ofertas[horas_consumidas_col], default=0.0)
         else:
             df_ofertas["_horas_consumidas"] = 0.0
         
         # Parse percentuais de Práticas
         if pct_ds_col:
-            df_ofertas["_pct_ds"] = df_ofertas[pct_ds_col].apply(lambda x: parse_number(x, default=0.0))
+            df_ofertas["_pct_ds"] = parse_number_series(df_ofertas[pct_ds_col], default=0.0)
         else:
             df_ofertas["_pct_ds"] = 0.0
             
         if pct_dic_col:
-            df_ofertas["_pct_dic"] = df_ofertas[pct_dic_col].apply(lambda x: parse_number(x, default=0.0))
+            df_ofertas["_pct_dic"] = parse_number_series(df_ofertas[pct_dic_col], default=0.0)
         else:
             df_ofertas["_pct_dic"] = 0.0
             
         if pct_dados_col:
-            df_ofertas["_pct_dados"] = df_ofertas[pct_dados_col].apply(lambda x: parse_number(x, default=0.0))
+            df_ofertas["_pct_dados"] = parse_number_series(df_ofertas[pct_dados_col], default=0.0)
         else:
             df_ofertas["_pct_dados"] = 0.0
             
         if pct_cyber_col:
-            df_ofertas["_pct_cyber"] = df_ofertas[pct_cyber_col].apply(lambda x: parse_number(x, default=0.0))
+            df_ofertas["_pct_cyber"] = parse_number_series(df_ofertas[pct_cyber_col], default=0.0)
         else:
             df_ofertas["_pct_cyber"] = 0.0
             
         if pct_sge_col:
-            df_ofertas["_pct_sge"] = df_ofertas[pct_sge_col].apply(lambda x: parse_number(x, default=0.0))
+            df_ofertas["_pct_sge"] = parse_number_series(df_ofertas[pct_sge_col], default=0.0)
         else:
             df_ofertas["_pct_sge"] = 0.0
             
         if pct_outros_col:
-            df_ofertas["_pct_outros"] = df_ofertas[pct_outros_col].apply(lambda x: parse_number(x, default=0.0))
+            df_ofertas["_pct_outros"] = parse_number_series(df_ofertas[pct_outros_col], default=0.0)
         else:
             df_ofertas["_pct_outros"] = 0.0
         
@@ -668,21 +1349,7 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
             df_ofertas["_status_clean"] = ""
         
         # ===== CATEGORIZAR OFERTAS =====
-        def categorize(status):
-            s = str(status).strip().lower() if status else ""
-            if any(st.lower() == s for st in STATUS_EM_DESENVOLVIMENTO):
-                return "desenvolvimento"
-            elif any(st.lower() == s for st in STATUS_ENTREGUE):
-                return "entregue"
-            elif any(st.lower() == s for st in STATUS_WON):
-                return "won"
-            elif any(st.lower() == s for st in STATUS_LOST):
-                return "lost"
-            elif any(st.lower() == s for st in STATUS_CANCELADAS):
-                return "canceladas"
-            return "outro"
-        
-        df_ofertas["_categoria"] = df_ofertas["_status_clean"].apply(categorize)
+        df_ofertas["_categoria"] = categorize_status_series(df_ofertas["_status_clean"])
         
         # ===== 1. PIPELINE ATIVO (Em Desenvolvimento) =====
         df_dev = df_ofertas[df_ofertas["_categoria"] == "desenvolvimento"]
@@ -730,15 +1397,13 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
         # Criar lista detalhada das ofertas da próxima semana
         lista_ofertas_proxima = []
         if len(df_proxima) > 0 and jirakey_col:
-            for _, row in df_proxima.iterrows():
-                oferta_info = {
-                    "jira_key": str(row[jirakey_col]) if jirakey_col else "N/A",
-                    "arquiteto": str(row[assignee_col]) if assignee_col and assignee_col in row else "N/A",
-                    "prazo": row["_prazo"].strftime("%d/%m") if row["_prazo"] else "N/A",
-                    "valor": float(row["_valor"]) if row["_valor"] else 0.0,
-                    "valor_formatado": format_brl(row["_valor"])
-                }
-                lista_ofertas_proxima.append(oferta_info)
+            lista_ofertas_proxima = frame_to_records(df_proxima, [
+                ("jira_key", jirakey_col, "str"),
+                ("arquiteto", assignee_col, "str"),
+                ("prazo", "_prazo", "dia_mes"),
+                ("valor", "_valor", "float"),
+                ("valor_formatado", "_valor", "brl"),
+            ], n=20)  # Limitar a 20 ofertas
         
         agenda_proxima_semana = {
             "quantidade": len(df_proxima),
@@ -747,152 +1412,119 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
             "urgentes": len(df_urgentes),
             "lista_urgentes": lista_urgentes,
             "range_datas": range_proxima_semana,
-            "lista_ofertas": lista_ofertas_proxima[:20]  # Limitar a 20 ofertas
+            "lista_ofertas": lista_ofertas_proxima
         }
         
-        # ===== 4. RESULTADOS 7 DIAS =====
-        df_won_7d = df_ofertas[
-            (df_ofertas["_categoria"] == "won") &
-            (df_ofertas["_updated"].apply(lambda x: x is not None and x >= ha_7_dias))
-        ] if updated_col else pd.DataFrame()
+        # ===== 4. RESULTADOS POR JANELA (7/15/30 dias + janelas extras) =====
+        janelas = parse_result_windows(req_body.get("janelas_resultados"))
+        if updated_col:
+            resultados_janela = aggregate_result_windows(
+                df_ofertas, df_ofertas["_updated"], janelas, hoje, jirakey_col
+            )
+        else:
+            # Sem data de atualização, só o bloco de 30 dias considera todas as ofertas
+            resultados_janela = aggregate_result_windows(
+                df_ofertas, pd.Series(hoje, index=df_ofertas.index), [30], hoje, jirakey_col
+            )
+        janela_vazia = {"linhas": 0, "unicos": 0, "valor": 0.0, "margem_soma": 0.0}
+        
+        def janela(categoria, dias):
+            return resultados_janela.get((categoria, dias), janela_vazia)
+        
+        def range_janela(dias):
+            return f"{(hoje - timedelta(days=dias)).strftime('%d/%m')} a {hoje.strftime('%d/%m/%Y')}"
+        
+        def win_rate_janela(dias):
+            # Win Rate usando JiraKey único para evitar duplicatas
+            total_fechadas = janela("won", dias)["unicos"] + janela("lost", dias)["unicos"]
+            if total_fechadas == 0:
+                return 0.0
+            return round((janela("won", dias)["unicos"] / total_fechadas) * 100, 1)
         
-        df_lost_7d = df_ofertas[
-            (df_ofertas["_categoria"] == "lost") &
-            (df_ofertas["_updated"].apply(lambda x: x is not None and x >= ha_7_dias))
-        ] if updated_col else pd.DataFrame()
+        def margem_media_janela(categoria, dias):
+            # Margem já vem como percentual 0-100
+            dados = janela(categoria, dias)
+            if dados["linhas"] == 0 or not margem_col:
+                return 0.0
+            return round(dados["margem_soma"] / dados["linhas"], 1)
+        
+        def resumo_janela(categoria, dias, quantidade="unicos", margem=False):
+            dados = janela(categoria, dias)
+            resumo = {
+                "quantidade": int(dados[quantidade]),
+                "valor": float(dados["valor"]),
+                "valor_formatado": format_brl(dados["valor"])
+            }
+            if margem:
+                margem_media = margem_media_janela(categoria, dias)
+                resumo["margem_media"] = margem_media
+                resumo["margem_media_fmt"] = f"{margem_media}%"
+            return resumo
         
         resultados_7_dias = {
-            "won": {
-                "quantidade": len(df_won_7d),
-                "valor": float(df_won_7d["_valor"].sum()) if len(df_won_7d) > 0 else 0.0,
-                "valor_formatado": format_brl(df_won_7d["_valor"].sum() if len(df_won_7d) > 0 else 0)
-            },
-            "lost": {
-                "quantidade": len(df_lost_7d),
-                "valor": float(df_lost_7d["_valor"].sum()) if len(df_lost_7d) > 0 else 0.0,
-                "valor_formatado": format_brl(df_lost_7d["_valor"].sum() if len(df_lost_7d) > 0 else 0)
-            },
+            "won": resumo_janela("won", 7, quantidade="linhas"),
+            "lost": resumo_janela("lost", 7, quantidade="linhas"),
             "periodo": "últimos 7 dias",
             "range_datas": range_7_dias
         }
         
-        # ===== 4B. RESULTADOS 15 DIAS =====
-        df_won_15d = df_ofertas[
-            (df_ofertas["_categoria"] == "won") &
-            (df_ofertas["_updated"].apply(lambda x: x is not None and x >= ha_15_dias))
-        ] if updated_col else pd.DataFrame()
-        
-        df_lost_15d = df_ofertas[
-            (df_ofertas["_categoria"] == "lost") &
-            (df_ofertas["_updated"].apply(lambda x: x is not None and x >= ha_15_dias))
-        ] if updated_col else pd.DataFrame()
-        
-        # Win Rate 15 dias usando JiraKey único para evitar duplicatas
-        if jirakey_col:
-            won_unique_15d = df_won_15d[jirakey_col].nunique() if len(df_won_15d) > 0 else 0
-            lost_unique_15d = df_lost_15d[jirakey_col].nunique() if len(df_lost_15d) > 0 else 0
-        else:
-            won_unique_15d = len(df_won_15d)
-            lost_unique_15d = len(df_lost_15d)
-        
-        total_fechadas_15d = won_unique_15d + lost_unique_15d
-        win_rate_15d = round((won_unique_15d / total_fechadas_15d) * 100, 1) if total_fechadas_15d > 0 else 0.0
-        
+        win_rate_15d = win_rate_janela(15)
         resultados_15_dias = {
-            "won": {
-                "quantidade": won_unique_15d,
-                "valor": float(df_won_15d["_valor"].sum()) if len(df_won_15d) > 0 else 0.0,
-                "valor_formatado": format_brl(df_won_15d["_valor"].sum() if len(df_won_15d) > 0 else 0)
-            },
-            "lost": {
-                "quantidade": lost_unique_15d,
-                "valor": float(df_lost_15d["_valor"].sum()) if len(df_lost_15d) > 0 else 0.0,
-                "valor_formatado": format_brl(df_lost_15d["_valor"].sum() if len(df_lost_15d) > 0 else 0)
-            },
+            "won": resumo_janela("won", 15),
+            "lost": resumo_janela("lost", 15),
             "win_rate": win_rate_15d,
             "win_rate_fmt": f"{win_rate_15d}%",
             "periodo": "últimos 15 dias",
             "range_datas": range_15_dias
         }
         
-        # ===== 5. RESULTADOS 30 DIAS COM MARGENS =====
-        df_won_30d = df_ofertas[
-            (df_ofertas["_categoria"] == "won") &
-            (df_ofertas["_updated"].apply(lambda x: x is not None and x >= ha_30_dias))
-        ] if updated_col else df_ofertas[df_ofertas["_categoria"] == "won"]
-        
-        df_lost_30d = df_ofertas[
-            (df_ofertas["_categoria"] == "lost") &
-            (df_ofertas["_updated"].apply(lambda x: x is not None and x >= ha_30_dias))
-        ] if updated_col else df_ofertas[df_ofertas["_categoria"] == "lost"]
-        
-        # Win Rate 30 dias usando JiraKey único para evitar duplicatas
-        if jirakey_col:
-            won_unique_30d = df_won_30d[jirakey_col].nunique() if len(df_won_30d) > 0 else 0
-            lost_unique_30d = df_lost_30d[jirakey_col].nunique() if len(df_lost_30d) > 0 else 0
-        else:
-            won_unique_30d = len(df_won_30d)
-            lost_unique_30d = len(df_lost_30d)
-        
-        total_fechadas_30d = won_unique_30d + lost_unique_30d
-        win_rate_30d = round((won_unique_30d / total_fechadas_30d) * 100, 1) if total_fechadas_30d > 0 else 0.0
-        
-        # Calcular margens médias (margem já vem como percentual 0-100)
-        margem_media_won = round(df_won_30d["_margem"].mean(), 1) if len(df_won_30d) > 0 and margem_col else 0.0
-        margem_media_lost = round(df_lost_30d["_margem"].mean(), 1) if len(df_lost_30d) > 0 and margem_col else 0.0
-        
+        win_rate_30d = win_rate_janela(30)
         resultados_30_dias = {
-            "won": {
-                "quantidade": len(df_won_30d),
-                "valor": float(df_won_30d["_valor"].sum()) if len(df_won_30d) > 0 else 0.0,
-                "valor_formatado": format_brl(df_won_30d["_valor"].sum() if len(df_won_30d) > 0 else 0),
-                "margem_media": margem_media_won,
-                "margem_media_fmt": f"{margem_media_won}%"
-            },
-            "lost": {
-                "quantidade": lost_unique_30d,
-                "valor": float(df_lost_30d["_valor"].sum()) if len(df_lost_30d) > 0 else 0.0,
-                "valor_formatado": format_brl(df_lost_30d["_valor"].sum() if len(df_lost_30d) > 0 else 0),
-                "margem_media": margem_media_lost,
-                "margem_media_fmt": f"{margem_media_lost}%"
-            },
+            "won": resumo_janela("won", 30, quantidade="linhas", margem=True),
+            "lost": resumo_janela("lost", 30, margem=True),
             "win_rate": win_rate_30d,
             "win_rate_fmt": f"{win_rate_30d}%",
             "periodo": "últimos 30 dias",
             "range_datas": range_30_dias
         }
         
+        # Janelas extras pedidas no body (ex.: 90 dias) -> resultados_<N>_dias
+        resultados_extras = {}
+        for dias in janelas:
+            if dias in RESULT_WINDOWS_DEFAULT:
+                continue
+            win_rate = win_rate_janela(dias)
+            resultados_extras[f"resultados_{dias}_dias"] = {
+                "won": resumo_janela("won", dias, margem=True),
+                "lost": resumo_janela("lost", dias, margem=True),
+                "win_rate": win_rate,
+                "win_rate_fmt": f"{win_rate}%",
+                "periodo": f"últimos {dias} dias",
+                "range_datas": range_janela(dias)
+            }
+        
         # ===== 5B. TOP 5 OFERTAS COM MAIORES/MENORES MARGENS =====
         top_margens_altas = []
         top_margens_baixas = []
         if margem_col and jirakey_col:
             df_com_margem = df_ofertas[df_ofertas["_margem"] > 0].copy()
             if len(df_com_margem) > 0:
+                df_com_margem["_margem_pct"] = df_com_margem["_margem"] * 100
+                campos_margem = [
+                    ("oferta", jirakey_col, "str"),
+                    ("margem", "_margem_pct", "round1"),
+                    ("margem_fmt", "_margem_pct", "pct1"),
+                    ("valor", "_valor", "float"),
+                    ("valor_formatado", "_valor", "brl"),
+                ]
+                
                 # Top 5 maiores margens
                 df_top_alta = df_com_margem.nlargest(5, "_margem")
-                top_margens_altas = [
-                    {
-                        "oferta": str(row[jirakey_col]) if jirakey_col else "N/A",
-                        "margem": round(row["_margem"] * 100, 1),
-                        "margem_fmt": f"{round(row['_margem'] * 100, 1)}%",
-                        "valor": float(row["_valor"]),
-                        "valor_formatado": format_brl(row["_valor"])
-                    }
-                    for _, row in df_top_alta.iterrows()
-                ]
+                top_margens_altas = frame_to_records(df_top_alta, campos_margem)
                 
                 # Top 5 menores margens (que ainda são positivas)
                 df_top_baixa = df_com_margem.nsmallest(5, "_margem")
-                top_margens_baixas = [
-                    {
-                        "oferta": str(row[jirakey_col]) if jirakey_col else "N/A",
-                        "margem": round(row["_margem"] * 100, 1),
-                        "margem_fmt": f"{round(row['_margem'] * 100, 1)}%",
-                        "valor": float(row["_valor"]),
-                        "valor_formatado": format_brl(row["_valor"])
-                    }
-                    for _, row in df_top_baixa.iterrows()
-                ]
+                top_margens_baixas = frame_to_records(df_top_baixa, campos_margem)
         
         # ===== 6. TOP 5 MERCADOS =====
         top_mercados = []
@@ -902,15 +1534,12 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
                 valor=("_valor", "sum")
             ).reset_index().sort_values("valor", ascending=False).head(5)
             
-            top_mercados = [
-                {
-                    "mercado": str(row[mercado_col]),
-                    "quantidade": int(row["quantidade"]),
-                    "valor": float(row["valor"]),
-                    "valor_formatado": format_brl(row["valor"])
-                }
-                for _, row in mercado_agg.iterrows()
-            ]
+            top_mercados = frame_to_records(mercado_agg, [
+                ("mercado", mercado_col, "str"),
+                ("quantidade", "quantidade", "int"),
+                ("valor", "valor", "float"),
+                ("valor_formatado", "valor", "brl"),
+            ])
         
         # ===== 7. TOP 5 ARQUITETOS POR VALOR =====
         top_arquitetos_valor = []
@@ -920,15 +1549,12 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
                 valor=("_valor", "sum")
             ).reset_index().sort_values("valor", ascending=False).head(5)
             
-            top_arquitetos_valor = [
-                {
-                    "arquiteto": str(row[assignee_col]),
-                    "quantidade": int(row["quantidade"]),
-                    "valor": float(row["valor"]),
-                    "valor_formatado": format_brl(row["valor"])
-                }
-                for _, row in arq_valor_agg.iterrows()
-            ]
+            top_arquitetos_valor = frame_to_records(arq_valor_agg, [
+                ("arquiteto", assignee_col, "str"),
+                ("quantidade", "quantidade", "int"),
+                ("valor", "valor", "float"),
+                ("valor_formatado", "valor", "brl"),
+            ])
         
         # ===== 8. TOP 5 ARQUITETOS POR QUANTIDADE (carga de trabalho) =====
         top_arquitetos_quantidade = []
@@ -939,15 +1565,12 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
                 valor_total=("_valor", "sum")
             ).reset_index().sort_values("ofertas_ativas", ascending=False).head(5)
             
-            top_arquitetos_quantidade = [
-                {
-                    "arquiteto": str(row[assignee_col]),
-                    "ofertas_ativas": int(row["ofertas_ativas"]),
-                    "valor_total": float(row["valor_total"]),
-                    "valor_formatado": format_brl(row["valor_total"])
-                }
-                for _, row in arq_qtd_agg.iterrows()
-            ]
+            top_arquitetos_quantidade = frame_to_records(arq_qtd_agg, [
+                ("arquiteto", assignee_col, "str"),
+                ("ofertas_ativas", "ofertas_ativas", "int"),
+                ("valor_total", "valor_total", "float"),
+                ("valor_formatado", "valor_total", "brl"),
+            ])
         
         # ===== 8B. TEMPO MÉDIO POR ARQUITETO (dias de ciclo) =====
         tempo_arquitetos = []
@@ -972,32 +1595,21 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
                 ).reset_index()
                 
                 arq_tempo_agg["media_dias"] = arq_tempo_agg["media_dias"].round(1)
+                campos_ciclo = [
+                    ("arquiteto", assignee_col, "str"),
+                    ("media_dias", "media_dias", "float"),
+                    ("ofertas_analisadas", "quantidade_ofertas", "int"),
+                    ("min_dias", "min_dias", "int"),
+                    ("max_dias", "max_dias", "int"),
+                ]
                 
                 # Top 5 mais rápidos (menor média)
                 df_rapidos = arq_tempo_agg.nsmallest(5, "media_dias")
-                top_arquitetos_rapidos = [
-                    {
-                        "arquiteto": str(row[assignee_col]),
-                        "media_dias": float(row["media_dias"]),
-                        "ofertas_analisadas": int(row["quantidade_ofertas"]),
-                        "min_dias": int(row["min_dias"]),
-                        "max_dias": int(row["max_dias"])
-                    }
-                    for _, row in df_rapidos.iterrows()
-                ]
+                top_arquitetos_rapidos = frame_to_records(df_rapidos, campos_ciclo)
                 
                 # Top 5 mais lentos (maior média)
                 df_lentos = arq_tempo_agg.nlargest(5, "media_dias")
-                top_arquitetos_lentos = [
-                    {
-                        "arquiteto": str(row[assignee_col]),
-                        "media_dias": float(row["media_dias"]),
-                        "ofertas_analisadas": int(row["quantidade_ofertas"]),
-                        "min_dias": int(row["min_dias"]),
-                        "max_dias": int(row["max_dias"])
-                    }
-                    for _, row in df_lentos.iterrows()
-                ]
+                top_arquitetos_lentos = frame_to_records(df_lentos, campos_ciclo)
         
         tempo_ciclo_metricas = {
             "media_geral_dias": media_geral_ciclo,
@@ -1046,17 +1658,14 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
                 axis=1
             )
             df_risco = df_ofertas[df_ofertas["_taxa_utilizacao"] > 80].nlargest(10, "_taxa_utilizacao")
-            ofertas_em_risco = [
-                {
-                    "oferta": str(row[jirakey_col]) if jirakey_col else "N/A",
-                    "arquiteto": str(row[assignee_col]) if assignee_col else "N/A",
-                    "horas_alocadas": float(row["_budget_horas"]),
-                    "horas_consumidas": float(row["_horas_consumidas"]),
-                    "taxa": round(row["_taxa_utilizacao"], 1),
-                    "taxa_fmt": f"{round(row['_taxa_utilizacao'], 1)}%"
-                }
-                for _, row in df_risco.iterrows()
-            ]
+            ofertas_em_risco = frame_to_records(df_risco, [
+                ("oferta", jirakey_col, "str"),
+                ("arquiteto", assignee_col, "str"),
+                ("horas_alocadas", "_budget_horas", "float"),
+                ("horas_consumidas", "_horas_consumidas", "float"),
+                ("taxa", "_taxa_utilizacao", "round1"),
+                ("taxa_fmt", "_taxa_utilizacao", "pct1"),
+            ])
         
         budget_metricas = {
             "total_horas_alocadas": total_horas_alocadas,
@@ -1324,6 +1933,7 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
             "resultados_7_dias": resultados_7_dias,
             "resultados_15_dias": resultados_15_dias,
             "resultados_30_dias": resultados_30_dias,
+            **resultados_extras,
             
             "top_mercados": top_mercados,
             "top_arquitetos_valor": top_arquitetos_valor,
@@ -1340,16 +1950,23 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
             
             "teams_card_html": teams_card_html
         }
+        if estado_incremental:
+            resultado["estado_incremental"] = estado_incremental
         
         # Merge with defaults to ensure all adaptive card tokens are present
         resultado_completo = merge_with_defaults(resultado)
         
         logging.info("Consolidação V2 concluída: %s ofertas processadas", len(df_ofertas))
         
+        # Médias e agregados do pandas ainda chegam como escalares numpy
+        corpo = json.dumps(to_native_obj(resultado_completo), ensure_ascii=False)
+        if cache_key:
+            result_cache_put(cache_key, corpo)
         return func.HttpResponse(
-            json.dumps(to_native_obj(resultado_completo), ensure_ascii=False),
+            corpo,
             status_code=200,
             mimetype="application/json",
+            headers={"X-Cache": "MISS"},
         )
         
     except Exception as e:
@@ -1424,545 +2041,838 @@ def consolidar_pipeline_v2(req: func.HttpRequest) -> func.HttpResponse:
 
 
 
-@app.route(route="import-jira", auth_level=func.AuthLevel.FUNCTION)
-def import_jira(req: func.HttpRequest) -> func.HttpResponse:
-    """
-    Transforma dados JIRA (CSV) para formato SharePoint.
-    Recebe: csv_content (CSV bruto) OU ofertas (JSON array)
-    Retorna: Lista formatada para UPSERT no SharePoint
-    """
-    logging.info("Iniciando importação JIRA...")
+# =============================================================================
+# IMPORT JIRA - transformação JIRA -> SharePoint (DataFrame inteiro ou por chunk)
+# =============================================================================
 
-    try:
-        req_body = req.get_json()
-        csv_content = req_body.get("csv_content", None)
-        ofertas_jira = req_body.get("ofertas", [])
-        arquivo_nome = req_body.get("arquivo", "unknown.csv")
+# Mapeamento de colunas JIRA -> SharePoint
+JIRA_COLUMN_MAPPING = {
+    "Issue key": "JiraKey",
+    "Issue id": "JiraId",
+    "Assignee": "Assignee",
+    "Status": "Status",
+    "Summary": "Titulo",
+    "Component/s": "Cliente",
+    "Custom field (Market)": "Mercado",
+    "Custom field (Type of Service)": "TipoServico",
+    "Custom field (Total Amount (euros))": "ValorEUR",
+    "Custom field (Budg.Loc.Currency)": "ValorBRL",
+    "Custom field (Margin)": "Margem",
+    "Custom field (Country)": "Country",
+    "Custom field (DN Manager)": "DNManager",
+    "Custom field (Market Manager)": "MarketManager",
+    "Custom field (Operations Manager)": "OperationsManager",
+    "Created": "JiraCreated",
+    "Updated": "JiraUpdated",
+    "Custom field (Proposal Due Date)": "PrazoProposta",
+    "Custom field (Observations)": "Observacoes",
+    "Custom field (Type Business Opportunity)": "TipoOportunidade",
+    "Custom field (Renewal)": "Renewal",
+    "Custom field (Temporal Scope)": "TemporalScope",
+    "Custom field (Código GEP)": "CodigoGEP",
+}
+
+# Usada como ValorEUR quando o export só traz o valor ponderado
+JIRA_WEIGHTED_VALUE_COLUMN = "Custom field (Total amount (€) weighted)"
+JIRA_USECOLS = set(JIRA_COLUMN_MAPPING) | {JIRA_WEIGHTED_VALUE_COLUMN}
+
+# Colunas numéricas do export; as demais são lidas como texto no modo em chunks
+JIRA_NUMERIC_COLUMNS = {
+    "Custom field (Total Amount (euros))",
+    "Custom field (Budg.Loc.Currency)",
+    "Custom field (Margin)",
+    "Custom field (Temporal Scope)",
+    JIRA_WEIGHTED_VALUE_COLUMN,
+}
+JIRA_TEXT_DTYPES = {col: str for col in JIRA_USECOLS - JIRA_NUMERIC_COLUMNS}
+
+JIRA_CHOICE_FIELDS = [
+    "Status",
+    "Mercado",
+    "TipoServico",
+    "TipoOportunidade",
+    "PraticaUnificada",
+    "StatusBudgetAlocado",
+]
+
+TEXT_FIELD_LIMITS = {
+    "Titulo": 255,
+    "Cliente": 255,
+    "DNManager": 255,
+    "MarketManager": 255,
+    "OperationsManager": 255,
+    "Assignee": 255,
+    "CodigoGEP": 50,
+    "Observacoes": 63999,  # Note field limit
+    # Optional enrichment (set by IMPORT_ENRICH_ASSIGNEE=true)
+    "AssigneeMatricula": 50,
+    "AssigneeEmail": 255,
+    "AssigneeNome": 255,
+}
+
+# Colunas que não vão para o SharePoint
+JIRA_DROP_COLUMNS = ["JiraId", "Country"]
+
+# Lista de valores que devem ser tratados como NULL
+NULL_VALUES = ["nan", "none", "null", "n/a", "na", "#n/a", "", " ", "-", "--", "undefined"]
+
+IMPORT_CHUNK_SIZE = get_env_int("IMPORT_CHUNK_SIZE", 2000)
+IMPORT_CHUNKED_FORMATS = ("ndjson", "paginado")
+
+_TRUTHY_FLAGS = {"1", "true", "yes", "y", "sim", "s"}
+
+
+def is_null_value(val):
+    """Verifica se o valor deve ser tratado como NULL"""
+    if pd.isna(val) or val is None:
+        return True
+    if isinstance(val, str) and str(val).strip().lower() in NULL_VALUES:
+        return True
+    return False
 
-        # OPÇÃO 1: Recebeu CSV bruto (vindo do Power Automate)
-        if csv_content:
-            import io
 
-            logging.info("Recebido CSV bruto (%s caracteres)", len(csv_content))
-            try:
-                # Autodetect separador (vírgula ou ponto-e-vírgula)
-                first_line = (
-                    csv_content.split("\n")[0]
-                    if "\n" in csv_content
-                    else csv_content.split("\r")[0]
-                )
-                sep = ";" if first_line.count(";") > first_line.count(",") else ","
-                logging.info('Separador detectado: "%s"', sep)
+def parse_number_column(series, *, default=0, allow_null=False, percent=False):
+    """Parse robusto de número por coluna: trata pt-BR, porcentagem, moeda"""
+    nums, has_percent = scan_number_series(series)
 
-                df = pd.read_csv(io.StringIO(csv_content), sep=sep)
-                logging.info(
-                    "CSV parseado: %s linhas, colunas: %s...",
-                    len(df),
-                    list(df.columns)[:5],
-                )
-            except Exception as csv_error:
-                logging.error("Erro parsing CSV: %s", str(csv_error))
-                return func.HttpResponse(
-                    json.dumps(
-                        {"error": f"Erro ao parsear CSV: {str(csv_error)}", "success": False}
-                    ),
-                    status_code=400,
-                    mimetype="application/json",
-                )
-        # OPÇÃO 2: Recebeu JSON array (ofertas já parseadas)
-        elif ofertas_jira:
-            logging.info("Recebido JSON array com %s ofertas", len(ofertas_jira))
-            df = pd.DataFrame(ofertas_jira)
-        else:
-            # Nenhum dado recebido
-            return func.HttpResponse(
-                json.dumps({"error": "Nenhuma oferta recebida", "success": False}),
-                status_code=400,
-                mimetype="application/json",
-            )
+    # Se tinha % e percent=False, ainda assim converter
+    if not percent:
+        nums = nums.mask(has_percent, nums / 100)
 
-        # Neste ponto, df já contém os dados (seja de CSV ou JSON)
+    # Se é campo de porcentagem e valor > 1, converter
+    if percent:
+        nums = nums.mask(nums > 1, nums / 100)
 
-        # Normaliza coluna de valor quando apenas o weighted estiver presente
-        if (
-            "Custom field (Total Amount (euros))" not in df.columns
-            and "Custom field (Total amount (€) weighted)" in df.columns
-        ):
-            df = df.rename(
-                columns={
-                    "Custom field (Total amount (€) weighted)": "Custom field (Total Amount (euros))"
-                }
-            )
+    # Retornar int se for inteiro
+    result = nums.astype(object)
+    integral = np.isfinite(nums) & (nums == np.trunc(nums))
+    result[integral] = [int(v) for v in nums[integral]]
+    result[nums.isna()] = None if allow_null else default
+    # Mesmo dtype do antigo apply(parse_number): com algum valor não inteiro (ou nulo)
+    # a coluna vira float64 e os inteiros saem como 5.0
+    return result.infer_objects()
 
-        # Mapeamento de colunas JIRA -> SharePoint
-        column_mapping = {
-            "Issue key": "JiraKey",
-            "Issue id": "JiraId",
-            "Assignee": "Assignee",
-            "Status": "Status",
-            "Summary": "Titulo",
-            "Component/s": "Cliente",
-            "Custom field (Market)": "Mercado",
-            "Custom field (Type of Service)": "TipoServico",
-            "Custom field (Total Amount (euros))": "ValorEUR",
-            "Custom field (Budg.Loc.Currency)": "ValorBRL",
-            "Custom field (Margin)": "Margem",
-            "Custom field (Country)": "Country",
-            "Custom field (DN Manager)": "DNManager",
-            "Custom field (Market Manager)": "MarketManager",
-            "Custom field (Operations Manager)": "OperationsManager",
-            "Created": "JiraCreated",
-            "Updated": "JiraUpdated",
-            "Custom field (Proposal Due Date)": "PrazoProposta",
-            "Custom field (Observations)": "Observacoes",
-            "Custom field (Type Business Opportunity)": "TipoOportunidade",
-            "Custom field (Renewal)": "Renewal",
-            "Custom field (Temporal Scope)": "TemporalScope",
-            "Custom field (Código GEP)": "CodigoGEP",
-        }
 
-        # Renomear colunas existentes
-        rename_cols = {k: v for k, v in column_mapping.items() if k in df.columns}
-        df = df.rename(columns=rename_cols)
+def parse_date_column(series):
+    """Converte a coluna para date-only (YYYY-MM-DD)"""
+    return parse_date_series(series).map(
+        lambda dt: dt.date().isoformat() if pd.notna(dt) else None
+    )
 
-        # Selecionar apenas colunas mapeadas
-        available_cols = [v for v in column_mapping.values() if v in df.columns]
-        df_clean = df[available_cols].copy()
 
-        # ============================================================
-        # BLINDAGEM COMPLETA - CONVERSÃO DE TIPOS PARA SHAREPOINT
-        # ============================================================
+def convert_boolean(val):
+    """Aceita: Yes/No, True/False, 1/0, Sim/Não, Y/N"""
+    if is_null_value(val):
+        return False  # Default para Boolean
+    if isinstance(val, bool):
+        return val
+    val_str = str(val).strip().lower()
+    return val_str in ["yes", "true", "1", "sim", "y", "s"]
 
-        # Lista de valores que devem ser tratados como NULL
-        NULL_VALUES = ["nan", "none", "null", "n/a", "na", "#n/a", "", " ", "-", "--", "undefined"]
 
-        def is_null_value(val):
-            """Verifica se o valor deve ser tratado como NULL"""
-            if pd.isna(val) or val is None:
-                return True
-            if isinstance(val, str) and str(val).strip().lower() in NULL_VALUES:
-                return True
-            return False
+def normalize_choice_passthrough(val):
+    """Passa valor JIRA diretamente, apenas limpando NaN e whitespace"""
+    if is_null_value(val):
+        return None
+    val_str = str(val).strip()
+    return val_str if val_str else None
 
-        # -------------------------------------------------------------
-        # 1. CAMPOS NUMÉRICOS - Parse robusto (pt-BR, %, moeda)
-        # Trata: "1.234,56" (pt-BR), "24%", "€1000", "R$500", etc.
-        # -------------------------------------------------------------
-        def parse_number(val, *, default=0, allow_null=False, percent=False):
-            """Parse robusto de número: trata pt-BR, porcentagem, moeda"""
-            if is_null_value(val):
-                return None if allow_null else default
-
-            # Se já é número, usa direto
-            if isinstance(val, (int, float)) and not pd.isna(val):
-                num = float(val)
-            else:
-                s = str(val).strip()
-
-                # Remover símbolos de moeda e espaços
-                s = s.replace("R$", "").replace("€", "").replace("$", "")
-                s = s.replace("\u00a0", " ")  # nbsp
-                s = s.replace(" ", "")
-
-                # Tratar porcentagem
-                has_percent = "%" in s
-                s = s.replace("%", "")
-
-                # Detectar formato pt-BR: "1.234,56" (ponto milhar, vírgula decimal)
-                # vs formato US: "1,234.56" (vírgula milhar, ponto decimal)
-                if "." in s and "," in s:
-                    # Se vírgula vem depois do ponto: pt-BR (1.234,56)
-                    if s.rfind(",") > s.rfind("."):
-                        s = s.replace(".", "").replace(",", ".")
-                    # Se ponto vem depois da vírgula: US (1,234.56)
-                    else:
-                        s = s.replace(",", "")
-                else:
-                    # Só tem um tipo de separador - assumir vírgula como decimal
-                    s = s.replace(",", ".")
 
-                # Remover caracteres não-numéricos restantes
-                s = re.sub(r"[^0-9.\-]", "", s)
+def encode_choice_column(series, normalize=normalize_choice_passthrough):
+    """
+    Coluna choice como Categorical do valor normalizado de cada célula.
+    `normalize` roda uma vez por valor distinto; as linhas só carregam o código.
+    Categorias na ordem da primeira ocorrência; None vira ausente (NaN).
+    """
+    if pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+        # Tipos mistos (ex.: 1 e True colidem no factorize, dicts não são hasheáveis);
+        # astype("category") ordenaria as categorias, então elas são dadas explicitamente
+        mapped = series.map(normalize)
+        categories = pd.Index(pd.unique(mapped.dropna()), dtype=object)
+        return pd.Series(
+            pd.Categorical(mapped, categories=categories), index=series.index, name=series.name
+        )
 
-                if s in ("", "-", ".", "-."):
-                    return None if allow_null else default
+    codes, uniques = pd.factorize(series)
+    normalized = [normalize(v) for v in uniques]
+    categories = list(dict.fromkeys(v for v in normalized if v is not None))
+    position = {v: i for i, v in enumerate(categories)}
+    # Último elemento atende o código -1 (nulo) do factorize
+    remap = np.array([position[v] if v is not None else -1 for v in normalized] + [-1], dtype=np.int64)
+    return pd.Series(
+        pd.Categorical.from_codes(remap[codes], categories=pd.Index(categories, dtype=object)),
+        index=series.index,
+        name=series.name,
+    )
 
-                try:
-                    num = float(s)
-                except ValueError:
-                    return None if allow_null else default
 
-                # Se tinha % e percent=False, ainda assim converter
-                if has_percent and not percent:
-                    num = num / 100
+def choice_value_counts(col):
+    """
+    value_counts(dropna=False) de uma coluna Categorical calculado direto dos códigos
+    (mesma ordem, inclusive nos empates; nulos sob None).
+    """
+    codes = col.cat.codes.to_numpy()
+    keys = list(col.cat.categories)
+    counts = np.bincount(codes[codes >= 0], minlength=len(keys)).tolist()
+    nulos = codes < 0
+    if nulos.any():
+        # value_counts lista os valores na ordem da primeira ocorrência, como as categorias
+        primeiro_nulo = int(nulos.argmax())
+        posicao = int(codes[:primeiro_nulo].max()) + 1 if primeiro_nulo else 0
+        keys.insert(posicao, None)
+        counts.insert(posicao, int(nulos.sum()))
+    return pd.Series(counts, index=pd.Index(keys, dtype=object), dtype=np.int64).sort_values(ascending=False)
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+_HTML_BR_RE = re.compile(r"(?i)<br\s*/?>")
+_HTML_BLOCK_END_RE = re.compile(r"(?i)</(div|p|tr|h\d)>")
+_HTML_LI_RE = re.compile(r"(?i)<li[^>]*>")
+_HTML_LI_END_RE = re.compile(r"(?i)</li>")
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def strip_html_to_text(val_str: str) -> str:
+    """Converte HTML simples (JIRA/Outlook) para texto preservando quebras de linha."""
+    s = html.unescape(val_str)
+    s = s.replace("\r\n", "\n").replace("\r", "\n")
+
+    # Todas as trocas exigem "<...>"; as de fechamento exigem "</"
+    if "<" in s and ">" in s:
+        # Quebras de linha comuns em HTML
+        s = _HTML_BR_RE.sub("\n", s)
+        closing = "</" in s
+        if closing:
+            s = _HTML_BLOCK_END_RE.sub("\n", s)
+        s = _HTML_LI_RE.sub("- ", s)
+        if closing:
+            s = _HTML_LI_END_RE.sub("\n", s)
+
+        # Remover tags remanescentes
+        s = _HTML_TAG_RE.sub("", s)
+
+    # Normalizar espaços e TABs preservando \n
+    s = s.replace("\t", " ")
+    while "  " in s:
+        s = s.replace("  ", " ")
+    s = "\n".join(line.strip() for line in s.split("\n"))
+    if "\n\n\n" in s:
+        s = _BLANK_LINES_RE.sub("\n\n", s)
+    return s.strip()
+
+
+def _text_column_values(series):
+    """Valores não-nulos (is_null_value) de uma coluna, como str sem espaços nas pontas."""
+    values = series[series.notna()]
+    values = values.astype(str).str.strip()
+    return values[~values.str.lower().isin(NULL_VALUES)]
+
+
+def _truncate_text_column(values, max_length):
+    """Trunca (com "...") os valores acima de max_length; devolve (valores, quantidade truncada)."""
+    longos = values.str.len() > max_length
+    truncados = int(longos.sum())
+    if truncados:
+        values = values.copy()
+        values[longos] = values[longos].str[: max_length - 3] + "..."
+    return values, truncados
+
+
+def _text_column_result(series, values):
+    result = pd.Series([None] * len(series), index=series.index, dtype=object)
+    values = values[values != ""]
+    result[values.index] = values
+    return result
+
+
+def normalize_text_column(series, max_length=255):
+    """
+    Normaliza uma coluna de texto: nulos (NULL_VALUES) viram None, espaços
+    repetidos viram um só e valores acima de max_length são truncados com "...".
+    Devolve (coluna normalizada, quantidade de valores truncados).
+    """
+    values = _text_column_values(series).str.replace(_WHITESPACE_RE, " ", regex=True)
+    values, truncados = _truncate_text_column(values, max_length)
+    return _text_column_result(series, values), truncados
+
+
+def _observacoes_text(s, strip_html):
+    if strip_html and ("<" in s or "&lt;" in s or "&gt;" in s or "&amp;" in s):
+        return strip_html_to_text(s)
+    return html.unescape(s).replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+def normalize_observacoes_column(series, max_length=63999, strip_html=True):
+    """
+    Normaliza a coluna Observacoes: remove HTML (opcional), preserva quebras de
+    linha e trunca valores acima de max_length com "...".
+    Devolve (coluna normalizada, quantidade de valores truncados).
+    """
+    values = _text_column_values(series).map(lambda s: _observacoes_text(s, strip_html))
+    values = values[values != ""]
+    values, truncados = _truncate_text_column(values, max_length)
+    return _text_column_result(series, values), truncados
+
+
+ASSIGNEE_DIRECTORY_TTL_SECONDS = get_env_int("ASSIGNEE_DIRECTORY_TTL_SECONDS", 900)
+ARQS_TEAMS_FIELDS = "Title,Login,field_1,field_3,E_x002d_mail,Status"
+
+_ASSIGNEE_DIRECTORY = {}  # list_id, delta_link, items {item_id: pessoa}, mapping, synced_at
+_ASSIGNEE_DIRECTORY_LOCK = threading.Lock()
 
-            # Se é campo de porcentagem e valor > 1, converter
-            if percent and num > 1:
-                num = num / 100
 
-            # Retornar int se for inteiro
-            return int(num) if num == int(num) else num
+def get_assignee_directory_path():
+    return get_data_file_path("ASSIGNEE_DIRECTORY_CACHE_PATH", "assignee_directory.json")
 
-        # Aplicar nos campos numéricos
-        for col in ["ValorEUR", "ValorBRL"]:
-            if col in df_clean.columns:
-                df_clean[col] = df_clean[col].apply(lambda x: parse_number(x, default=0))
 
-        if "Margem" in df_clean.columns:
-            df_clean["Margem"] = df_clean["Margem"].apply(
-                lambda x: parse_number(x, default=0, percent=True)
+def _arqs_teams_person(fields):
+    login = (fields.get("Login") or "").strip().lower()
+    if not login:
+        return None
+    return {
+        "login": login,
+        "matricula": (fields.get("Title") or "").strip(),
+        "nome": (fields.get("field_1") or "").strip(),
+        "email": (fields.get("field_3") or fields.get("E_x002d_mail") or "").strip().lower(),
+    }
+
+
+def _build_assignee_mapping(items):
+    # Ordem dos itens = ordem do Graph; em logins duplicados o último vence (como antes)
+    return {
+        pessoa["login"]: {k: pessoa[k] for k in ("matricula", "nome", "email")}
+        for pessoa in items.values()
+    }
+
+
+def _load_assignee_directory_file(list_id):
+    try:
+        with open(get_assignee_directory_path(), encoding="utf-8") as fh:
+            cached = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    if cached.get("list_id") != list_id or not isinstance(cached.get("items"), dict):
+        return {}
+    return cached
+
+
+def _save_assignee_directory_file(cached):
+    path = get_assignee_directory_path()
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(
+                {k: cached[k] for k in ("list_id", "delta_link", "items", "synced_at")},
+                fh,
+                ensure_ascii=False,
             )
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        logging.warning("Não foi possível gravar o cache ARQs_Teams em %s: %s", path, str(exc))
+
+
+def sync_arqs_teams_items(site_id, list_id, token, items=None, delta_link=None):
+    """
+    Sincroniza os itens da ARQs_Teams via Graph delta query.
+
+    Sem delta_link faz a leitura completa; com delta_link aplica apenas as
+    alterações (incluindo itens removidos) sobre `items`.
+    Devolve (items, novo delta_link).
+    """
+    items = dict(items or {}) if delta_link else {}
+    next_link = delta_link or (
+        f"/sites/{site_id}/lists/{list_id}/items/delta?$top=999&$expand=fields($select={ARQS_TEAMS_FIELDS})"
+    )
+    while next_link:
+        _, resp_body = graph_request("GET", next_link, token)
+        payload = json.loads(resp_body or "{}")
+        for item in payload.get("value", []):
+            item_id = item.get("id")
+            if not item_id:
+                continue
+            if "@removed" in item or "deleted" in item:
+                items.pop(item_id, None)
+                continue
+            pessoa = _arqs_teams_person(item.get("fields") or {})
+            if pessoa:
+                items[item_id] = pessoa
+            else:
+                items.pop(item_id, None)
+        if payload.get("@odata.deltaLink"):
+            return items, payload["@odata.deltaLink"]
+        next_link = payload.get("@odata.nextLink")
+    return items, None
+
+
+def fetch_assignee_directory(force_refresh=False):
+    """
+    Devolve {login (lowercase): {matricula, nome, email}} a partir da lista ARQs_Teams.
+
+    O diretório fica em memória e em disco (ASSIGNEE_DIRECTORY_CACHE_PATH); dentro do
+    TTL (ASSIGNEE_DIRECTORY_TTL_SECONDS) é servido sem acesso à rede. Vencido o TTL,
+    é atualizado de forma incremental via Graph delta query; se a atualização falhar,
+    o diretório anterior continua a ser usado.
+
+    Requer permissões Graph para ler a lista ARQs_Teams (SP_* env vars).
+    """
+    arqs_list_id = os.getenv(
+        "ARQS_TEAMS_LIST_ID", "1ad529f7-db5b-4567-aa00-1582ff333264"
+    )
+
+    # O lock só protege o cache: a sincronização com o Graph roda fora dele,
+    # sobre uma cópia, e o resultado é trocado no final
+    with _ASSIGNEE_DIRECTORY_LOCK:
+        cached = _ASSIGNEE_DIRECTORY
+        if cached.get("list_id") != arqs_list_id:
+            cached.clear()
+            disk = _load_assignee_directory_file(arqs_list_id)
+            if disk:
+                cached.update(disk, mapping=_build_assignee_mapping(disk["items"]))
+
+        fresh = cached and time.time() - cached.get("synced_at", 0) < ASSIGNEE_DIRECTORY_TTL_SECONDS
+        if fresh and not force_refresh:
+            return cached["mapping"]
+        snapshot = dict(cached)
+
+    try:
+        token = get_graph_token()
+        site_id = get_sharepoint_site_id(token)
 
-        if "TemporalScope" in df_clean.columns:
-            df_clean["TemporalScope"] = df_clean["TemporalScope"].apply(
-                lambda x: parse_number(x, allow_null=True)
+        delta_link = snapshot.get("delta_link")
+        try:
+            items, delta_link = sync_arqs_teams_items(
+                site_id, arqs_list_id, token, snapshot.get("items"), delta_link
             )
+        except RuntimeError as exc:
+            if is_graph_not_found(exc):
+                forget_sharepoint_ids_after_404(site_id, token)
+            if not delta_link:
+                raise
+            # Delta token expirado (410) ou rejeitado: refaz a leitura completa
+            logging.info("Delta ARQs_Teams inválido, relendo a lista completa: %s", str(exc))
+            items, delta_link = sync_arqs_teams_items(site_id, arqs_list_id, token)
+    except Exception as exc:
+        if not snapshot:
+            raise
+        logging.warning("Falha ao atualizar ARQs_Teams, usando cache anterior: %s", str(exc))
+        return snapshot["mapping"]
+
+    with _ASSIGNEE_DIRECTORY_LOCK:
+        cached = _ASSIGNEE_DIRECTORY
+        if cached.get("list_id") == arqs_list_id and cached.get("synced_at", 0) > snapshot.get("synced_at", 0):
+            # Outra chamada sincronizou enquanto esta consultava o Graph
+            return cached["mapping"]
+        cached.clear()
+        cached.update(
+            list_id=arqs_list_id,
+            delta_link=delta_link,
+            items=items,
+            mapping=_build_assignee_mapping(items),
+            synced_at=time.time(),
+        )
+        _save_assignee_directory_file(cached)
+        return cached["mapping"]
 
-        # -------------------------------------------------------------
-        # 2. CAMPOS DATETIME
-        # JiraCreated, JiraUpdated = date-only (YYYY-MM-DD)
-        # PrazoProposta = date-only
-        # -------------------------------------------------------------
-        def parse_date(val):
-            """Converte para date-only (YYYY-MM-DD)"""
-            if is_null_value(val):
-                return None
-            try:
-                dt = pd.to_datetime(val, errors="coerce", dayfirst=True)
-                return dt.date().isoformat() if pd.notna(dt) else None
-            except Exception:
-                return None
 
-        # JiraCreated e JiraUpdated são date-only
-        for col in ["JiraCreated", "JiraUpdated"]:
-            if col in df_clean.columns:
-                df_clean[col] = df_clean[col].apply(parse_date)
+def enrich_assignee_columns(df_clean, directory):
+    """Popula AssigneeMatricula/Nome/Email a partir do login do Assignee (mantido AS-IS)."""
 
-        # PrazoProposta é date-only
-        if "PrazoProposta" in df_clean.columns:
-            df_clean["PrazoProposta"] = df_clean["PrazoProposta"].apply(parse_date)
+    def enrich_login(val):
+        if is_null_value(val):
+            return None
+        key = str(val).strip().lower()
+        return directory.get(key)
+
+    enriched = df_clean["Assignee"].apply(enrich_login)
+    df_clean["AssigneeMatricula"] = enriched.apply(lambda x: x.get("matricula") if x else None)
+    df_clean["AssigneeNome"] = enriched.apply(lambda x: x.get("nome") if x else None)
+    df_clean["AssigneeEmail"] = enriched.apply(lambda x: x.get("email") if x else None)
+
+    missing = int(df_clean["AssigneeMatricula"].isna().sum())
+    logging.info(
+        "Enriquecimento Assignee: %s ofertas, %s sem match em ARQs_Teams",
+        int(df_clean.shape[0]),
+        missing,
+    )
 
-        # -------------------------------------------------------------
-        # 3. CAMPO BOOLEAN (Renewal)
-        # Aceita: Yes/No, True/False, 1/0, Sim/Não, Y/N
-        # -------------------------------------------------------------
-        if "Renewal" in df_clean.columns:
 
-            def convert_boolean(val):
-                if is_null_value(val):
-                    return False  # Default para Boolean
-                if isinstance(val, bool):
-                    return val
-                val_str = str(val).strip().lower()
-                return val_str in ["yes", "true", "1", "sim", "y", "s"]
+def normalize_jirakey(val):
+    if is_null_value(val):
+        return None
+    val_str = str(val).strip().upper()  # JiraKey sempre maiúsculo
+    # Escape de apóstrofo para OData
+    val_str = val_str.replace("'", "''")
+    return val_str
 
-            df_clean["Renewal"] = df_clean["Renewal"].apply(convert_boolean)
 
-        # -------------------------------------------------------------
-        # 4. CAMPOS CHOICE - PASSAR VALORES JIRA SEM TRANSFORMAÇÃO
-        # IMPORTANTE: SharePoint deve ter FillInChoice=TRUE nos campos Choice
-        # -------------------------------------------------------------
+def transform_jira_frame(df, *, strip_html=True, assignee_directory=None):
+    """
+    Aplica o mapeamento JIRA -> SharePoint e a blindagem de tipos a um DataFrame
+    (export inteiro ou um chunk dele). Não valida a presença de JiraKey.
+    """
+    # Normaliza coluna de valor quando apenas o weighted estiver presente
+    if (
+        "Custom field (Total Amount (euros))" not in df.columns
+        and JIRA_WEIGHTED_VALUE_COLUMN in df.columns
+    ):
+        df = df.rename(columns={JIRA_WEIGHTED_VALUE_COLUMN: "Custom field (Total Amount (euros))"})
+
+    # Renomear colunas existentes
+    rename_cols = {k: v for k, v in JIRA_COLUMN_MAPPING.items() if k in df.columns}
+    df = df.rename(columns=rename_cols)
+
+    # Selecionar apenas colunas mapeadas
+    available_cols = [v for v in JIRA_COLUMN_MAPPING.values() if v in df.columns]
+    df_clean = df[available_cols].copy()
+
+    # ============================================================
+    # BLINDAGEM COMPLETA - CONVERSÃO DE TIPOS PARA SHAREPOINT
+    # ============================================================
+
+    # -------------------------------------------------------------
+    # 1. CAMPOS NUMÉRICOS - Parse robusto (pt-BR, %, moeda)
+    # Trata: "1.234,56" (pt-BR), "24%", "€1000", "R$500", etc.
+    # -------------------------------------------------------------
+    for col in ["ValorEUR", "ValorBRL"]:
+        if col in df_clean.columns:
+            df_clean[col] = parse_number_column(df_clean[col], default=0)
+
+    if "Margem" in df_clean.columns:
+        df_clean["Margem"] = parse_number_column(df_clean["Margem"], default=0, percent=True)
+
+    if "TemporalScope" in df_clean.columns:
+        df_clean["TemporalScope"] = parse_number_column(df_clean["TemporalScope"], allow_null=True)
+
+    # -------------------------------------------------------------
+    # 2. CAMPOS DATETIME
+    # JiraCreated, JiraUpdated, PrazoProposta = date-only (YYYY-MM-DD)
+    # -------------------------------------------------------------
+    for col in ["JiraCreated", "JiraUpdated", "PrazoProposta"]:
+        if col in df_clean.columns:
+            df_clean[col] = parse_date_column(df_clean[col])
+
+    # -------------------------------------------------------------
+    # 3. CAMPO BOOLEAN (Renewal)
+    # -------------------------------------------------------------
+    if "Renewal" in df_clean.columns:
+        df_clean["Renewal"] = df_clean["Renewal"].apply(convert_boolean)
+
+    # -------------------------------------------------------------
+    # 4. CAMPOS CHOICE - PASSAR VALORES JIRA SEM TRANSFORMAÇÃO
+    # IMPORTANTE: SharePoint deve ter FillInChoice=TRUE nos campos Choice
+    # Categorical: normaliza uma vez por valor distinto
+    # -------------------------------------------------------------
+    for field in JIRA_CHOICE_FIELDS:
+        if field in df_clean.columns:
+            df_clean[field] = encode_choice_column(df_clean[field])
+            logging.info(
+                'Choice "%s": %s valores únicos passados do JIRA',
+                field,
+                len(df_clean[field].cat.categories),
+            )
 
-        def normalize_choice_passthrough(val):
-            """Passa valor JIRA diretamente, apenas limpando NaN e whitespace"""
-            if is_null_value(val):
-                return None
-            val_str = str(val).strip()
-            return val_str if val_str else None
-
-        for field in [
-            "Status",
-            "Mercado",
-            "TipoServico",
-            "TipoOportunidade",
-            "PraticaUnificada",
-            "StatusBudgetAlocado",
-        ]:
-            if field in df_clean.columns:
-                df_clean[field] = df_clean[field].apply(normalize_choice_passthrough)
-                unique_vals = df_clean[field].dropna().unique()
-                logging.info(
-                    'Choice "%s": %s valores únicos passados do JIRA',
-                    field,
-                    len(unique_vals),
-                )
+    # -------------------------------------------------------------
+    # 5. CAMPOS DE TEXTO
+    # Limpa NaN-like, normaliza espaços, limita tamanho
+    # -------------------------------------------------------------
+    for field, limit in TEXT_FIELD_LIMITS.items():
+        if field in df_clean.columns:
+            if field == "Observacoes":
+                df_clean[field], truncados = normalize_observacoes_column(df_clean[field], limit, strip_html)
+            else:
+                df_clean[field], truncados = normalize_text_column(df_clean[field], limit)
+            if truncados:
+                logging.warning("Campo %s: %s valores truncados para %s caracteres", field, truncados, limit)
+
+    # -------------------------------------------------------------
+    # 5b. ENRIQUECIMENTO OPCIONAL DO ASSIGNEE (LOGIN -> MATRÍCULA/NOME/EMAIL)
+    # -------------------------------------------------------------
+    if assignee_directory is not None and "Assignee" in df_clean.columns:
+        try:
+            enrich_assignee_columns(df_clean, assignee_directory)
+        except Exception as exc:
+            logging.warning("Falha no enriquecimento Assignee (continuando sem enrich): %s", str(exc))
+
+    # -------------------------------------------------------------
+    # 6. JIRAKEY - Campo crítico para UPSERT
+    # Escape de apóstrofo para OData filter
+    # -------------------------------------------------------------
+    if "JiraKey" in df_clean.columns:
+        df_clean["JiraKey"] = df_clean["JiraKey"].apply(normalize_jirakey)
+
+    # -------------------------------------------------------------
+    # 7. REMOVER COLUNAS QUE NÃO VÃO PARA SHAREPOINT
+    # -------------------------------------------------------------
+    for col in JIRA_DROP_COLUMNS:
+        if col in df_clean.columns:
+            df_clean = df_clean.drop(columns=[col])
+
+    return df_clean
+
+
+def summarize_jira_frame(df_clean):
+    """Estatísticas parciais de um DataFrame transformado (somáveis entre chunks)."""
+    return {
+        "total": len(df_clean),
+        "valor_eur_total": df_clean["ValorEUR"].sum() if "ValorEUR" in df_clean.columns else 0,
+        "valor_brl_total": df_clean["ValorBRL"].sum() if "ValorBRL" in df_clean.columns else 0,
+        "null_counts": df_clean.isna().sum(),
+        "choice_counts": {
+            field: choice_value_counts(df_clean[field])
+            for field in JIRA_CHOICE_FIELDS
+            if field in df_clean.columns
+        },
+    }
 
-        # -------------------------------------------------------------
-        # 5. CAMPOS DE TEXTO
-        # Limpa NaN-like, normaliza espaços, limita tamanho
-        # -------------------------------------------------------------
-        TEXT_FIELD_LIMITS = {
-            "Titulo": 255,
-            "Cliente": 255,
-            "DNManager": 255,
-            "MarketManager": 255,
-            "OperationsManager": 255,
-            "Assignee": 255,
-            "CodigoGEP": 50,
-            "Observacoes": 63999,  # Note field limit
-            # Optional enrichment (set by IMPORT_ENRICH_ASSIGNEE=true)
-            "AssigneeMatricula": 50,
-            "AssigneeEmail": 255,
-            "AssigneeNome": 255,
-        }
 
-        def normalize_text(val, max_length=255):
-            """Normaliza campo de texto: limpa NaN, normaliza espaços, limita tamanho"""
-            if is_null_value(val):
-                return None
-
-            val_str = str(val).strip()
-
-            # Normalizar espaços múltiplos
-            val_str = re.sub(r"\s+", " ", val_str)
-
-            # Normalizar quebras de linha (CRLF -> LF)
-            val_str = val_str.replace("\r\n", "\n").replace("\r", "\n")
-
-            # Limitar tamanho
-            if len(val_str) > max_length:
-                val_str = val_str[: max_length - 3] + "..."
-                logging.warning("Texto truncado para %s caracteres", max_length)
-
-            return val_str if val_str else None
-
-        def strip_html_to_text(val_str: str) -> str:
-            """Converte HTML simples (JIRA/Outlook) para texto preservando quebras de linha."""
-            s = html.unescape(val_str)
-            s = s.replace("\r\n", "\n").replace("\r", "\n")
-
-            # Quebras de linha comuns em HTML
-            s = re.sub(r"(?i)<br\s*/?>", "\n", s)
-            s = re.sub(r"(?i)</(div|p|tr|h\d)>", "\n", s)
-            s = re.sub(r"(?i)<li[^>]*>", "- ", s)
-            s = re.sub(r"(?i)</li>", "\n", s)
-
-            # Remover tags remanescentes
-            s = re.sub(r"<[^>]+>", "", s)
-
-            # Normalizar espaços preservando \n
-            s = re.sub(r"[ \\t]+", " ", s)
-            s = "\n".join(line.strip() for line in s.split("\n"))
-            s = re.sub(r"\n{3,}", "\n\n", s)
-            return s.strip()
-
-        STRIP_HTML_OBSERVACOES = os.getenv("IMPORT_STRIP_HTML_OBSERVACOES", "true").strip().lower() in {
-            "1",
-            "true",
-            "yes",
-            "y",
-            "sim",
-            "s",
+def merge_jira_summaries(parts):
+    """Combina as estatísticas parciais de todos os chunks."""
+    null_counts = functools.reduce(
+        lambda acc, s: acc.add(s, fill_value=0), (p["null_counts"] for p in parts)
+    )
+    choice_counts = {}
+    for part in parts:
+        for field, counts in part["choice_counts"].items():
+            choice_counts.setdefault(field, []).append(counts)
+
+    choices_report = {}
+    for field, counts_list in choice_counts.items():
+        counts = (
+            pd.concat(counts_list)
+            .groupby(level=0, sort=False, dropna=False)
+            .sum()
+            .sort_values(ascending=False, kind="stable")
+        )
+        valores = frame_to_records(
+            counts.rename_axis("valor").reset_index(name="quantidade"),
+            [("valor", "valor", "native"), ("quantidade", "quantidade", "int")],
+        )
+        nulos = int(counts[counts.index.isna()].sum())
+        choices_report[field] = {
+            "total": int(counts.sum()),
+            "nulos": nulos,
+            "unicos": int(counts.index.notna().sum()),
+            "valores": valores,
         }
 
-        def normalize_observacoes(val, max_length=63999):
-            """Normaliza Observacoes: remove HTML (opcional), preserva quebras de linha, limita tamanho."""
-            if is_null_value(val):
-                return None
+    return {
+        "total_processado": sum(p["total"] for p in parts),
+        "valor_eur_total": float(sum(p["valor_eur_total"] for p in parts)),
+        "valor_brl_total": float(sum(p["valor_brl_total"] for p in parts)),
+        "null_counts": {k: int(v) for k, v in null_counts.to_dict().items()},
+        "choices_report": choices_report,
+    }
 
-            s = str(val).strip()
-            if STRIP_HTML_OBSERVACOES and ("<" in s or "&lt;" in s or "&gt;" in s or "&amp;" in s):
-                s = strip_html_to_text(s)
-            else:
-                s = html.unescape(s).replace("\r\n", "\n").replace("\r", "\n").strip()
 
-            if not s:
-                return None
+def detect_csv_separator(csv_content):
+    """Autodetect separador (vírgula ou ponto-e-vírgula) pela primeira linha."""
+    first_line = (
+        csv_content.split("\n", 1)[0]
+        if "\n" in csv_content
+        else csv_content.split("\r", 1)[0]
+    )
+    return ";" if first_line.count(";") > first_line.count(",") else ","
 
-            if len(s) > max_length:
-                s = s[: max_length - 3] + "..."
-                logging.warning("Observacoes truncado para %s caracteres", max_length)
 
-            return s
+def jira_input_has_column(csv_content, ofertas_jira, column):
+    """Se o export (cabeçalho do CSV ou chaves do JSON) traz a coluna."""
+    if csv_content:
+        import io
 
-        for field, limit in TEXT_FIELD_LIMITS.items():
-            if field in df_clean.columns:
-                if field == "Observacoes":
-                    df_clean[field] = df_clean[field].apply(
-                        lambda x, l=limit: normalize_observacoes(x, l)
-                    )
-                else:
-                    df_clean[field] = df_clean[field].apply(
-                        lambda x, l=limit: normalize_text(x, l)
-                    )
+        first_line = csv_content.lstrip("\ufeff").split("\n", 1)[0].rstrip("\r")
+        try:
+            header = pd.read_csv(io.StringIO(first_line), sep=detect_csv_separator(csv_content), nrows=0)
+        except Exception:
+            return False
+        return column in header.columns
+    return any(isinstance(rec, dict) and column in rec for rec in ofertas_jira or [])
 
-        # -------------------------------------------------------------
-        # 5b. ENRIQUECIMENTO OPCIONAL DO ASSIGNEE (LOGIN -> MATRÍCULA/NOME/EMAIL)
-        #
-        # Objetivo: manter `Assignee` AS-IS (login do JIRA), mas também popular colunas
-        # derivadas úteis para relatórios e troubleshooting em SharePoint.
-        #
-        # Requer permissões Graph para ler a lista ARQs_Teams (SP_* env vars).
-        # -------------------------------------------------------------
-        ENRICH_ASSIGNEE = os.getenv("IMPORT_ENRICH_ASSIGNEE", "false").strip().lower() in {
-            "1",
-            "true",
-            "yes",
-            "y",
-            "sim",
-            "s",
-        }
 
-        if ENRICH_ASSIGNEE and "Assignee" in df_clean.columns:
+def iter_jira_chunks(csv_content=None, ofertas=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Gera DataFrames de até chunk_size linhas, lendo do CSV só as colunas mapeadas.
+
+    No CSV as colunas não numéricas são lidas como texto, para que a tipagem
+    não dependa de quais linhas caíram em cada chunk.
+    """
+    if csv_content:
+        import io
+
+        reader = pd.read_csv(
+            io.StringIO(csv_content),
+            sep=detect_csv_separator(csv_content),
+            usecols=lambda col: col in JIRA_USECOLS,
+            dtype=JIRA_TEXT_DTYPES,
+            chunksize=chunk_size,
+        )
+        with reader:
+            yield from reader
+    else:
+        for start in range(0, len(ofertas), chunk_size):
+            yield pd.DataFrame(ofertas[start:start + chunk_size])
+
+
+def parse_chunk_size(raw):
+    """chunk_size do body (padrão IMPORT_CHUNK_SIZE); ValueError se não for inteiro >= 1."""
+    if raw in (None, ""):
+        return IMPORT_CHUNK_SIZE
+    try:
+        chunk_size = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(f"chunk_size inválido: {raw!r}") from None
+    if isinstance(raw, bool) or chunk_size < 1 or (isinstance(raw, float) and raw != chunk_size):
+        raise ValueError(f"chunk_size inválido: {raw!r} (use um inteiro >= 1)")
+    return chunk_size
+
+
+def jira_frame_records(df_clean):
+    """Converte o DataFrame transformado em lista de dicionários nativos."""
+    return [
+        {k: to_native(v) for k, v in rec.items()} for rec in df_clean.to_dict("records")
+    ]
+
+
+@app.route(route="import-jira", auth_level=func.AuthLevel.FUNCTION)
+def import_jira(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Transforma dados JIRA (CSV) para formato SharePoint.
+    Recebe: csv_content (CSV bruto) OU ofertas (JSON array)
+    Retorna: Lista formatada para UPSERT no SharePoint
+
+    Com "formato": "ndjson" o export é processado em chunks de "chunk_size"
+    linhas (padrão IMPORT_CHUNK_SIZE) e a resposta é NDJSON: uma oferta por
+    linha e, na última, {"success": true, "estatisticas": {...}}. A resposta
+    não é streamed (vai inteira em um body); para exports grandes use "paginado".
+    chunk_size só é lido nos formatos em chunks; valor inválido -> 400.
+
+    Com "formato": "paginado" o resultado é persistido sob um import_id e a
+    resposta traz só a primeira página ("page_size") + next_cursor; as demais
+    páginas vêm de import-jira/paginas e as estatísticas de import-jira/estatisticas.
+    """
+    logging.info("Iniciando importação JIRA...")
+
+    try:
+        req_body = req.get_json()
+        csv_content = req_body.get("csv_content", None)
+        ofertas_jira = req_body.get("ofertas", [])
+        arquivo_nome = req_body.get("arquivo", "unknown.csv")
+        formato = str(req_body.get("formato") or "json").strip().lower()
+        chunk_size = IMPORT_CHUNK_SIZE
+        if formato in IMPORT_CHUNKED_FORMATS:
             try:
-                token = get_graph_token()
-                site_id = os.environ.get("SP_SITE_ID")
-                if not site_id:
-                    site_url = get_required_env("SP_SITE_URL")
-                    site_id = resolve_sharepoint_site_id(site_url, token)
-
-                arqs_list_id = os.getenv(
-                    "ARQS_TEAMS_LIST_ID", "1ad529f7-db5b-4567-aa00-1582ff333264"
+                chunk_size = parse_chunk_size(req_body.get("chunk_size"))
+            except ValueError as e:
+                return func.HttpResponse(
+                    json.dumps({"error": str(e), "success": False}, ensure_ascii=False),
+                    status_code=400,
+                    mimetype="application/json",
                 )
 
-                # Fetch ARQs_Teams items (once) and build mapping by Login (lowercase).
-                mapping = {}
-                next_link = f"/sites/{site_id}/lists/{arqs_list_id}/items?$top=999&$expand=fields($select=Title,Login,field_1,field_3,E_x002d_mail,Status)"
-                while next_link:
-                    _, resp_body = graph_request("GET", next_link, token)
-                    payload = json.loads(resp_body or "{}")
-                    for item in payload.get("value", []):
-                        fields = item.get("fields") or {}
-                        login = (fields.get("Login") or "").strip().lower()
-                        if not login:
-                            continue
-                        mapping[login] = {
-                            "matricula": (fields.get("Title") or "").strip(),
-                            "nome": (fields.get("field_1") or "").strip(),
-                            "email": (fields.get("field_3") or fields.get("E_x002d_mail") or "").strip().lower(),
-                        }
-                    next_link = payload.get("@odata.nextLink")
-
-                def enrich_login(val):
-                    if is_null_value(val):
-                        return None
-                    key = str(val).strip().lower()
-                    return mapping.get(key)
-
-                enriched = df_clean["Assignee"].apply(enrich_login)
-                df_clean["AssigneeMatricula"] = enriched.apply(lambda x: x.get("matricula") if x else None)
-                df_clean["AssigneeNome"] = enriched.apply(lambda x: x.get("nome") if x else None)
-                df_clean["AssigneeEmail"] = enriched.apply(lambda x: x.get("email") if x else None)
-
-                missing = int(df_clean["AssigneeMatricula"].isna().sum())
-                logging.info(
-                    "Enriquecimento Assignee: %s ofertas, %s sem match em ARQs_Teams",
-                    int(df_clean.shape[0]),
-                    missing,
-                )
+        if not csv_content and not ofertas_jira:
+            # Nenhum dado recebido
+            return func.HttpResponse(
+                json.dumps({"error": "Nenhuma oferta recebida", "success": False}),
+                status_code=400,
+                mimetype="application/json",
+            )
+
+        STRIP_HTML_OBSERVACOES = os.getenv("IMPORT_STRIP_HTML_OBSERVACOES", "true").strip().lower() in _TRUTHY_FLAGS
+
+        # Enriquecimento opcional do Assignee (login -> matrícula/nome/email),
+        # mantendo `Assignee` AS-IS. Requer acesso Graph à lista ARQs_Teams.
+        ENRICH_ASSIGNEE = os.getenv("IMPORT_ENRICH_ASSIGNEE", "false").strip().lower() in _TRUTHY_FLAGS
+        assignee_directory = None
+        if ENRICH_ASSIGNEE and jira_input_has_column(csv_content, ofertas_jira, "Assignee"):
+            try:
+                assignee_directory = fetch_assignee_directory()
             except Exception as exc:
                 logging.warning("Falha no enriquecimento Assignee (continuando sem enrich): %s", str(exc))
 
-        # -------------------------------------------------------------
-        # 6. JIRAKEY - Campo crítico para UPSERT
-        # Escape de apóstrofo para OData filter + validação obrigatória
-        # -------------------------------------------------------------
-        if "JiraKey" in df_clean.columns:
+        if formato == "ndjson":
+            return import_jira_ndjson(
+                csv_content,
+                ofertas_jira,
+                arquivo_nome,
+                chunk_size,
+                strip_html=STRIP_HTML_OBSERVACOES,
+                assignee_directory=assignee_directory,
+            )
+        if formato == "paginado":
+            return import_jira_paginado(
+                csv_content,
+                ofertas_jira,
+                arquivo_nome,
+                chunk_size,
+                parse_page_size(req.params.get("page_size") or req_body.get("page_size")),
+                strip_html=STRIP_HTML_OBSERVACOES,
+                assignee_directory=assignee_directory,
+            )
 
-            def normalize_jirakey(val):
-                if is_null_value(val):
-                    return None
-                val_str = str(val).strip().upper()  # JiraKey sempre maiúsculo
-                # Escape de apóstrofo para OData
-                val_str = val_str.replace("'", "''")
-                return val_str
+        # OPÇÃO 1: Recebeu CSV bruto (vindo do Power Automate)
+        if csv_content:
+            import io
 
-            df_clean["JiraKey"] = df_clean["JiraKey"].apply(normalize_jirakey)
+            logging.info("Recebido CSV bruto (%s caracteres)", len(csv_content))
+            try:
+                sep = detect_csv_separator(csv_content)
+                logging.info('Separador detectado: "%s"', sep)
 
-            # Validar que JiraKey existe
-            if df_clean["JiraKey"].isna().all():
-                logging.error("JiraKey não encontrado ou todos vazios!")
+                # Lê só as colunas usadas pelo mapeamento
+                df = pd.read_csv(
+                    io.StringIO(csv_content), sep=sep, usecols=lambda col: col in JIRA_USECOLS
+                )
+                logging.info(
+                    "CSV parseado: %s linhas, colunas: %s...",
+                    len(df),
+                    list(df.columns)[:5],
+                )
+            except Exception as csv_error:
+                logging.error("Erro parsing CSV: %s", str(csv_error))
                 return func.HttpResponse(
                     json.dumps(
-                        {"error": "JiraKey é obrigatório mas não foi encontrado", "success": False}
+                        {"error": f"Erro ao parsear CSV: {str(csv_error)}", "success": False}
                     ),
                     status_code=400,
                     mimetype="application/json",
                 )
+        # OPÇÃO 2: Recebeu JSON array (ofertas já parseadas)
         else:
-            logging.error("Coluna JiraKey não existe no DataFrame!")
-            return func.HttpResponse(
-                json.dumps({"error": "Coluna JiraKey não encontrada no CSV", "success": False}),
-                status_code=400,
-                mimetype="application/json",
-            )
+            logging.info("Recebido JSON array com %s ofertas", len(ofertas_jira))
+            df = pd.DataFrame(ofertas_jira)
 
-        # -------------------------------------------------------------
-        # 7. REMOVER COLUNAS QUE NÃO VÃO PARA SHAREPOINT
-        # -------------------------------------------------------------
-        cols_to_remove = ["JiraId", "Country"]
-        for col in cols_to_remove:
-            if col in df_clean.columns:
-                df_clean = df_clean.drop(columns=[col])
+        # Neste ponto, df já contém os dados (seja de CSV ou JSON)
+        df_clean = transform_jira_frame(
+            df, strip_html=STRIP_HTML_OBSERVACOES, assignee_directory=assignee_directory
+        )
+        del df
+
+        # Validar que JiraKey existe
+        erro_jirakey = validate_jirakey_column(df_clean)
+        if erro_jirakey:
+            return erro_jirakey
 
         # -------------------------------------------------------------
         # 8. LOG E RELATORIO DE ESTATISTICAS
         # -------------------------------------------------------------
-        null_counts = df_clean.isna().sum()
-        null_counts_dict = {k: int(v) for k, v in null_counts.to_dict().items()}
-        logging.info("Estatísticas de campos null após limpeza: %s", null_counts_dict)
-
-        choices_report = {}
-        for field in [
-            "Status",
-            "Mercado",
-            "TipoServico",
-            "TipoOportunidade",
-            "PraticaUnificada",
-            "StatusBudgetAlocado",
-        ]:
-            if field in df_clean.columns:
-                series = df_clean[field]
-                counts = series.value_counts(dropna=False)
-                valores = []
-                for val, count in counts.items():
-                    if pd.isna(val):
-                        clean_val = None
-                    else:
-                        clean_val = val
-                    valores.append(
-                        {"valor": to_native(clean_val), "quantidade": int(count)}
-                    )
-                choices_report[field] = {
-                    "total": int(series.shape[0]),
-                    "nulos": int(series.isna().sum()),
-                    "unicos": int(series.dropna().nunique()),
-                    "valores": valores,
-                }
+        estatisticas = build_import_statistics(
+            [summarize_jira_frame(df_clean)], df_clean.columns, arquivo_nome
+        )
 
         # Converter para lista de dicionários
-        ofertas_formatadas = df_clean.to_dict("records")
-        ofertas_formatadas = [
-            {k: to_native(v) for k, v in rec.items()} for rec in ofertas_formatadas
-        ]
-
-        # Estatísticas
-        total = len(ofertas_formatadas)
-        valor_eur_total = df_clean["ValorEUR"].sum() if "ValorEUR" in df_clean.columns else 0
-        valor_brl_total = df_clean["ValorBRL"].sum() if "ValorBRL" in df_clean.columns else 0
-
-        campos_ausentes = [
-            col for col in column_mapping.values() if col not in df_clean.columns
-        ]
+        ofertas_formatadas = jira_frame_records(df_clean)
 
         resultado = {
             "success": True,
             "ofertas": ofertas_formatadas,
-            "estatisticas": {
-                "total_processado": total,
-                "valor_eur_total": float(valor_eur_total),
-                "valor_brl_total": float(valor_brl_total),
-                "arquivo": arquivo_nome,
-                "data_processamento": datetime.now().isoformat(),
-                "campos_ausentes": campos_ausentes,
-                "null_counts": null_counts_dict,
-                "choices_report": choices_report,
-            },
+            "estatisticas": estatisticas,
         }
 
-        logging.info("Import JIRA concluído: %s ofertas processadas", total)
+        logging.info("Import JIRA concluído: %s ofertas processadas", len(ofertas_formatadas))
 
-        resultado = to_native_obj(resultado)
         return func.HttpResponse(
             json.dumps(resultado, ensure_ascii=False),
             status_code=200,
@@ -1978,19 +2888,479 @@ def import_jira(req: func.HttpRequest) -> func.HttpResponse:
         )
 
 
+def validate_jirakey_column(df_clean, all_null=None):
+    """Resposta 400 se JiraKey não existe ou está vazio em todas as linhas; senão None."""
+    if "JiraKey" not in df_clean.columns:
+        logging.error("Coluna JiraKey não existe no DataFrame!")
+        return func.HttpResponse(
+            json.dumps({"error": "Coluna JiraKey não encontrada no CSV", "success": False}),
+            status_code=400,
+            mimetype="application/json",
+        )
+    if all_null is None:
+        all_null = df_clean["JiraKey"].isna().all()
+    if all_null:
+        logging.error("JiraKey não encontrado ou todos vazios!")
+        return func.HttpResponse(
+            json.dumps(
+                {"error": "JiraKey é obrigatório mas não foi encontrado", "success": False}
+            ),
+            status_code=400,
+            mimetype="application/json",
+        )
+    return None
+
+
+def build_import_statistics(parts, columns, arquivo_nome):
+    """Bloco "estatisticas" do import-jira a partir das estatísticas parciais."""
+    resumo = merge_jira_summaries(parts)
+    logging.info("Estatísticas de campos null após limpeza: %s", resumo["null_counts"])
+    return {
+        "total_processado": resumo["total_processado"],
+        "valor_eur_total": resumo["valor_eur_total"],
+        "valor_brl_total": resumo["valor_brl_total"],
+        "arquivo": arquivo_nome,
+        "data_processamento": datetime.now().isoformat(),
+        "campos_ausentes": [
+            col for col in JIRA_COLUMN_MAPPING.values() if col not in columns
+        ],
+        "null_counts": resumo["null_counts"],
+        "choices_report": resumo["choices_report"],
+    }
+
+
+def process_jira_chunks(csv_content, ofertas_jira, chunk_size, sink, *, strip_html, assignee_directory):
+    """
+    Transforma o export chunk a chunk e entrega os registros de cada chunk a
+    sink(records); cada chunk é descartado depois disso.
+
+    Retorna (estatísticas parciais, colunas, None) ou (None, None, resposta de erro 400).
+    """
+    parts = []
+    columns = None
+    tem_jirakey = False
+
+    chunks = iter_jira_chunks(csv_content, ofertas_jira, chunk_size)
+    while True:
+        try:
+            chunk = next(chunks, None)
+        except Exception as csv_error:
+            logging.error("Erro parsing CSV: %s", str(csv_error))
+            return None, None, func.HttpResponse(
+                json.dumps({"error": f"Erro ao parsear CSV: {str(csv_error)}", "success": False}),
+                status_code=400,
+                mimetype="application/json",
+            )
+        if chunk is None:
+            break
+
+        df_clean = transform_jira_frame(
+            chunk, strip_html=strip_html, assignee_directory=assignee_directory
+        )
+        if "JiraKey" not in df_clean.columns:
+            return None, None, validate_jirakey_column(df_clean)
+        tem_jirakey = tem_jirakey or bool(df_clean["JiraKey"].notna().any())
+        if columns is None:
+            columns = list(df_clean.columns)
+
+        parts.append(summarize_jira_frame(df_clean))
+        sink(jira_frame_records(df_clean))
+        logging.info("Import JIRA: chunk %s processado (%s linhas)", len(parts), len(df_clean))
+
+    if not parts or not tem_jirakey:
+        erro = validate_jirakey_column(pd.DataFrame(columns=columns or []), all_null=True)
+        return None, None, erro
+    return parts, columns, None
+
+
+def import_jira_ndjson(csv_content, ofertas_jira, arquivo_nome, chunk_size, *, strip_html, assignee_directory):
+    """
+    import-jira em chunks: cada chunk é transformado, serializado e descartado,
+    então só a saída NDJSON cresce com o tamanho do export.
+
+    O HttpResponse não faz streaming: todas as linhas NDJSON ficam em memória
+    até o fim, e o pico é o texto serializado do export inteiro (sem os
+    DataFrames). Para limitar a memória use o formato "paginado".
+    """
+    linhas = []
+    parts, columns, erro = process_jira_chunks(
+        csv_content,
+        ofertas_jira,
+        chunk_size,
+        lambda records: linhas.extend(json.dumps(rec, ensure_ascii=False) for rec in records),
+        strip_html=strip_html,
+        assignee_directory=assignee_directory,
+    )
+    if erro:
+        return erro
+
+    estatisticas = build_import_statistics(parts, columns, arquivo_nome)
+    linhas.append(json.dumps({"success": True, "estatisticas": estatisticas}, ensure_ascii=False))
+    logging.info("Import JIRA (ndjson) concluído: %s ofertas processadas", estatisticas["total_processado"])
+
+    return func.HttpResponse(
+        "\n".join(linhas) + "\n",
+        status_code=200,
+        mimetype="application/x-ndjson",
+    )
+
+
+# =============================================================================
+# IMPORT JIRA PAGINADO - resultado persistido por import_id, lido por cursor
+# =============================================================================
+# O store é um SQLite local (IMPORT_STORE_PATH ou $HOME/data). No Azure, $HOME
+# é um compartilhamento SMB visto por todas as instâncias (é o que permite
+# ler as páginas em qualquer uma delas), mas o lock do SQLite não é confiável
+# sobre SMB: com mais de uma instância, limite a Function a uma
+# (WEBSITE_MAX_DYNAMIC_APPLICATION_SCALE_OUT=1). Apontar IMPORT_STORE_PATH para
+# o disco local evita o problema, mas aí import-jira/paginas só encontra
+# imports feitos pela mesma instância (404 nas demais).
+#
+# O cabeçalho em "imports" é gravado antes das páginas (total = -1 enquanto o
+# import está em andamento), então toda linha de import_ofertas sem cabeçalho
+# é órfã (worker reciclado no meio de um import) e é apagada na limpeza.
+
+IMPORT_PAGE_SIZE = get_env_int("IMPORT_PAGE_SIZE", 500)
+IMPORT_PAGE_SIZE_MAX = 5000
+IMPORT_STORE_TTL_HOURS = get_env_float("IMPORT_STORE_TTL_HOURS", 24.0)
+_IMPORT_STORE_LOCK = threading.Lock()
+
+
+def _open_import_store():
+    path = get_data_file_path("IMPORT_STORE_PATH", "import_jira.sqlite")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS imports (
+            import_id TEXT PRIMARY KEY,
+            criado_em REAL NOT NULL,
+            total INTEGER NOT NULL,
+            estatisticas TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS import_ofertas (
+            import_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            dados TEXT NOT NULL,
+            PRIMARY KEY (import_id, seq)
+        );
+        """
+    )
+    return conn
+
+
+def _purge_expired_imports(conn):
+    """Remove imports expirados (inclusive os que nunca terminaram) e páginas órfãs."""
+    limite = time.time() - IMPORT_STORE_TTL_HOURS * 3600
+    expirados = conn.execute("DELETE FROM imports WHERE criado_em < ?", (limite,)).rowcount
+    orfas = conn.execute(
+        """
+        DELETE FROM import_ofertas
+        WHERE NOT EXISTS (SELECT 1 FROM imports WHERE imports.import_id = import_ofertas.import_id)
+        """
+    ).rowcount
+    if expirados or orfas:
+        logging.info("Imports expirados removidos: %s (%s ofertas)", expirados, orfas)
+
+
+def parse_page_size(raw):
+    try:
+        page_size = int(raw) if raw not in (None, "") else IMPORT_PAGE_SIZE
+    except (TypeError, ValueError):
+        page_size = IMPORT_PAGE_SIZE
+    return max(1, min(page_size, IMPORT_PAGE_SIZE_MAX))
+
+
+def read_import_page(conn, import_id, cursor, page_size):
+    """Página de ofertas a partir do cursor (posição da próxima oferta)."""
+    rows = conn.execute(
+        "SELECT seq, dados FROM import_ofertas WHERE import_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+        (import_id, cursor, page_size + 1),
+    ).fetchall()
+    next_cursor = str(rows[page_size][0]) if len(rows) > page_size else None
+    return [json.loads(dados) for _, dados in rows[:page_size]], next_cursor
+
+
+def import_jira_paginado(csv_content, ofertas_jira, arquivo_nome, chunk_size, page_size, *, strip_html, assignee_directory):
+    """
+    Persiste o resultado transformado sob um import_id e devolve a primeira página;
+    as demais vêm de import-jira/paginas e as estatísticas de import-jira/estatisticas.
+    """
+    import_id = uuid.uuid4().hex
+    seq = 0
+
+    # O lock só cobre as escritas no SQLite: imports concorrentes transformam
+    # os chunks em paralelo e cada chunk é gravado em uma transação curta
+    conn = _open_import_store()
+    try:
+        with _IMPORT_STORE_LOCK, conn:
+            _purge_expired_imports(conn)
+            conn.execute(
+                "INSERT INTO imports (import_id, criado_em, total, estatisticas) VALUES (?, ?, -1, '{}')",
+                (import_id, time.time()),
+            )
+
+        def gravar(records):
+            nonlocal seq
+            rows = [
+                (import_id, seq + i, json.dumps(rec, ensure_ascii=False))
+                for i, rec in enumerate(records)
+            ]
+            with _IMPORT_STORE_LOCK, conn:
+                conn.executemany("INSERT INTO import_ofertas (import_id, seq, dados) VALUES (?, ?, ?)", rows)
+            seq += len(rows)
+
+        concluido = False
+        try:
+            parts, columns, erro = process_jira_chunks(
+                csv_content,
+                ofertas_jira,
+                chunk_size,
+                gravar,
+                strip_html=strip_html,
+                assignee_directory=assignee_directory,
+            )
+            if erro:
+                return erro
+
+            estatisticas = build_import_statistics(parts, columns, arquivo_nome)
+            with _IMPORT_STORE_LOCK, conn:
+                conn.execute(
+                    "UPDATE imports SET criado_em = ?, total = ?, estatisticas = ? WHERE import_id = ?",
+                    (time.time(), seq, json.dumps(estatisticas, ensure_ascii=False), import_id),
+                )
+            concluido = True
+        finally:
+            if not concluido:
+                # Descarta o cabeçalho e as páginas já gravadas deste import
+                with _IMPORT_STORE_LOCK, conn:
+                    conn.execute("DELETE FROM import_ofertas WHERE import_id = ?", (import_id,))
+                    conn.execute("DELETE FROM imports WHERE import_id = ?", (import_id,))
+
+        ofertas, next_cursor = read_import_page(conn, import_id, 0, page_size)
+    finally:
+        conn.close()
+
+    logging.info("Import JIRA (paginado) %s concluído: %s ofertas persistidas", import_id, seq)
+    resultado = {
+        "success": True,
+        "import_id": import_id,
+        "total_processado": seq,
+        "page_size": page_size,
+        "ofertas": ofertas,
+        "next_cursor": next_cursor,
+    }
+    return func.HttpResponse(
+        json.dumps(resultado, ensure_ascii=False),
+        status_code=200,
+        mimetype="application/json",
+    )
+
+
+def _import_request_param(req, name):
+    value = req.params.get(name)
+    if value is None:
+        try:
+            value = (req.get_json() or {}).get(name)
+        except ValueError:
+            value = None
+    return value
+
+
+def _load_import(conn, import_id):
+    row = conn.execute(
+        "SELECT total, estatisticas FROM imports WHERE import_id = ? AND total >= 0", (import_id,)
+    ).fetchone()
+    if row is None:
+        return None, func.HttpResponse(
+            json.dumps({"error": f"import_id '{import_id}' não encontrado ou expirado", "success": False}),
+            status_code=404,
+            mimetype="application/json",
+        )
+    return row, None
+
+
+@app.route(route="import-jira/paginas", auth_level=func.AuthLevel.FUNCTION)
+def import_jira_paginas(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Página de um import persistido (formato "paginado").
+    Input: import_id, cursor (default 0), page_size (default IMPORT_PAGE_SIZE)
+    Retorna: ofertas + next_cursor (null na última página)
+    """
+    try:
+        import_id = str(_import_request_param(req, "import_id") or "").strip()
+        if not import_id:
+            return func.HttpResponse(
+                json.dumps({"error": "import_id é obrigatório", "success": False}),
+                status_code=400,
+                mimetype="application/json",
+            )
+        try:
+            cursor = int(_import_request_param(req, "cursor") or 0)
+        except (TypeError, ValueError):
+            return func.HttpResponse(
+                json.dumps({"error": "cursor inválido", "success": False}),
+                status_code=400,
+                mimetype="application/json",
+            )
+        page_size = parse_page_size(_import_request_param(req, "page_size"))
+
+        conn = _open_import_store()
+        try:
+            row, erro = _load_import(conn, import_id)
+            if erro:
+                return erro
+            ofertas, next_cursor = read_import_page(conn, import_id, cursor, page_size)
+        finally:
+            conn.close()
+
+        resultado = {
+            "success": True,
+            "import_id": import_id,
+            "total_processado": row[0],
+            "cursor": str(cursor),
+            "page_size": page_size,
+            "ofertas": ofertas,
+            "next_cursor": next_cursor,
+        }
+        return func.HttpResponse(
+            json.dumps(resultado, ensure_ascii=False),
+            status_code=200,
+            mimetype="application/json",
+        )
+    except Exception as e:
+        logging.error("Erro ao ler página do import JIRA: %s", str(e))
+        return func.HttpResponse(
+            json.dumps({"error": str(e), "success": False}),
+            status_code=500,
+            mimetype="application/json",
+        )
+
+
+@app.route(route="import-jira/estatisticas", auth_level=func.AuthLevel.FUNCTION)
+def import_jira_estatisticas(req: func.HttpRequest) -> func.HttpResponse:
+    """Bloco de estatísticas de um import persistido. Input: import_id"""
+    try:
+        import_id = str(_import_request_param(req, "import_id") or "").strip()
+        if not import_id:
+            return func.HttpResponse(
+                json.dumps({"error": "import_id é obrigatório", "success": False}),
+                status_code=400,
+                mimetype="application/json",
+            )
+
+        conn = _open_import_store()
+        try:
+            row, erro = _load_import(conn, import_id)
+        finally:
+            conn.close()
+        if erro:
+            return erro
+
+        resultado = {
+            "success": True,
+            "import_id": import_id,
+            "estatisticas": json.loads(row[1]),
+        }
+        return func.HttpResponse(
+            json.dumps(resultado, ensure_ascii=False),
+            status_code=200,
+            mimetype="application/json",
+        )
+    except Exception as e:
+        logging.error("Erro ao ler estatísticas do import JIRA: %s", str(e))
+        return func.HttpResponse(
+            json.dumps({"error": str(e), "success": False}),
+            status_code=500,
+            mimetype="application/json",
+        )
+
+
+# =============================================================================
+# NORMALIZAR OFERTAS - TABELAS DE MAPEAMENTO VERSIONADAS
+# =============================================================================
+
+MAPPING_CACHE_MAX_ENTRIES = get_env_int("MAPPING_CACHE_MAX_ENTRIES", 16)
+
+_MAPPING_CACHE = OrderedDict()  # versao -> {campo: {valor_raw: valor_normalizado}}
+_MAPPING_CACHE_LOCK = threading.Lock()
+
+
+def mapping_set_version(mapeamentos):
+    """Hash estável do conjunto de mapeamentos (independe da ordem das chaves de cada item)."""
+    payload = json.dumps(mapeamentos, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def compile_choice_mappings(mapeamentos):
+    """
+    Tabelas {campo: {valor_raw: valor_normalizado}} de todos os campos do conjunto.
+    Aceita as grafias Campo/campo/Field/field (idem para raw e normalizado); itens
+    com Ativo=false ou raw nulo são ignorados e o último item de cada raw vence.
+    """
+    tables = {}
+    for item in mapeamentos:
+        field = item.get("Campo") or item.get("campo") or item.get("Field") or item.get("field")
+        raw_val = item.get("ValorRaw") or item.get("valor_raw") or item.get("Raw") or item.get("raw")
+        norm_val = (
+            item.get("ValorNormalizado")
+            or item.get("valor_normalizado")
+            or item.get("Normalizado")
+            or item.get("normalizado")
+        )
+        ativo = item.get("Ativo")
+        if ativo is None:
+            ativo = True
+        if field is None or not ativo:
+            continue
+        raw_key = normalize_choice_passthrough(raw_val)
+        if raw_key is None:
+            continue
+        tables.setdefault(field, {})[raw_key] = normalize_choice_passthrough(norm_val)
+    return tables
+
+
+def get_compiled_mappings(mapeamentos=None, versao=None):
+    """
+    Tabelas compiladas via LRU (MAPPING_CACHE_MAX_ENTRIES) por versão do conjunto.
+    Com `mapeamentos` compila (se ainda não estiver em cache) e devolve (versao, tabelas);
+    só com `versao` devolve (versao, None) quando ela não está em cache.
+    """
+    if mapeamentos is not None:
+        versao = mapping_set_version(mapeamentos)
+    with _MAPPING_CACHE_LOCK:
+        tables = _MAPPING_CACHE.get(versao)
+        if tables is not None:
+            _MAPPING_CACHE.move_to_end(versao)
+            return versao, tables
+    if mapeamentos is None:
+        return versao, None
+
+    tables = compile_choice_mappings(mapeamentos)
+    with _MAPPING_CACHE_LOCK:
+        _MAPPING_CACHE[versao] = tables
+        while len(_MAPPING_CACHE) > max(1, MAPPING_CACHE_MAX_ENTRIES):
+            _MAPPING_CACHE.popitem(last=False)
+    return versao, tables
+
+
 @app.route(route="normalizar-ofertas", auth_level=func.AuthLevel.FUNCTION)
 def normalizar_ofertas(req: func.HttpRequest) -> func.HttpResponse:
     """
     Normaliza dados RAW do SharePoint usando regras pre-aprovadas.
-    Recebe: ofertas_raw (array), mapeamentos (array)
-    Retorna: ofertas_normalizadas + relatorio de discrepancias
+    Recebe: ofertas_raw (array), mapeamentos (array) e/ou mapeamentos_versao
+    Retorna: ofertas_normalizadas + relatorio de discrepancias + mapeamentos_versao
+
+    mapeamentos_versao (devolvida em toda resposta) permite omitir `mapeamentos` nas
+    chamadas seguintes enquanto a tabela não mudar; versão desconhecida -> 409.
     """
     logging.info("Iniciando normalizacao de ofertas...")
 
     try:
         req_body = req.get_json()
         ofertas_raw = req_body.get("ofertas_raw", [])
-        mapeamentos = req_body.get("mapeamentos", [])
+        mapeamentos = req_body.get("mapeamentos")
+        mapeamentos_versao = req_body.get("mapeamentos_versao")
         unmapped_value = req_body.get("unmapped_value", "UNMAPPED/OUTROS")
         campos_choice = req_body.get(
             "campos_choice",
@@ -2012,118 +3382,91 @@ def normalizar_ofertas(req: func.HttpRequest) -> func.HttpResponse:
             )
 
         df_raw = pd.DataFrame(ofertas_raw)
+        normalize_value = normalize_choice_passthrough
 
-        NULL_VALUES = ["nan", "none", "null", "n/a", "na", "#n/a", "", " ", "-", "--", "undefined"]
-
-        def is_null_value(val):
-            if pd.isna(val) or val is None:
-                return True
-            if isinstance(val, str) and str(val).strip().lower() in NULL_VALUES:
-                return True
-            return False
-
-        def normalize_value(val):
-            if is_null_value(val):
-                return None
-            val_str = str(val).strip()
-            return val_str if val_str else None
-
-        # Monta mapeamento por campo
-        mapping_by_field = {field: {} for field in campos_choice}
-        used_mapping_keys = {field: set() for field in campos_choice}
-
-        for item in mapeamentos:
-            field = item.get("Campo") or item.get("campo") or item.get("Field") or item.get("field")
-            raw_val = item.get("ValorRaw") or item.get("valor_raw") or item.get("Raw") or item.get("raw")
-            norm_val = (
-                item.get("ValorNormalizado")
-                or item.get("valor_normalizado")
-                or item.get("Normalizado")
-                or item.get("normalizado")
+        # Tabelas de mapeamento compiladas, reaproveitadas por versao do conjunto
+        if mapeamentos is None and not mapeamentos_versao:
+            mapeamentos = []
+        versao, tables = get_compiled_mappings(mapeamentos, mapeamentos_versao)
+        if tables is None:
+            return func.HttpResponse(
+                json.dumps(
+                    {
+                        "error": "mapeamentos_versao desconhecida; reenvie mapeamentos",
+                        "mapeamentos_versao": versao,
+                        "success": False,
+                    },
+                    ensure_ascii=False,
+                ),
+                status_code=409,
+                mimetype="application/json",
             )
-            ativo = item.get("Ativo")
-            if ativo is None:
-                ativo = True
-            if field not in mapping_by_field or not ativo:
-                continue
-            raw_key = normalize_value(raw_val)
-            if raw_key is None:
-                continue
-            mapping_by_field[field][raw_key] = normalize_value(norm_val)
+        if mapeamentos is not None and mapeamentos_versao and mapeamentos_versao != versao:
+            logging.info("mapeamentos_versao %s substituida por %s", mapeamentos_versao, versao)
+        mapping_by_field = {field: tables.get(field, {}) for field in campos_choice}
 
-        # Relatorio de normalizacao
-        relatorio = {}
+        # Normalizacao coluna a coluna: cada valor distinto (categoria) e resolvido uma vez
+        # contra o mapeamento; linhas e contadores saem dos codigos da categoria
+        df_norm = df_raw.copy()
+        relatorio_formatado = {}
+        mapeamentos_nao_usados = {}
         for field in campos_choice:
-            relatorio[field] = {
+            mapping = mapping_by_field[field]
+            stats = {
                 "total": 0,
                 "nulos": 0,
                 "mapeados": 0,
                 "nao_mapeados": 0,
-                "valores_nao_mapeados": {},
-                "valores_mapeados": {},
+                "valores_nao_mapeados": [],
+                "valores_mapeados": [],
             }
+            used_keys = set()
+
+            if field in df_raw.columns:
+                encoded = encode_choice_column(df_raw[field], normalize_value)
+                codes = encoded.cat.codes.to_numpy()
+                keys = list(encoded.cat.categories)
+                counts = np.bincount(codes[codes >= 0], minlength=len(keys)).tolist()
+
+                valores_mapeados = {}
+                valores_nao_mapeados = {}
+                saida = []
+                # Categorias na ordem da primeira ocorrencia: os relatorios mantem a ordem das linhas
+                for key, quantidade in zip(keys, counts):
+                    if key in mapping:
+                        mapped_val = mapping[key]
+                        used_keys.add(key)
+                        stats["mapeados"] += quantidade
+                        valores_mapeados[mapped_val] = valores_mapeados.get(mapped_val, 0) + quantidade
+                        saida.append(mapped_val)
+                    else:
+                        stats["nao_mapeados"] += quantidade
+                        valores_nao_mapeados[key] = quantidade
+                        saida.append(unmapped_value)
+
+                # Ultima posicao atende o codigo -1 (nulo)
+                df_norm[field] = np.array(saida + [None], dtype=object)[codes]
+                stats["total"] = len(codes)
+                stats["nulos"] = int((codes < 0).sum())
+                stats["valores_nao_mapeados"] = [
+                    {"valor": k, "quantidade": v} for k, v in valores_nao_mapeados.items()
+                ]
+                stats["valores_mapeados"] = [
+                    {"valor": k, "quantidade": v} for k, v in valores_mapeados.items()
+                ]
 
-        ofertas_normalizadas = []
-        for rec in df_raw.to_dict("records"):
-            rec_norm = dict(rec)
-            for field in campos_choice:
-                if field not in rec:
-                    continue
-                relatorio[field]["total"] += 1
-                raw_val = rec.get(field)
-                raw_key = normalize_value(raw_val)
-                if raw_key is None:
-                    relatorio[field]["nulos"] += 1
-                    rec_norm[field] = None
-                    continue
-                if raw_key in mapping_by_field.get(field, {}):
-                    mapped_val = mapping_by_field[field][raw_key]
-                    used_mapping_keys[field].add(raw_key)
-                    relatorio[field]["mapeados"] += 1
-                    mapped_key = mapped_val if mapped_val is not None else None
-                    relatorio[field]["valores_mapeados"][mapped_key] = (
-                        relatorio[field]["valores_mapeados"].get(mapped_key, 0) + 1
-                    )
-                    rec_norm[field] = mapped_val
-                else:
-                    relatorio[field]["nao_mapeados"] += 1
-                    relatorio[field]["valores_nao_mapeados"][raw_key] = (
-                        relatorio[field]["valores_nao_mapeados"].get(raw_key, 0) + 1
-                    )
-                    rec_norm[field] = unmapped_value
-            ofertas_normalizadas.append(rec_norm)
-
-        # Mapeamentos nao utilizados
-        mapeamentos_nao_usados = {}
-        for field, mapping in mapping_by_field.items():
-            unused = [k for k in mapping.keys() if k not in used_mapping_keys[field]]
+            relatorio_formatado[field] = stats
+            unused = [k for k in mapping.keys() if k not in used_keys]
             if unused:
                 mapeamentos_nao_usados[field] = unused
 
-        # Formata relatorio
-        relatorio_formatado = {}
-        for field, stats in relatorio.items():
-            relatorio_formatado[field] = {
-                "total": stats["total"],
-                "nulos": stats["nulos"],
-                "mapeados": stats["mapeados"],
-                "nao_mapeados": stats["nao_mapeados"],
-                "valores_nao_mapeados": [
-                    {"valor": k, "quantidade": v}
-                    for k, v in stats["valores_nao_mapeados"].items()
-                ],
-                "valores_mapeados": [
-                    {"valor": k, "quantidade": v}
-                    for k, v in stats["valores_mapeados"].items()
-                ],
-            }
+        ofertas_normalizadas = df_norm.to_dict("records")
 
         resultado = {
             "success": True,
             "unmapped_value": unmapped_value,
-            "ofertas_normalizadas": [
-                {k: to_native(v) for k, v in rec.items()} for rec in ofertas_normalizadas
-            ],
+            "mapeamentos_versao": versao,
+            "ofertas_normalizadas": ofertas_normalizadas,
             "relatorio": {
                 "total_processado": len(ofertas_normalizadas),
                 "campos_choice": campos_choice,
@@ -2132,6 +3475,7 @@ def normalizar_ofertas(req: func.HttpRequest) -> func.HttpResponse:
             },
         }
 
+        # Colunas repassadas das ofertas trazem NaN onde a chave faltava (vira null)
         resultado = to_native_obj(resultado)
         return func.HttpResponse(
             json.dumps(resultado, ensure_ascii=False),
@@ -2148,6 +3492,300 @@ def normalizar_ofertas(req: func.HttpRequest) -> func.HttpResponse:
         )
 
 
+# =============================================================================
+# HTTP CLIENT - keep-alive connection pool per host (Graph, Power BI, Entra ID)
+# =============================================================================
+
+HTTP_POOL_SIZE = get_env_int("HTTP_POOL_SIZE", 10)
+GRAPH_TIMEOUT_SECONDS = get_env_float("GRAPH_TIMEOUT_SECONDS", 60.0)
+PBI_TIMEOUT_SECONDS = get_env_float("PBI_TIMEOUT_SECONDS", 30.0)
+TOKEN_TIMEOUT_SECONDS = get_env_float("TOKEN_TIMEOUT_SECONDS", 30.0)
+HTTP_MAX_REDIRECTS = 5
+
+_HTTP_POOLS = {}  # host -> deque of idle HTTPSConnection
+_HTTP_METRICS = {}  # host -> {"calls", "errors", "total_ms", "max_ms"}
+_HTTP_LOCK = threading.Lock()
+
+# Errors that mean an idle keep-alive connection was closed by the server
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+# Methods that may be replayed after the request already reached the server
+_REPLAYABLE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+def _http_proxy(host):
+    """(proxy host, port, tunnel headers) from HTTPS_PROXY / NO_PROXY, as urlopen used them; None for direct."""
+    proxy = getproxies().get("https")
+    if not proxy or proxy_bypass(host):
+        return None
+    parsed = urlparse(proxy if "://" in proxy else f"http://{proxy}")
+    headers = {}
+    if parsed.username:
+        credentials = f"{unquote(parsed.username)}:{unquote(parsed.password or '')}"
+        headers["Proxy-Authorization"] = "Basic " + base64.b64encode(credentials.encode()).decode("ascii")
+    return parsed.hostname, parsed.port, headers
+
+
+def _http_connect(host, timeout):
+    proxy = _http_proxy(host)
+    if proxy is None:
+        return http.client.HTTPSConnection(host, timeout=timeout)
+    proxy_host, proxy_port, proxy_headers = proxy
+    conn = http.client.HTTPSConnection(proxy_host, proxy_port, timeout=timeout)
+    conn.set_tunnel(host, headers=proxy_headers)
+    return conn
+
+
+def _http_checkout(host, timeout):
+    with _HTTP_LOCK:
+        pool = _HTTP_POOLS.get(host)
+        conn = pool.pop() if pool else None
+    if conn is None:
+        return _http_connect(host, timeout), False
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+    return conn, True
+
+
+def _http_checkin(host, conn):
+    with _HTTP_LOCK:
+        pool = _HTTP_POOLS.setdefault(host, deque())
+        if len(pool) < HTTP_POOL_SIZE:
+            pool.append(conn)
+            return
+    conn.close()
+
+
+def _http_record(host, elapsed_ms, failed):
+    with _HTTP_LOCK:
+        stats = _HTTP_METRICS.setdefault(host, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        stats["errors"] += int(failed)
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+
+def get_http_metrics():
+    """Per-host call count, error count and latency (ms) since the worker started."""
+    with _HTTP_LOCK:
+        return {
+            host: {
+                "calls": s["calls"],
+                "errors": s["errors"],
+                "avg_ms": round(s["total_ms"] / s["calls"], 1) if s["calls"] else 0.0,
+                "max_ms": round(s["max_ms"], 1),
+                "idle_connections": len(_HTTP_POOLS.get(host) or ()),
+            }
+            for host, s in _HTTP_METRICS.items()
+        }
+
+
+def http_request(method, url, headers=None, data=None, timeout=30):
+    """
+    HTTPS request over a pooled keep-alive connection (through HTTPS_PROXY when set).
+    Returns (status, response headers, body bytes); HTTP errors are returned, not raised.
+    """
+    for _ in range(HTTP_MAX_REDIRECTS + 1):
+        parsed = urlparse(url)
+        host = parsed.netloc
+        target = parsed.path or "/"
+        if parsed.query:
+            target = f"{target}?{parsed.query}"
+
+        conn, reused = _http_checkout(host, timeout)
+        start = time.perf_counter()
+        failed = True
+        try:
+            sent = False
+            try:
+                conn.request(method, target, body=data, headers=headers or {})
+                sent = True
+                resp = conn.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                # The server dropped the idle connection: retry once on a fresh one, unless
+                # the request already went out and replaying it could apply it twice
+                if not reused or (sent and method.upper() not in _REPLAYABLE_METHODS):
+                    raise
+                conn.close()
+                conn = _http_connect(host, timeout)
+                conn.request(method, target, body=data, headers=headers or {})
+                resp = conn.getresponse()
+            resp_body = resp.read()
+            failed = resp.status >= 400
+        except Exception:
+            conn.close()
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            _http_record(host, elapsed_ms, failed)
+            logging.debug("HTTP %s %s%s -> %.0f ms", method, host, parsed.path, elapsed_ms)
+
+        if resp.will_close:
+            conn.close()
+        else:
+            _http_checkin(host, conn)
+
+        location = resp.getheader("Location")
+        if resp.status in (301, 302, 303, 307, 308) and location:
+            url = urljoin(url, location)
+            if resp.status == 303 or (resp.status in (301, 302) and method == "POST"):
+                method, data = "GET", None
+            continue
+        return resp.status, resp.headers, resp_body
+
+    raise RuntimeError(f"Too many redirects: {url}")
+
+
+# =============================================================================
+# RETRY / RATE LIMITING - shared by graph_request and pbi_request
+# =============================================================================
+
+HTTP_RETRY_MAX_ATTEMPTS = get_env_int("HTTP_RETRY_MAX_ATTEMPTS", 4)
+HTTP_RETRY_BASE_SECONDS = get_env_float("HTTP_RETRY_BASE_SECONDS", 0.5)
+HTTP_RETRY_MAX_SECONDS = get_env_float("HTTP_RETRY_MAX_SECONDS", 30.0)
+
+# 429/503 mean the request was rejected before processing, so any method may be retried.
+# Other 5xx and network errors are only retried for idempotent methods.
+_RETRY_ANY_METHOD_STATUS = {429, 503}
+_RETRY_IDEMPOTENT_STATUS = {500, 502, 504}
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+_RETRYABLE_ERRORS = (OSError, http.client.HTTPException)  # timeouts, resets, DNS, TLS
+
+# Adaptive token bucket per API: the rate is halved on every throttle and grows
+# back by a small step on each success, never above the configured ceiling.
+RATE_LIMIT_MAX_RPS = {
+    "graph": get_env_float("GRAPH_MAX_RPS", 20.0),
+    "pbi": get_env_float("PBI_MAX_RPS", 10.0),
+}
+RATE_LIMIT_MIN_RPS = 0.5
+RATE_LIMIT_RECOVERY_STEP = 0.05  # fraction of the ceiling regained per success
+
+_RATE_LIMITS = {}  # api -> {"rate", "tokens", "updated", "paused_until", "throttled", "retries"}
+_RATE_LIMIT_LOCK = threading.Lock()
+
+
+def _rate_limit_state(api):
+    state = _RATE_LIMITS.get(api)
+    if state is None:
+        ceiling = RATE_LIMIT_MAX_RPS.get(api, 10.0)
+        state = _RATE_LIMITS[api] = {
+            "rate": ceiling,
+            "tokens": ceiling,
+            "updated": time.monotonic(),
+            "paused_until": 0.0,
+            "throttled": 0,
+            "retries": 0,
+        }
+    return state
+
+
+def rate_limit_acquire(api):
+    """Block until the API's token bucket allows one more request."""
+    while True:
+        with _RATE_LIMIT_LOCK:
+            state = _rate_limit_state(api)
+            now = time.monotonic()
+            capacity = max(1.0, state["rate"])
+            state["tokens"] = min(capacity, state["tokens"] + (now - state["updated"]) * state["rate"])
+            state["updated"] = now
+            if now >= state["paused_until"] and state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return
+            wait = max(state["paused_until"] - now, (1 - state["tokens"]) / state["rate"])
+        time.sleep(wait)
+
+
+def rate_limit_feedback(api, throttled=False, pause_seconds=0.0):
+    """
+    Adjust the API's rate after a response.
+    A throttle halves the rate and pauses every caller for pause_seconds;
+    a success slowly restores it.
+    """
+    with _RATE_LIMIT_LOCK:
+        state = _rate_limit_state(api)
+        ceiling = RATE_LIMIT_MAX_RPS.get(api, 10.0)
+        if throttled:
+            state["throttled"] += 1
+            state["rate"] = max(RATE_LIMIT_MIN_RPS, state["rate"] / 2)
+            state["tokens"] = min(state["tokens"], 0.0)
+        elif state["rate"] < ceiling:
+            state["rate"] = min(ceiling, state["rate"] + ceiling * RATE_LIMIT_RECOVERY_STEP)
+        if pause_seconds > 0:
+            state["paused_until"] = max(state["paused_until"], time.monotonic() + pause_seconds)
+
+
+def get_rate_limit_state():
+    """Current rate (req/s), throttle and retry counts per API."""
+    with _RATE_LIMIT_LOCK:
+        return {
+            api: {"rate_rps": round(s["rate"], 2), "throttled": s["throttled"], "retries": s["retries"]}
+            for api, s in _RATE_LIMITS.items()
+        }
+
+
+def parse_retry_after(value):
+    """Retry-After header as seconds (delta-seconds or HTTP-date); None when absent/invalid."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def retry_backoff_seconds(attempt):
+    """Exponential backoff with full jitter for the given (1-based) attempt."""
+    ceiling = min(HTTP_RETRY_MAX_SECONDS, HTTP_RETRY_BASE_SECONDS * (2 ** attempt))
+    return random.uniform(HTTP_RETRY_BASE_SECONDS, max(HTTP_RETRY_BASE_SECONDS, ceiling))
+
+
+def api_request(api, method, url, headers=None, data=None, timeout=30, max_attempts=None):
+    """
+    http_request behind the API's rate limiter, retrying throttled and transient failures.
+
+    Honors Retry-After on 429/503; otherwise backs off exponentially with jitter.
+    The waits of one call add up to at most HTTP_RETRY_MAX_SECONDS: a Retry-After
+    beyond what is left is not slept, the 429/503 goes back to the caller.
+    Returns (status, response headers, body bytes) of the last attempt.
+    """
+    max_attempts = max_attempts or HTTP_RETRY_MAX_ATTEMPTS
+    idempotent = method.upper() in _IDEMPOTENT_METHODS
+    budget = HTTP_RETRY_MAX_SECONDS
+    for attempt in range(1, max_attempts + 1):
+        rate_limit_acquire(api)
+        try:
+            status, resp_headers, raw = http_request(method, url, headers=headers, data=data, timeout=timeout)
+        except _RETRYABLE_ERRORS as exc:
+            if not idempotent or attempt == max_attempts or budget <= 0:
+                raise
+            wait = min(retry_backoff_seconds(attempt), budget)
+            logging.warning("%s %s %s failed (%s), retry %s in %.1fs", api, method, url, exc, attempt, wait)
+        else:
+            retryable = status in _RETRY_ANY_METHOD_STATUS or (idempotent and status in _RETRY_IDEMPOTENT_STATUS)
+            if not retryable:
+                rate_limit_feedback(api)
+                return status, resp_headers, raw
+            retry_after = parse_retry_after(resp_headers.get("Retry-After")) if status in _RETRY_ANY_METHOD_STATUS else None
+            pause = min(retry_after or 0.0, HTTP_RETRY_MAX_SECONDS)
+            rate_limit_feedback(api, throttled=status == 429, pause_seconds=pause)
+            if attempt == max_attempts or budget <= 0 or (retry_after is not None and retry_after > budget):
+                return status, resp_headers, raw
+            wait = retry_after if retry_after is not None else min(retry_backoff_seconds(attempt), budget)
+            logging.warning("%s %s %s -> %s, retry %s in %.1fs", api, method, url, status, attempt, wait)
+
+        with _RATE_LIMIT_LOCK:
+            _rate_limit_state(api)["retries"] += 1
+        budget -= wait
+        time.sleep(wait)
+
+
 def get_required_env(name):
     value = os.environ.get(name)
     if not value:
@@ -2155,10 +3793,20 @@ def get_required_env(name):
     return value
 
 
-def get_graph_token():
-    tenant_id = get_required_env("SP_TENANT_ID")
-    client_id = get_required_env("SP_CLIENT_ID")
-    client_secret = get_required_env("SP_CLIENT_SECRET")
+# Tokens are reused until TOKEN_EXPIRY_SKEW_SECONDS before expiry; inside the
+# last TOKEN_REFRESH_AHEAD_SECONDS the cached token is still served while a
+# background thread fetches the next one.
+TOKEN_EXPIRY_SKEW_SECONDS = 60
+TOKEN_REFRESH_AHEAD_SECONDS = get_env_int("TOKEN_REFRESH_AHEAD_SECONDS", 300)
+
+_TOKEN_CACHE = {}  # (tenant_id, client_id, scope) -> {"token": str, "expires_at": monotonic}
+_TOKEN_KEY_LOCKS = {}
+_TOKEN_REFRESHING = set()
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+
+def request_client_credentials_token(tenant_id, client_id, client_secret, scope):
+    """POST client_credentials to Entra ID; returns (access_token, expires_in seconds)."""
     token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
 
     data = urlencode(
@@ -2166,29 +3814,99 @@ def get_graph_token():
             "grant_type": "client_credentials",
             "client_id": client_id,
             "client_secret": client_secret,
-            "scope": "https://graph.microsoft.com/.default",
+            "scope": scope,
         }
     ).encode("utf-8")
 
-    req = Request(
+    status, _, resp_body = http_request(
+        "POST",
         token_url,
-        data=data,
         headers={"Content-Type": "application/x-www-form-urlencoded"},
-        method="POST",
+        data=data,
+        timeout=TOKEN_TIMEOUT_SECONDS,
     )
-    try:
-        with urlopen(req, timeout=30) as resp:
-            payload = json.loads(resp.read().decode("utf-8"))
-    except HTTPError as exc:
-        body = exc.read().decode("utf-8")
-        raise RuntimeError(f"Token request failed ({exc.code}): {body}") from exc
+    if status >= 400:
+        raise RuntimeError(f"Token request failed ({status}): {resp_body.decode('utf-8')}")
+    payload = json.loads(resp_body.decode("utf-8"))
 
     access_token = payload.get("access_token")
     if not access_token:
         raise RuntimeError("Token response missing access_token")
+    return access_token, int(payload.get("expires_in") or 3600)
+
+
+def _token_key_lock(key):
+    with _TOKEN_CACHE_LOCK:
+        return _TOKEN_KEY_LOCKS.setdefault(key, threading.Lock())
+
+
+def _refresh_cached_token(key, client_secret):
+    tenant_id, client_id, scope = key
+    access_token, expires_in = request_client_credentials_token(tenant_id, client_id, client_secret, scope)
+    _TOKEN_CACHE[key] = {"token": access_token, "expires_at": time.monotonic() + expires_in}
+    logging.info("Token renewed for scope %s (expires in %ss)", scope, expires_in)
     return access_token
 
 
+def _schedule_token_refresh(key, client_secret):
+    with _TOKEN_CACHE_LOCK:
+        if key in _TOKEN_REFRESHING:
+            return
+        _TOKEN_REFRESHING.add(key)
+
+    def run():
+        try:
+            with _token_key_lock(key):
+                _refresh_cached_token(key, client_secret)
+        except Exception as exc:
+            logging.warning("Background token refresh failed for scope %s: %s", key[2], str(exc))
+        finally:
+            with _TOKEN_CACHE_LOCK:
+                _TOKEN_REFRESHING.discard(key)
+
+    threading.Thread(target=run, name="token-refresh", daemon=True).start()
+
+
+def get_client_credentials_token(tenant_id, client_id, client_secret, scope, rejected_token=None):
+    """
+    Process-wide cached client-credentials token keyed by (tenant, client, scope).
+    Concurrent callers share one token request per key.
+
+    rejected_token: a token the API answered 401 for; if it is still the cached
+    one it is renewed (once, whatever the number of callers reporting it).
+    """
+    key = (tenant_id, client_id, scope)
+
+    def usable(entry):
+        return (
+            entry
+            and entry["token"] != rejected_token
+            and entry["expires_at"] - TOKEN_EXPIRY_SKEW_SECONDS > time.monotonic()
+        )
+
+    entry = _TOKEN_CACHE.get(key)
+    if usable(entry):
+        if entry["expires_at"] - TOKEN_REFRESH_AHEAD_SECONDS <= time.monotonic():
+            _schedule_token_refresh(key, client_secret)
+        return entry["token"]
+
+    with _token_key_lock(key):
+        # Another caller may have refreshed it while we waited for the lock
+        entry = _TOKEN_CACHE.get(key)
+        if usable(entry):
+            return entry["token"]
+        return _refresh_cached_token(key, client_secret)
+
+
+def get_graph_token():
+    tenant_id = get_required_env("SP_TENANT_ID")
+    client_id = get_required_env("SP_CLIENT_ID")
+    client_secret = get_required_env("SP_CLIENT_SECRET")
+    return get_client_credentials_token(
+        tenant_id, client_id, client_secret, "https://graph.microsoft.com/.default"
+    )
+
+
 def graph_request(method, path_or_url, token, body=None, extra_headers=None):
     if path_or_url.startswith("https://"):
         url = path_or_url
@@ -2204,29 +3922,210 @@ def graph_request(method, path_or_url, token, body=None, extra_headers=None):
         headers["Content-Type"] = "application/json"
         data = json.dumps(body, ensure_ascii=False).encode("utf-8")
 
-    req = Request(url, data=data, headers=headers, method=method)
+    status, _, raw = api_request("graph", method, url, headers=headers, data=data, timeout=GRAPH_TIMEOUT_SECONDS)
+    resp_body = raw.decode("utf-8")
+    if status >= 400:
+        raise RuntimeError(f"Graph API error ({status}): {resp_body}")
+    return status, resp_body
+
+
+def resolve_sharepoint_site_id(site_url, token):
+    parsed = urlparse(site_url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc or not parsed.path:
+        raise ValueError("Invalid SP_SITE_URL (expected https://<tenant>.sharepoint.com/sites/<site>)")
+
+    # Graph expects: /sites/{hostname}:{server-relative-path}
+    path = parsed.path.rstrip("/")
+    status, body = graph_request("GET", f"/sites/{parsed.netloc}:{path}", token)
+    payload = json.loads(body or "{}")
+    site_id = payload.get("id")
+    if not site_id:
+        raise RuntimeError("Graph response missing site id")
+    return site_id
+
+
+_GUID_RE = re.compile(r"^[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}$")
+
+# Resolved SharePoint ids, persisted to SP_RESOLVER_CACHE_PATH:
+# {"sites": {site_url: site_id}, "lists": {"<site_id>|<list name>": list_id}}
+_SP_IDS = None
+_SP_IDS_LOCK = threading.Lock()
+
+
+def get_sp_resolver_cache_path():
+    return get_data_file_path("SP_RESOLVER_CACHE_PATH", "sharepoint_ids.json")
+
+
+def _sp_ids():
+    global _SP_IDS
+    if _SP_IDS is None:
+        try:
+            with open(get_sp_resolver_cache_path(), encoding="utf-8") as fh:
+                loaded = json.load(fh)
+        except (OSError, ValueError):
+            loaded = {}
+        _SP_IDS = {"sites": dict(loaded.get("sites") or {}), "lists": dict(loaded.get("lists") or {})}
+    return _SP_IDS
+
+
+def _save_sp_ids():
+    path = get_sp_resolver_cache_path()
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(_SP_IDS, fh, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as exc:
+        logging.warning("Could not persist SharePoint id cache to %s: %s", path, str(exc))
+
+
+def is_graph_not_found(exc):
+    return str(exc).startswith("Graph API error (404)")
+
+
+def get_sharepoint_site_id(token):
+    """SP_SITE_ID, or SP_SITE_URL resolved once and memoized (memory + local file)."""
+    site_id = os.environ.get("SP_SITE_ID")
+    if site_id:
+        return site_id
+    site_url = get_required_env("SP_SITE_URL").strip().rstrip("/")
+    key = site_url.lower()
+    with _SP_IDS_LOCK:
+        site_id = _sp_ids()["sites"].get(key)
+    if site_id:
+        return site_id
+    site_id = resolve_sharepoint_site_id(site_url, token)
+    with _SP_IDS_LOCK:
+        _sp_ids()["sites"][key] = site_id
+        _save_sp_ids()
+    return site_id
+
+
+def resolve_sharepoint_list_id(site_id, list_ref, token):
+    """List GUID (lowercase) for a GUID or list name, memoized per site."""
+    cleaned = list_ref.strip().strip("{}")
+    if _GUID_RE.match(cleaned):
+        return cleaned.lower()
+    key = f"{site_id}|{cleaned.lower()}"
+    with _SP_IDS_LOCK:
+        list_id = _sp_ids()["lists"].get(key)
+    if list_id:
+        return list_id
+    _, resp_body = graph_request("GET", f"/sites/{site_id}/lists/{quote(cleaned)}?$select=id", token)
+    list_id = (json.loads(resp_body or "{}").get("id") or "").lower()
+    if not list_id:
+        raise RuntimeError(f"Graph response missing list id for {cleaned}")
+    with _SP_IDS_LOCK:
+        _sp_ids()["lists"][key] = list_id
+        _save_sp_ids()
+    return list_id
+
+
+def forget_sharepoint_ids(site_id, list_id=None):
+    """
+    Drop memoized ids after Graph answered 404 for them.
+    With list_id only that list's names are dropped; otherwise the site and all its lists.
+    """
+    with _SP_IDS_LOCK:
+        ids = _sp_ids()
+        if list_id is None:
+            ids["sites"] = {url: sid for url, sid in ids["sites"].items() if sid != site_id}
+        prefix = f"{site_id}|"
+        ids["lists"] = {
+            key: lid
+            for key, lid in ids["lists"].items()
+            if not (key.startswith(prefix) and (list_id is None or lid == list_id))
+        }
+        _save_sp_ids()
+
+
+def forget_sharepoint_ids_after_404(site_id, token, list_id=None):
+    """
+    After a Graph 404 under site_id: check whether the site itself still resolves.
+    A missing site drops the site and all its lists; otherwise only list_id (if given).
+    """
     try:
-        with urlopen(req, timeout=60) as resp:
-            resp_body = resp.read().decode("utf-8")
-            return resp.status, resp_body
-    except HTTPError as exc:
-        resp_body = exc.read().decode("utf-8")
-        raise RuntimeError(f"Graph API error ({exc.code}): {resp_body}") from exc
+        graph_request("GET", f"/sites/{site_id}?$select=id", token)
+    except RuntimeError as exc:
+        if is_graph_not_found(exc):
+            logging.warning("SharePoint site %s not found, dropping memoized ids", site_id)
+            forget_sharepoint_ids(site_id)
+            return
+        logging.warning("Could not check SharePoint site %s after 404: %s", site_id, str(exc))
+    if list_id:
+        forget_sharepoint_ids(site_id, list_id)
 
 
-def resolve_sharepoint_site_id(site_url, token):
-    parsed = urlparse(site_url)
-    if parsed.scheme not in ("http", "https") or not parsed.netloc or not parsed.path:
-        raise ValueError("Invalid SP_SITE_URL (expected https://<tenant>.sharepoint.com/sites/<site>)")
+GRAPH_BATCH_MAX_REQUESTS = 20  # Graph JSON batching limit
+GRAPH_BATCH_MAX_ATTEMPTS = 4
+_GRAPH_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
-    # Graph expects: /sites/{hostname}:{server-relative-path}
-    path = parsed.path.rstrip("/")
-    status, body = graph_request("GET", f"/sites/{parsed.netloc}:{path}", token)
-    payload = json.loads(body or "{}")
-    site_id = payload.get("id")
-    if not site_id:
-        raise RuntimeError("Graph response missing site id")
-    return site_id
+
+def graph_batch_delete(paths, token, max_attempts=GRAPH_BATCH_MAX_ATTEMPTS):
+    """
+    DELETE each Graph path through $batch (up to 20 per request).
+
+    Throttled/transient operations (429/5xx) are retried in later rounds,
+    waiting for the largest Retry-After seen. On a retry a 404 counts as deleted,
+    since the earlier attempt may have gone through. Only 429 and 503 with
+    Retry-After pause the other Graph callers. Returns (deleted, {path: error}).
+    """
+    pending = list(paths)
+    failures = {}
+    deleted = 0
+
+    for attempt in range(1, max_attempts + 1):
+        retry = []
+        retry_after = 0.0
+        shared_pause = 0.0
+        throttled = False
+        for start in range(0, len(pending), GRAPH_BATCH_MAX_REQUESTS):
+            chunk = pending[start:start + GRAPH_BATCH_MAX_REQUESTS]
+            batch = {
+                "requests": [
+                    {"id": str(i), "method": "DELETE", "url": path} for i, path in enumerate(chunk)
+                ]
+            }
+            try:
+                _, resp_body = graph_request("POST", "/$batch", token, batch)
+                responses = {r.get("id"): r for r in json.loads(resp_body or "{}").get("responses", [])}
+            except Exception as exc:
+                # The whole batch failed: retry every operation in it
+                logging.warning("Graph $batch request failed (attempt %s): %s", attempt, str(exc))
+                for path in chunk:
+                    failures[path] = str(exc)
+                retry.extend(chunk)
+                continue
+
+            for i, path in enumerate(chunk):
+                resp = responses.get(str(i)) or {}
+                status = resp.get("status")
+                if status is not None and (200 <= status < 300 or (attempt > 1 and status == 404)):
+                    deleted += 1
+                    failures.pop(path, None)
+                    continue
+                failures[path] = f"Graph API error ({status}): {json.dumps(resp.get('body'), ensure_ascii=False)}"
+                if status is None or status in _GRAPH_RETRYABLE_STATUS:
+                    retry.append(path)
+                    throttled = throttled or status == 429
+                    headers = {k.lower(): v for k, v in (resp.get("headers") or {}).items()}
+                    path_retry_after = parse_retry_after(headers.get("retry-after"))
+                    retry_after = max(retry_after, path_retry_after or 0.0)
+                    if status == 429 or (status == 503 and path_retry_after is not None):
+                        shared_pause = max(shared_pause, path_retry_after or 0.0)
+
+        pending = retry
+        if not pending or attempt == max_attempts:
+            break
+        wait = min(retry_after or retry_backoff_seconds(attempt), HTTP_RETRY_MAX_SECONDS)
+        logging.info("Graph $batch: %s operations to retry in %.1fs", len(pending), wait)
+        if throttled or shared_pause:
+            # Graph is throttling: pause every Graph caller (other purge workers included)
+            rate_limit_feedback("graph", throttled=throttled, pause_seconds=min(shared_pause, wait) or wait)
+        time.sleep(wait)
+
+    return deleted, failures
 
 
 def get_env_bool(name, default=False):
@@ -2236,6 +4135,20 @@ def get_env_bool(name, default=False):
     return str(raw).strip().lower() in ("1", "true", "yes", "y", "on")
 
 
+def parse_bool_param(value, default=False):
+    """Body/query flag: bools as-is, "true"/"false"-style strings parsed, anything else -> default."""
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return default
+    cleaned = str(value).strip().lower()
+    if cleaned in ("1", "true", "yes", "y", "on", "sim", "s"):
+        return True
+    if cleaned in ("0", "false", "no", "n", "off", "nao", "não"):
+        return False
+    return default
+
+
 def parse_csv_env_set(name):
     raw = os.environ.get(name, "")
     items = []
@@ -2246,6 +4159,59 @@ def parse_csv_env_set(name):
     return set(items)
 
 
+LAB_PURGE_MAX_WORKERS = get_env_int("LAB_PURGE_MAX_WORKERS", 3)
+
+
+def purge_list_items(site_id, list_id, token, max_items, dry_run):
+    """Enumerate and (unless dry_run) delete the items of one list; returns its report entry."""
+    # Enumerate up to max_items + 1 so we can stop safely.
+    item_ids = []
+    next_link = f"/sites/{site_id}/lists/{list_id}/items?$top=999"
+    while next_link:
+        try:
+            _, resp_body = graph_request("GET", next_link, token)
+        except RuntimeError as exc:
+            if is_graph_not_found(exc):
+                forget_sharepoint_ids_after_404(site_id, token, list_id)
+            raise
+        payload = json.loads(resp_body or "{}")
+        for item in payload.get("value", []):
+            item_id = item.get("id")
+            if item_id:
+                item_ids.append(item_id)
+                if len(item_ids) > max_items:
+                    break
+        if len(item_ids) > max_items:
+            break
+        next_link = payload.get("@odata.nextLink")
+
+    if len(item_ids) > max_items:
+        return {
+            "list_id": list_id,
+            "success": False,
+            "error": f"List exceeds max_items_per_list ({max_items}). Refusing to purge.",
+            "items_seen": len(item_ids),
+        }
+
+    deleted = 0
+    errors = 0
+    if not dry_run:
+        deleted, failures = graph_batch_delete(
+            [f"/sites/{site_id}/lists/{list_id}/items/{item_id}" for item_id in item_ids], token
+        )
+        errors = len(failures)
+        for path, error in failures.items():
+            logging.error("Purge delete failed list=%s item=%s: %s", list_id, path.rsplit("/", 1)[-1], error)
+
+    return {
+        "list_id": list_id,
+        "items_found": len(item_ids),
+        "deleted": deleted,
+        "errors": errors,
+        "success": errors == 0 and (deleted == len(item_ids) if not dry_run else True),
+    }
+
+
 @app.route(route="lab/purge-lists", auth_level=func.AuthLevel.FUNCTION)
 def lab_purge_lists(req: func.HttpRequest) -> func.HttpResponse:
     """
@@ -2256,7 +4222,11 @@ def lab_purge_lists(req: func.HttpRequest) -> func.HttpResponse:
     - LAB_PURGE_ENABLED=true
     - LAB_PURGE_ADMIN_TOKEN must match header x-admin-token
     - LAB_PURGE_CONFIRMATION must match body.confirm
-    - Lists must be in allowlist (LAB_PURGE_ALLOWED_LIST_IDS) OR in the built-in default allowlist
+    - Lists must be in allowlist (LAB_PURGE_ALLOWED_LIST_IDS) OR in the built-in default allowlist;
+      this is checked before any Graph call. The allowlist takes list GUIDs or list names; a name
+      not in it is only accepted for the known flow lists whose GUID is allowed
+
+    Lists are purged concurrently (up to LAB_PURGE_MAX_WORKERS at a time).
 
     Body:
     {
@@ -2315,103 +4285,77 @@ def lab_purge_lists(req: func.HttpRequest) -> func.HttpResponse:
             )
 
         dry_run = body.get("dry_run", True)
-        max_items = int(body.get("max_items_per_list", os.environ.get("LAB_PURGE_MAX_ITEMS_PER_LIST", "500")))
+        max_items = int(body.get("max_items_per_list", get_env_int("LAB_PURGE_MAX_ITEMS_PER_LIST", 500)))
         if max_items <= 0:
             max_items = 500
 
         # Default allowlist (known lists used by the flows). Prefer configuring env allowlist in each environment.
-        default_allowed = {
-            "6db5a12d-595d-4a1a-aca1-035837613815",  # Ofertas_Pipeline
-            "172d7d29-5a3c-4608-b4ea-b5b027ef5ac0",  # Atualizacoes_Semanais
-            "f58b3d23-5750-4b29-b30f-a7b5421cdd80",  # StatusReports_Historico
-        }
-        allowed_env = parse_csv_env_set("LAB_PURGE_ALLOWED_LIST_IDS")
-        allowed = allowed_env if allowed_env else default_allowed
-
-        name_to_id = {
+        known_lists = {
             "ofertas_pipeline": "6db5a12d-595d-4a1a-aca1-035837613815",
             "atualizacoes_semanais": "172d7d29-5a3c-4608-b4ea-b5b027ef5ac0",
             "statusreports_historico": "f58b3d23-5750-4b29-b30f-a7b5421cdd80",
         }
+        default_allowed = set(known_lists.values())
+        allowed_env = parse_csv_env_set("LAB_PURGE_ALLOWED_LIST_IDS")
+        allowed = allowed_env if allowed_env else default_allowed
 
-        list_ids = []
+        def not_allowed(raw):
+            return func.HttpResponse(
+                json.dumps(
+                    {
+                        "success": False,
+                        "error": f"List not allowed: {raw}",
+                        "hint": "Configure LAB_PURGE_ALLOWED_LIST_IDS or request only known list names/ids",
+                    },
+                    ensure_ascii=False,
+                ),
+                status_code=403,
+                mimetype="application/json",
+            )
+
+        # Allowlist check before any Graph traffic: GUIDs as sent, names by name or known GUID
+        checked = []
         for raw in requested_lists:
             if not isinstance(raw, str):
                 continue
-            cleaned = raw.strip().strip("{}")
-            key = cleaned.lower()
-            list_id = name_to_id.get(key) or cleaned
-            list_id_norm = list_id.lower()
-            if list_id_norm not in allowed:
+            key = raw.strip().strip("{}").lower()
+            allowed_by_name = not _GUID_RE.match(key) and key in allowed
+            if not (key in allowed or known_lists.get(key) in allowed):
+                return not_allowed(raw)
+            checked.append((raw, allowed_by_name))
+
+        token = get_graph_token()
+        site_id = get_sharepoint_site_id(token)
+
+        # List names are resolved to GUIDs through Graph (memoized per site)
+        list_ids = []
+        for raw, allowed_by_name in checked:
+            try:
+                list_id_norm = resolve_sharepoint_list_id(site_id, raw, token)
+            except RuntimeError as exc:
+                if not is_graph_not_found(exc):
+                    raise
+                forget_sharepoint_ids_after_404(site_id, token)
                 return func.HttpResponse(
-                    json.dumps(
-                        {
-                            "success": False,
-                            "error": f"List not allowed: {raw}",
-                            "hint": "Configure LAB_PURGE_ALLOWED_LIST_IDS or request only known list names/ids",
-                        },
-                        ensure_ascii=False,
-                    ),
-                    status_code=403,
+                    json.dumps({"success": False, "error": f"List not found: {raw}"}, ensure_ascii=False),
+                    status_code=404,
                     mimetype="application/json",
                 )
+            # A known name that resolves to a GUID outside the allowlist is still refused
+            if not allowed_by_name and list_id_norm not in allowed:
+                return not_allowed(raw)
             list_ids.append(list_id_norm)
 
-        token = get_graph_token()
-        site_id = os.environ.get("SP_SITE_ID")
-        if not site_id:
-            site_url = get_required_env("SP_SITE_URL")
-            site_id = resolve_sharepoint_site_id(site_url, token)
-
         report = {"success": True, "dry_run": bool(dry_run), "site_id": site_id, "lists": []}
 
-        for list_id in list_ids:
-            # Enumerate up to max_items + 1 so we can stop safely.
-            item_ids = []
-            next_link = f"/sites/{site_id}/lists/{list_id}/items?$top=999"
-            while next_link:
-                _, resp_body = graph_request("GET", next_link, token)
-                payload = json.loads(resp_body or "{}")
-                for item in payload.get("value", []):
-                    item_id = item.get("id")
-                    if item_id:
-                        item_ids.append(item_id)
-                        if len(item_ids) > max_items:
-                            break
-                if len(item_ids) > max_items:
-                    break
-                next_link = payload.get("@odata.nextLink")
-
-            if len(item_ids) > max_items:
-                report["lists"].append(
-                    {
-                        "list_id": list_id,
-                        "success": False,
-                        "error": f"List exceeds max_items_per_list ({max_items}). Refusing to purge.",
-                        "items_seen": len(item_ids),
-                    }
+        # Lists are purged concurrently; the report keeps the requested order
+        workers = max(1, min(LAB_PURGE_MAX_WORKERS, len(list_ids)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="purge") as executor:
+            report["lists"] = list(
+                executor.map(
+                    lambda list_id: purge_list_items(site_id, list_id, token, max_items, dry_run),
+                    list_ids,
                 )
-                continue
-
-            deleted = 0
-            errors = 0
-            if not dry_run:
-                for item_id in item_ids:
-                    try:
-                        graph_request("DELETE", f"/sites/{site_id}/lists/{list_id}/items/{item_id}", token)
-                        deleted += 1
-                    except Exception as exc:
-                        errors += 1
-                        logging.error("Purge delete failed list=%s item=%s: %s", list_id, item_id, str(exc))
-
-            report["lists"].append(
-                {
-                    "list_id": list_id,
-                    "items_found": len(item_ids),
-                    "deleted": deleted,
-                    "errors": errors,
-                    "success": errors == 0 and (deleted == len(item_ids) if not dry_run else True),
-                }
             )
 
         return func.HttpResponse(
@@ -2429,38 +4373,17 @@ def lab_purge_lists(req: func.HttpRequest) -> func.HttpResponse:
         )
 
 
-def get_pbi_token():
+def get_pbi_token(rejected_token=None):
     tenant_id = get_required_env("PBI_TENANT_ID")
     client_id = get_required_env("PBI_CLIENT_ID")
     client_secret = get_required_env("PBI_CLIENT_SECRET")
-    token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
-
-    data = urlencode(
-        {
-            "grant_type": "client_credentials",
-            "client_id": client_id,
-            "client_secret": client_secret,
-            "scope": "https://analysis.windows.net/powerbi/api/.default",
-        }
-    ).encode("utf-8")
-
-    req = Request(
-        token_url,
-        data=data,
-        headers={"Content-Type": "application/x-www-form-urlencoded"},
-        method="POST",
+    return get_client_credentials_token(
+        tenant_id,
+        client_id,
+        client_secret,
+        "https://analysis.windows.net/powerbi/api/.default",
+        rejected_token=rejected_token,
     )
-    try:
-        with urlopen(req, timeout=30) as resp:
-            payload = json.loads(resp.read().decode("utf-8"))
-    except HTTPError as exc:
-        body = exc.read().decode("utf-8")
-        raise RuntimeError(f"Token request failed ({exc.code}): {body}") from exc
-
-    access_token = payload.get("access_token")
-    if not access_token:
-        raise RuntimeError("Token response missing access_token")
-    return access_token
 
 
 def pbi_request(method, path, token, body=None):
@@ -2472,14 +4395,65 @@ def pbi_request(method, path, token, body=None):
         headers["Content-Type"] = "application/json"
         data = json.dumps(body).encode("utf-8")
 
-    req = Request(url, data=data, headers=headers, method=method)
+    status, _, raw = api_request("pbi", method, url, headers=headers, data=data, timeout=PBI_TIMEOUT_SECONDS)
+    if status == 401:
+        # Cached token revoked before its expiry: renew it once and replay
+        headers["Authorization"] = f"Bearer {get_pbi_token(rejected_token=token)}"
+        status, _, raw = api_request("pbi", method, url, headers=headers, data=data, timeout=PBI_TIMEOUT_SECONDS)
+    resp_body = raw.decode("utf-8")
+    if status >= 400:
+        raise RuntimeError(f"PBI API error ({status}): {resp_body}")
+    return status, resp_body
+
+
+PBI_WORKSPACE_INDEX_TTL_SECONDS = get_env_int("PBI_WORKSPACE_INDEX_TTL_SECONDS", 600)
+
+_PBI_WORKSPACE_INDEX = {}  # lowercase name -> {"workspace": group, "cached_at": monotonic}
+_PBI_WORKSPACE_INDEX_LOCK = threading.Lock()
+
+
+def _index_pbi_workspaces(groups):
+    now = time.monotonic()
+    with _PBI_WORKSPACE_INDEX_LOCK:
+        for group in groups:
+            name = group.get("name", "").strip().lower()
+            if name:
+                _PBI_WORKSPACE_INDEX[name] = {"workspace": group, "cached_at": now}
+
+
+def find_pbi_workspace(workspace_name, token):
+    """
+    Workspace (group) by case-insensitive name, or None.
+
+    Served from a name -> workspace index (PBI_WORKSPACE_INDEX_TTL_SECONDS); on a miss
+    asks the API with $filter, and only downloads the full group list if that finds nothing.
+    """
+    key = workspace_name.strip().lower()
+    with _PBI_WORKSPACE_INDEX_LOCK:
+        entry = _PBI_WORKSPACE_INDEX.get(key)
+        if entry and time.monotonic() - entry["cached_at"] < PBI_WORKSPACE_INDEX_TTL_SECONDS:
+            return entry["workspace"]
+        _PBI_WORKSPACE_INDEX.pop(key, None)
+
+    odata_name = workspace_name.strip().replace("'", "''")
+    name_filter = quote(f"name eq '{odata_name}'")
     try:
-        with urlopen(req, timeout=30) as resp:
-            resp_body = resp.read().decode("utf-8")
-            return resp.status, resp_body
-    except HTTPError as exc:
-        body = exc.read().decode("utf-8")
-        raise RuntimeError(f"PBI API error ({exc.code}): {body}") from exc
+        _, body = pbi_request("GET", f"/groups?$filter={name_filter}", token)
+        groups = json.loads(body or "{}").get("value", [])
+    except RuntimeError as exc:
+        logging.warning("PBI $filter on groups failed, listing all groups: %s", str(exc))
+        groups = []
+
+    if not any(g.get("name", "").strip().lower() == key for g in groups):
+        # $filter is exact-match; fall back to the full list for case/whitespace differences
+        _, body = pbi_request("GET", "/groups", token)
+        groups = json.loads(body or "{}").get("value", [])
+
+    _index_pbi_workspaces(groups)
+    for group in groups:
+        if group.get("name", "").strip().lower() == key:
+            return group
+    return None
 
 
 @app.route(route="pbi-workspace", auth_level=func.AuthLevel.FUNCTION)
@@ -2500,20 +4474,14 @@ def pbi_workspace(req: func.HttpRequest) -> func.HttpResponse:
         create_if_missing = req_body.get("create_if_missing", True)
 
         token = get_pbi_token()
-        _, body = pbi_request("GET", "/groups", token)
-        groups = json.loads(body or "{}").get("value", [])
-
-        workspace = None
-        for group in groups:
-            if group.get("name", "").strip().lower() == workspace_name.strip().lower():
-                workspace = group
-                break
+        workspace = find_pbi_workspace(workspace_name, token)
 
         created = False
         if workspace is None and create_if_missing:
             _, body = pbi_request("POST", "/groups", token, {"name": workspace_name})
             workspace = json.loads(body or "{}")
             created = True
+            _index_pbi_workspaces([workspace])
 
         if workspace is None:
             return func.HttpResponse(
@@ -2533,7 +4501,6 @@ def pbi_workspace(req: func.HttpRequest) -> func.HttpResponse:
             "workspace_id": workspace.get("id"),
             "created": created,
         }
-        resultado = to_native_obj(resultado)
         return func.HttpResponse(
             json.dumps(resultado, ensure_ascii=False),
             status_code=200,
@@ -2608,11 +4575,125 @@ def pbi_datasets(req: func.HttpRequest) -> func.HttpResponse:
         )
 
 
+PBI_REFRESH_POLL_INITIAL_SECONDS = get_env_float("PBI_REFRESH_POLL_INITIAL_SECONDS", 5.0)
+PBI_REFRESH_POLL_MAX_SECONDS = get_env_float("PBI_REFRESH_POLL_MAX_SECONDS", 60.0)
+# Azure cuts HTTP-triggered responses at ~230 s: waits never go past PBI_REFRESH_WAIT_MAX_SECONDS
+PBI_REFRESH_WAIT_MAX_SECONDS = 200.0
+PBI_REFRESH_WAIT_TIMEOUT_SECONDS = min(
+    get_env_float("PBI_REFRESH_WAIT_TIMEOUT_SECONDS", 180.0), PBI_REFRESH_WAIT_MAX_SECONDS
+)
+PBI_REFRESH_MAX_WORKERS = get_env_int("PBI_REFRESH_MAX_WORKERS", 4)
+
+# Refresh history reports "Unknown" while a refresh is still running
+PBI_REFRESH_FINAL_STATUSES = {"Completed", "Failed", "Cancelled", "Disabled"}
+
+
+def parse_pbi_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def latest_dataset_refresh(workspace_id, dataset_id, token):
+    _, body = pbi_request("GET", f"/groups/{workspace_id}/datasets/{dataset_id}/refreshes?$top=1", token)
+    refreshes = json.loads(body or "{}").get("value", [])
+    return refreshes[0] if refreshes else None
+
+
+def trigger_dataset_refresh(workspace_id, dataset_id, token, notify_option):
+    try:
+        pbi_request(
+            "POST",
+            f"/groups/{workspace_id}/datasets/{dataset_id}/refreshes",
+            token,
+            {"notifyOption": notify_option},
+        )
+    except RuntimeError as e:
+        # 202 Accepted is expected for async refresh
+        if "202" not in str(e):
+            raise
+
+
+def refresh_dataset_and_wait(workspace_id, dataset_id, notify_option, deadline):
+    """
+    Triggers a refresh and polls the refresh history (with backoff) until it reaches a final
+    status or the deadline (time.monotonic()) passes. Returns the refresh outcome; a refresh
+    still running at the deadline comes back as "InProgress" with its requestId.
+    """
+    started = time.monotonic()
+    token = get_pbi_token()
+    previous = latest_dataset_refresh(workspace_id, dataset_id, token)
+    previous_id = previous.get("requestId") if previous else None
+    trigger_dataset_refresh(workspace_id, dataset_id, token, notify_option)
+
+    refresh = None
+    polls = 0
+    delay = PBI_REFRESH_POLL_INITIAL_SECONDS
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, PBI_REFRESH_POLL_MAX_SECONDS)
+        polls += 1
+        # Token comes from the shared cache, so long waits survive its expiry
+        latest = latest_dataset_refresh(workspace_id, dataset_id, get_pbi_token())
+        if not latest or latest.get("requestId") == previous_id:
+            continue  # our refresh is not listed yet
+        refresh = latest
+        if refresh.get("status") in PBI_REFRESH_FINAL_STATUSES:
+            break
+
+    if refresh is None:
+        # Deadline passed before our refresh was listed: one last look for its requestId
+        latest = latest_dataset_refresh(workspace_id, dataset_id, get_pbi_token())
+        if latest and latest.get("requestId") != previous_id:
+            refresh = latest
+
+    status = refresh.get("status") if refresh else None
+    start_time = parse_pbi_datetime(refresh.get("startTime")) if refresh else None
+    end_time = parse_pbi_datetime(refresh.get("endTime")) if refresh else None
+    if start_time and end_time:
+        duration = (end_time - start_time).total_seconds()
+    else:
+        duration = time.monotonic() - started
+
+    outcome = {
+        "workspace_id": workspace_id,
+        "dataset_id": dataset_id,
+        "success": status == "Completed",
+        "status": status if status in PBI_REFRESH_FINAL_STATUSES else "InProgress",
+        "timed_out": status not in PBI_REFRESH_FINAL_STATUSES,
+        "requestId": refresh.get("requestId") if refresh else None,
+        "startTime": refresh.get("startTime") if refresh else None,
+        "endTime": refresh.get("endTime") if refresh else None,
+        "duration_seconds": round(duration, 1),
+        "polls": polls,
+    }
+    if refresh and refresh.get("serviceExceptionJson"):
+        outcome["error"] = refresh["serviceExceptionJson"]
+    return outcome
+
+
+def parse_refresh_timeout(req_body):
+    """timeout_seconds from the body, clamped to [1, PBI_REFRESH_WAIT_MAX_SECONDS]."""
+    try:
+        timeout_seconds = float(req_body.get("timeout_seconds") or PBI_REFRESH_WAIT_TIMEOUT_SECONDS)
+    except (TypeError, ValueError):
+        timeout_seconds = PBI_REFRESH_WAIT_TIMEOUT_SECONDS
+    return min(max(1.0, timeout_seconds), PBI_REFRESH_WAIT_MAX_SECONDS)
+
+
 @app.route(route="pbi-dataset-refresh", auth_level=func.AuthLevel.FUNCTION)
 def pbi_dataset_refresh(req: func.HttpRequest) -> func.HttpResponse:
     """
     Dispara refresh de um dataset.
-    Input: workspace_id, dataset_id, notify_option (optional: NoNotification, MailOnFailure, MailOnCompletion)
+    Input: workspace_id, dataset_id, notify_option (optional: NoNotification, MailOnFailure, MailOnCompletion),
+    wait (optional, default False: poll until the refresh finishes), timeout_seconds (optional, with wait,
+    capped at PBI_REFRESH_WAIT_MAX_SECONDS)
     """
     logging.info("Power BI dataset refresh iniciado...")
 
@@ -2635,20 +4716,19 @@ def pbi_dataset_refresh(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json",
             )
 
-        token = get_pbi_token()
-        refresh_body = {"notifyOption": notify_option}
-        
-        try:
-            pbi_request(
-                "POST",
-                f"/groups/{workspace_id}/datasets/{dataset_id}/refreshes",
-                token,
-                refresh_body,
+        if parse_bool_param(req_body.get("wait"), False):
+            outcome = refresh_dataset_and_wait(
+                workspace_id, dataset_id, notify_option, time.monotonic() + parse_refresh_timeout(req_body)
             )
-        except RuntimeError as e:
-            # 202 Accepted is expected for async refresh
-            if "202" not in str(e):
-                raise
+            outcome["notify_option"] = notify_option
+            return func.HttpResponse(
+                json.dumps(outcome, ensure_ascii=False),
+                status_code=202 if outcome["timed_out"] else 200,
+                mimetype="application/json",
+            )
+
+        token = get_pbi_token()
+        trigger_dataset_refresh(workspace_id, dataset_id, token, notify_option)
 
         resultado = {
             "success": True,
@@ -2671,6 +4751,92 @@ def pbi_dataset_refresh(req: func.HttpRequest) -> func.HttpResponse:
         )
 
 
+@app.route(route="pbi-dataset-refresh-batch", auth_level=func.AuthLevel.FUNCTION)
+def pbi_dataset_refresh_batch(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Refreshes several datasets concurrently and waits for all of them.
+    Input: datasets (list of dataset ids or {workspace_id, dataset_id}), workspace_id (default for
+    plain ids), notify_option, timeout_seconds (optional, one deadline for the whole batch, capped at
+    PBI_REFRESH_WAIT_MAX_SECONDS). Datasets still running at the deadline come back as "InProgress"
+    with their requestId, to be polled through pbi-dataset-refresh-history.
+    """
+    logging.info("Power BI dataset refresh batch iniciado...")
+
+    try:
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            req_body = {}
+
+        default_workspace_id = req_body.get("workspace_id")
+        notify_option = req_body.get("notify_option", "NoNotification")
+        datasets = req_body.get("datasets") or []
+
+        targets = []
+        for item in datasets if isinstance(datasets, list) else []:
+            if isinstance(item, dict):
+                targets.append((item.get("workspace_id") or default_workspace_id, item.get("dataset_id")))
+            else:
+                targets.append((default_workspace_id, item))
+
+        if not targets or not all(workspace_id and dataset_id for workspace_id, dataset_id in targets):
+            return func.HttpResponse(
+                json.dumps(
+                    {
+                        "error": "datasets must be a non-empty list with workspace_id and dataset_id for each item",
+                        "success": False,
+                    }
+                ),
+                status_code=400,
+                mimetype="application/json",
+            )
+
+        started = time.monotonic()
+        deadline = started + parse_refresh_timeout(req_body)
+
+        def run(target):
+            workspace_id, dataset_id = target
+            try:
+                return refresh_dataset_and_wait(workspace_id, dataset_id, notify_option, deadline)
+            except Exception as exc:
+                logging.error("Refresh failed for dataset %s: %s", dataset_id, str(exc))
+                return {
+                    "workspace_id": workspace_id,
+                    "dataset_id": dataset_id,
+                    "success": False,
+                    "status": "Error",
+                    "timed_out": False,
+                    "error": str(exc),
+                }
+
+        workers = max(1, min(PBI_REFRESH_MAX_WORKERS, len(targets)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pbi-refresh") as executor:
+            results = list(executor.map(run, targets))
+
+        resultado = {
+            "success": all(r["success"] for r in results),
+            "count": len(results),
+            "completed": sum(1 for r in results if r["status"] == "Completed"),
+            "failed": sum(1 for r in results if not r["success"] and not r["timed_out"]),
+            "timed_out": sum(1 for r in results if r["timed_out"]),
+            "duration_seconds": round(time.monotonic() - started, 1),
+            "notify_option": notify_option,
+            "results": results,
+        }
+        return func.HttpResponse(
+            json.dumps(resultado, ensure_ascii=False),
+            status_code=200,
+            mimetype="application/json",
+        )
+    except Exception as e:
+        logging.error("Erro Power BI dataset refresh batch: %s", str(e))
+        return func.HttpResponse(
+            json.dumps({"error": str(e), "success": False}),
+            status_code=500,
+            mimetype="application/json",
+        )
+
+
 @app.route(route="pbi-dataset-refresh-history", auth_level=func.AuthLevel.FUNCTION)
 def pbi_dataset_refresh_history(req: func.HttpRequest) -> func.HttpResponse:
     """
@@ -3330,3 +5496,139 @@ def pbi_workspace_users(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500,
             mimetype="application/json",
         )
+
+
+# =============================================================================
+# POWER BI API - INVENTORY
+# =============================================================================
+
+PBI_INVENTORY_TTL_SECONDS = get_env_int("PBI_INVENTORY_TTL_SECONDS", 120)
+PBI_INVENTORY_MAX_WORKERS = get_env_int("PBI_INVENTORY_MAX_WORKERS", 8)
+
+# Same item fields as the individual pbi-* routes
+PBI_INVENTORY_FIELDS = {
+    "datasets": ("id", "name", "configuredBy", "isRefreshable", "isOnPremGatewayRequired"),
+    "reports": ("id", "name", "datasetId", "webUrl", "embedUrl"),
+    "dashboards": ("id", "displayName", "webUrl", "embedUrl", "isReadOnly"),
+    "tiles": ("id", "title", "reportId", "datasetId", "embedUrl"),
+    "datasources": ("datasourceId", "datasourceType", "gatewayId", "connectionDetails"),
+    "users": ("emailAddress", "displayName", "groupUserAccessRight", "principalType"),
+}
+
+_PBI_INVENTORY_CACHE = {}  # (workspace_id, tiles, datasources) -> (expira_em, documento)
+_PBI_INVENTORY_CACHE_LOCK = threading.Lock()
+
+
+def build_pbi_inventory(workspace_id, token, include_tiles=True, include_datasources=True):
+    """
+    One document with datasets, reports, dashboards (+ tiles), datasources per dataset and
+    workspace users. Calls fan out on a bounded pool (PBI_INVENTORY_MAX_WORKERS); a failing
+    call is reported in "errors" instead of failing the whole inventory.
+    """
+    errors = []
+
+    def fetch(kind, path):
+        try:
+            _, body = pbi_request("GET", path, token)
+        except Exception as exc:
+            errors.append({"call": path, "error": str(exc)})
+            return None
+        fields = PBI_INVENTORY_FIELDS[kind]
+        return [{f: item.get(f) for f in fields} for item in json.loads(body or "{}").get("value", [])]
+
+    base = f"/groups/{workspace_id}"
+    with ThreadPoolExecutor(max_workers=PBI_INVENTORY_MAX_WORKERS, thread_name_prefix="pbi-inventory") as executor:
+        top_level = {
+            kind: executor.submit(fetch, kind, f"{base}/{kind}")
+            for kind in ("datasets", "reports", "dashboards", "users")
+        }
+        inventory = {kind: future.result() for kind, future in top_level.items()}
+
+        nested = []
+        if include_tiles:
+            nested += [
+                (dashboard, "tiles", executor.submit(fetch, "tiles", f"{base}/dashboards/{dashboard['id']}/tiles"))
+                for dashboard in inventory["dashboards"] or []
+            ]
+        if include_datasources:
+            nested += [
+                (dataset, "datasources", executor.submit(fetch, "datasources", f"{base}/datasets/{dataset['id']}/datasources"))
+                for dataset in inventory["datasets"] or []
+            ]
+        for parent, kind, future in nested:
+            parent[kind] = future.result()
+
+    documento = {
+        "success": not errors,
+        "workspace_id": workspace_id,
+        "generated_at": datetime.now().isoformat(),
+        "counts": {kind: len(items or []) for kind, items in inventory.items()},
+    }
+    documento.update(inventory)
+    if errors:
+        documento["errors"] = errors
+    return documento
+
+
+@app.route(route="pbi-inventory", auth_level=func.AuthLevel.FUNCTION)
+def pbi_inventory(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Inventário consolidado de um workspace (datasets, reports, dashboards, tiles, datasources, users).
+    Input: workspace_id (required), include_tiles (default True), include_datasources (default True)
+    Cached for PBI_INVENTORY_TTL_SECONDS; header X-Cache-Bypass: true forces a rebuild.
+    """
+    logging.info("Power BI inventory iniciado...")
+
+    try:
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            req_body = {}
+
+        workspace_id = req_body.get("workspace_id")
+        if not workspace_id:
+            return func.HttpResponse(
+                json.dumps({"error": "workspace_id is required", "success": False}),
+                status_code=400,
+                mimetype="application/json",
+            )
+
+        include_tiles = parse_bool_param(req_body.get("include_tiles"), True)
+        include_datasources = parse_bool_param(req_body.get("include_datasources"), True)
+        cache_key = (workspace_id, include_tiles, include_datasources)
+
+        if not result_cache_bypass(req):
+            with _PBI_INVENTORY_CACHE_LOCK:
+                cached = _PBI_INVENTORY_CACHE.get(cache_key)
+            if cached and cached[0] > time.monotonic():
+                return func.HttpResponse(
+                    cached[1],
+                    status_code=200,
+                    mimetype="application/json",
+                    headers={"X-Cache": "HIT"},
+                )
+
+        token = get_pbi_token()
+        documento = build_pbi_inventory(workspace_id, token, include_tiles, include_datasources)
+        body_text = json.dumps(documento, ensure_ascii=False)
+
+        if documento["success"]:
+            with _PBI_INVENTORY_CACHE_LOCK:
+                now = time.monotonic()
+                for key in [k for k, (expira_em, _) in _PBI_INVENTORY_CACHE.items() if expira_em <= now]:
+                    del _PBI_INVENTORY_CACHE[key]
+                _PBI_INVENTORY_CACHE[cache_key] = (now + PBI_INVENTORY_TTL_SECONDS, body_text)
+
+        return func.HttpResponse(
+            body_text,
+            status_code=200,
+            mimetype="application/json",
+            headers={"X-Cache": "MISS"},
+        )
+    except Exception as e:
+        logging.error("Erro Power BI inventory: %s", str(e))
+        return func.HttpResponse(
+            json.dumps({"error": str(e), "success": False}),
+            status_code=500,
+            mimetype="application/json",
+        )
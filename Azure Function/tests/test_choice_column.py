@@ -0,0 +1,78 @@
+"""
+Colunas choice do import-jira / normalizar-ofertas: encode_choice_column deve
+valer o normalize célula a célula (categorias na ordem da primeira ocorrência)
+e choice_value_counts o value_counts(dropna=False) da coluna.
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import os
+import random
+import sys
+import unittest
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+STRINGS = ["Zeta", "Alpha", " Alpha ", "A", "a", "", " ", "nan", "N/A", "-", None]
+MISTOS = STRINGS + [1, 2, 1.0, 2.5, True, False, 0, float("nan")]
+
+
+def normalize_minusculo(val):
+    """normalize com colisões (valores distintos -> mesmo valor normalizado)."""
+    cleaned = function_app.normalize_choice_passthrough(val)
+    return cleaned.lower() if cleaned is not None else None
+
+
+def amostra(seed, valores):
+    rnd = random.Random(seed)
+    return pd.Series([rnd.choice(valores) for _ in range(rnd.randint(0, 40))], dtype=object, name="Status")
+
+
+class EncodeChoiceColumnTest(unittest.TestCase):
+    def assert_igual_celula_a_celula(self, series, normalize):
+        obtido = function_app.encode_choice_column(series, normalize)
+        esperado = [normalize(v) for v in series]
+        self.assertIsInstance(obtido.dtype, pd.CategoricalDtype)
+        self.assertEqual(obtido.name, series.name)
+        self.assertEqual([None if pd.isna(v) else v for v in obtido.astype(object)], esperado)
+        self.assertEqual(list(obtido.cat.categories), list(dict.fromkeys(v for v in esperado if v is not None)))
+
+    def test_strings(self):
+        for seed in range(100):
+            for normalize in (function_app.normalize_choice_passthrough, normalize_minusculo):
+                with self.subTest(seed=seed, normalize=normalize.__name__):
+                    self.assert_igual_celula_a_celula(amostra(seed, STRINGS), normalize)
+
+    def test_tipos_mistos(self):
+        for seed in range(100):
+            for normalize in (function_app.normalize_choice_passthrough, normalize_minusculo):
+                with self.subTest(seed=seed, normalize=normalize.__name__):
+                    self.assert_igual_celula_a_celula(amostra(seed, MISTOS), normalize)
+
+    def test_um_e_true_nao_colidem(self):
+        obtido = function_app.encode_choice_column(pd.Series([1, True, "1", 1.0], dtype=object))
+        self.assertEqual(list(obtido.astype(object)), ["1", "True", "1", "1.0"])
+        self.assertEqual(list(obtido.cat.categories), ["1", "True", "1.0"])
+
+
+class ChoiceValueCountsTest(unittest.TestCase):
+    def test_igual_ao_value_counts(self):
+        for seed in range(200):
+            series = amostra(seed, MISTOS)
+            col = function_app.encode_choice_column(series)
+            with self.subTest(seed=seed):
+                obtido = function_app.choice_value_counts(col)
+                esperado = col.astype(object).where(col.notna(), None).value_counts(dropna=False)
+                self.assertEqual(
+                    [(None if pd.isna(k) else k, int(v)) for k, v in obtido.items()],
+                    [(None if pd.isna(k) else k, int(v)) for k, v in esperado.items()],
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+Merge de snapshot do consolidar-v2: snapshot + incremental (ofertas e
+atualizações) deve gerar o mesmo card que uma chamada com a carga completa.
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import azure.functions as func
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+AGORA = datetime(2025, 6, 15, 10, 0)
+STATUS = ["Under Study", "Proposal", "Follow-up", "Delivered", "Won", "Lost", "Cancelled", "Outro", None]
+
+
+class AgoraFixa(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return AGORA
+
+
+def oferta(rnd, chave):
+    data = AGORA - timedelta(days=rnd.uniform(-10, 60))
+    return {
+        "JiraKey": chave,
+        "Status": rnd.choice(STATUS),
+        "ValorBRL": rnd.choice([None, round(rnd.uniform(0, 1e6), 2), "R$ 1.234,56"]),
+        "Margem": rnd.choice([None, "25%", 0.3, 12]),
+        "PrazoProposta": (data + timedelta(days=rnd.randint(0, 20))).strftime("%d/%m/%Y"),
+        "JiraUpdated": data.isoformat(),
+        "DataRecebimentoRFP": (data - timedelta(days=rnd.randint(1, 40))).strftime("%d/%m/%Y"),
+        "Assignee": rnd.choice(["ana", "bruno", "carla", "davi", None]),
+        "Mercado": rnd.choice(["PA", "BR", "TELCO", None]),
+    }
+
+
+def atualizacao(rnd, item_id):
+    return {
+        "ID": item_id,
+        "NomeArquiteto": rnd.choice(["ana", "bruno", "carla", "davi"]),
+        "StatusRAG": rnd.choice(["Verde", "Amarelo", "Vermelho"]),
+        "Modified": (AGORA - timedelta(days=rnd.uniform(0, 7))).isoformat(),
+    }
+
+
+def _chamar(body):
+    handler = function_app.consolidar_pipeline_v2
+    built = getattr(handler, "_function", None)
+    handler = built._func if built is not None else handler
+    req = func.HttpRequest(
+        method="POST",
+        url="http://localhost/api/consolidar-v2",
+        headers={"X-Cache-Bypass": "true"},
+        params={},
+        body=json.dumps(body).encode("utf-8"),
+    )
+    resp = handler(req)
+    return resp.status_code, json.loads(resp.get_body())
+
+
+class ConsolidarSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patches = [
+            mock.patch.dict(os.environ, {"CONSOLIDAR_STATE_PATH": os.path.join(tmp.name, "estado.sqlite")}),
+            mock.patch.object(function_app, "datetime", AgoraFixa),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def assert_merge_igual_carga_completa(self, seed):
+        rnd = random.Random(seed)
+        ofertas = [oferta(rnd, f"OF-{i}") for i in range(rnd.randint(1, 60))]
+        atualizacoes = [atualizacao(rnd, i) for i in range(rnd.randint(0, 20))]
+        estado_id = f"teste-{seed}"
+
+        status, _ = _chamar(
+            {"modo": "snapshot", "estado_id": estado_id, "ofertas": ofertas, "atualizacoes": atualizacoes}
+        )
+        self.assertEqual(status, 200)
+
+        # Alterações: versões novas de chaves existentes, chaves novas e remoções
+        alteradas = [oferta(rnd, o["JiraKey"]) for o in rnd.sample(ofertas, len(ofertas) // 3)]
+        novas = [oferta(rnd, f"OF-novo-{i}") for i in range(rnd.randint(0, 5))]
+        removidas = [o["JiraKey"] for o in rnd.sample(ofertas, len(ofertas) // 5)]
+        atualizacoes_alteradas = [atualizacao(rnd, a["ID"]) for a in rnd.sample(atualizacoes, len(atualizacoes) // 2)]
+        atualizacoes_novas = [atualizacao(rnd, 100 + i) for i in range(rnd.randint(0, 5))]
+        atualizacoes_removidas = [a["ID"] for a in rnd.sample(atualizacoes, len(atualizacoes) // 4)]
+
+        status, incremental = _chamar(
+            {
+                "modo": "incremental",
+                "estado_id": estado_id,
+                "ofertas": alteradas + novas,
+                "removidas": removidas,
+                "atualizacoes": atualizacoes_alteradas + atualizacoes_novas,
+                "atualizacoes_removidas": atualizacoes_removidas,
+            }
+        )
+        self.assertEqual(status, 200)
+
+        # Carga completa equivalente: atualizadas no lugar, novas no fim
+        por_chave = {o["JiraKey"]: o for o in alteradas}
+        ofertas_completas = [
+            por_chave.get(o["JiraKey"], o) for o in ofertas if o["JiraKey"] not in removidas
+        ] + novas
+        por_id = {a["ID"]: a for a in atualizacoes_alteradas}
+        atualizacoes_completas = [
+            por_id.get(a["ID"], a) for a in atualizacoes if a["ID"] not in atualizacoes_removidas
+        ] + atualizacoes_novas
+        status, completo = _chamar({"ofertas": ofertas_completas, "atualizacoes": atualizacoes_completas})
+        self.assertEqual(status, 200)
+
+        estado = incremental.pop("estado_incremental")
+        self.assertEqual(estado["ofertas_no_estado"], len(ofertas_completas))
+        self.assertEqual(estado["atualizacoes_no_estado"], len(atualizacoes_completas))
+        self.assertEqual(incremental, completo)
+
+    def test_snapshot_mais_incremental_igual_carga_completa(self):
+        for seed in range(15):
+            with self.subTest(seed=seed):
+                self.assert_merge_igual_carga_completa(seed)
+
+    def test_incremental_sem_atualizacoes_mantem_as_do_estado(self):
+        rnd = random.Random(0)
+        atualizacoes = [atualizacao(rnd, i) for i in range(3)]
+        _chamar({"modo": "snapshot", "ofertas": [oferta(rnd, "OF-1")], "atualizacoes": atualizacoes})
+        status, resultado = _chamar({"modo": "incremental", "ofertas": [oferta(rnd, "OF-2")]})
+        self.assertEqual(status, 200)
+        self.assertEqual(resultado["estado_incremental"]["ofertas_no_estado"], 2)
+        self.assertEqual(resultado["estado_incremental"]["atualizacoes_no_estado"], 3)
+
+    def test_atualizacao_sem_id_responde_400(self):
+        status, resultado = _chamar({"modo": "snapshot", "ofertas": [], "atualizacoes": [{"StatusRAG": "Verde"}]})
+        self.assertEqual(status, 400)
+        self.assertFalse(resultado["success"])
+
+
+if __name__ == "__main__":
+    unittest.main()
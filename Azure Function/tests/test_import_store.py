@@ -0,0 +1,72 @@
+"""
+Store do import-jira paginado: limpeza de imports expirados e de páginas
+órfãs, e imports em andamento invisíveis para import-jira/paginas.
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+class ImportStoreTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patch = mock.patch.dict(os.environ, {"IMPORT_STORE_PATH": os.path.join(tmp.name, "imports.sqlite")})
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.conn = function_app._open_import_store()
+        self.addCleanup(self.conn.close)
+
+    def _import(self, import_id, criado_em, total, paginas=3):
+        with self.conn:
+            if total is not None:
+                self.conn.execute(
+                    "INSERT INTO imports (import_id, criado_em, total, estatisticas) VALUES (?, ?, ?, '{}')",
+                    (import_id, criado_em, total),
+                )
+            self.conn.executemany(
+                "INSERT INTO import_ofertas (import_id, seq, dados) VALUES (?, ?, '{}')",
+                [(import_id, seq) for seq in range(paginas)],
+            )
+
+    def _ids(self, table):
+        return sorted({row[0] for row in self.conn.execute(f"SELECT import_id FROM {table}")})
+
+    def test_purge_remove_expirados_e_orfaos(self):
+        agora = time.time()
+        vencido = agora - (function_app.IMPORT_STORE_TTL_HOURS + 1) * 3600
+        self._import("valido", agora, 3)
+        self._import("em-andamento", agora, -1)
+        self._import("expirado", vencido, 3)
+        self._import("travado", vencido, -1)
+        self._import("orfao", None, None)
+
+        with self.conn:
+            function_app._purge_expired_imports(self.conn)
+
+        self.assertEqual(self._ids("imports"), ["em-andamento", "valido"])
+        self.assertEqual(self._ids("import_ofertas"), ["em-andamento", "valido"])
+
+    def test_import_em_andamento_nao_e_encontrado(self):
+        self._import("em-andamento", time.time(), -1)
+        self._import("valido", time.time(), 3)
+        row, erro = function_app._load_import(self.conn, "em-andamento")
+        self.assertIsNone(row)
+        self.assertEqual(erro.status_code, 404)
+        row, erro = function_app._load_import(self.conn, "valido")
+        self.assertIsNone(erro)
+        self.assertEqual(row[0], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Versão do conjunto de mapeamentos do normalizar-ofertas: hash estável, chamada
+só com mapeamentos_versao igual à chamada com a tabela, 409 para versão
+desconhecida ou já descartada do cache.
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+import azure.functions as func
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+MAPEAMENTOS = [
+    {"Campo": "Status", "ValorRaw": "Won", "ValorNormalizado": "Ganha"},
+    {"Campo": "Status", "ValorRaw": "Lost", "ValorNormalizado": "Perdida", "Ativo": True},
+    {"Campo": "Mercado", "ValorRaw": "PA", "ValorNormalizado": "Público"},
+]
+OFERTAS = [
+    {"Status": "Won", "Mercado": "PA"},
+    {"Status": "Lost", "Mercado": "BR"},
+    {"Status": "Outro", "Mercado": None},
+]
+
+
+def _chamar(body):
+    handler = function_app.normalizar_ofertas
+    built = getattr(handler, "_function", None)
+    handler = built._func if built is not None else handler
+    req = func.HttpRequest(
+        method="POST",
+        url="http://localhost/api/normalizar-ofertas",
+        headers={},
+        params={},
+        body=json.dumps(body).encode("utf-8"),
+    )
+    resp = handler(req)
+    return resp.status_code, json.loads(resp.get_body())
+
+
+class MappingSetVersionTest(unittest.TestCase):
+    def test_ordem_das_chaves_nao_muda_a_versao(self):
+        invertidos = [dict(reversed(list(item.items()))) for item in MAPEAMENTOS]
+        self.assertEqual(function_app.mapping_set_version(MAPEAMENTOS), function_app.mapping_set_version(invertidos))
+
+    def test_conteudo_muda_a_versao(self):
+        alterados = [dict(item) for item in MAPEAMENTOS]
+        alterados[0]["ValorNormalizado"] = "Fechada"
+        self.assertNotEqual(function_app.mapping_set_version(MAPEAMENTOS), function_app.mapping_set_version(alterados))
+        self.assertNotEqual(function_app.mapping_set_version(MAPEAMENTOS), function_app.mapping_set_version(MAPEAMENTOS[:2]))
+
+    def test_compile_ultimo_item_vence_e_inativos_ignorados(self):
+        tabelas = function_app.compile_choice_mappings(
+            [
+                {"campo": "Status", "valor_raw": " won ", "valor_normalizado": "A"},
+                {"Field": "Status", "Raw": "won", "Normalizado": "B"},
+                {"Campo": "Status", "ValorRaw": "lost", "ValorNormalizado": "C", "Ativo": False},
+                {"Campo": "Status", "ValorRaw": "nan", "ValorNormalizado": "D"},
+            ]
+        )
+        self.assertEqual(tabelas, {"Status": {"won": "B"}})
+
+
+class NormalizarOfertasVersaoTest(unittest.TestCase):
+    def setUp(self):
+        with function_app._MAPPING_CACHE_LOCK:
+            function_app._MAPPING_CACHE.clear()
+
+    def test_so_versao_igual_a_tabela_completa(self):
+        status, completo = _chamar({"ofertas_raw": OFERTAS, "mapeamentos": MAPEAMENTOS})
+        self.assertEqual(status, 200)
+        versao = completo["mapeamentos_versao"]
+        self.assertEqual(versao, function_app.mapping_set_version(MAPEAMENTOS))
+
+        status, so_versao = _chamar({"ofertas_raw": OFERTAS, "mapeamentos_versao": versao})
+        self.assertEqual(status, 200)
+        self.assertEqual(so_versao, completo)
+        self.assertEqual([o["Status"] for o in so_versao["ofertas_normalizadas"]], ["Ganha", "Perdida", "UNMAPPED/OUTROS"])
+
+    def test_versao_desconhecida_responde_409(self):
+        status, resultado = _chamar({"ofertas_raw": OFERTAS, "mapeamentos_versao": "nao-existe"})
+        self.assertEqual(status, 409)
+        self.assertFalse(resultado["success"])
+        self.assertEqual(resultado["mapeamentos_versao"], "nao-existe")
+
+    def test_versao_descartada_do_cache_responde_409_ate_reenviar(self):
+        with mock.patch.object(function_app, "MAPPING_CACHE_MAX_ENTRIES", 1):
+            _, primeiro = _chamar({"ofertas_raw": OFERTAS, "mapeamentos": MAPEAMENTOS})
+            _chamar({"ofertas_raw": OFERTAS, "mapeamentos": MAPEAMENTOS[:1]})
+
+            status, _ = _chamar({"ofertas_raw": OFERTAS, "mapeamentos_versao": primeiro["mapeamentos_versao"]})
+            self.assertEqual(status, 409)
+
+            status, reenviado = _chamar(
+                {"ofertas_raw": OFERTAS, "mapeamentos": MAPEAMENTOS, "mapeamentos_versao": primeiro["mapeamentos_versao"]}
+            )
+            self.assertEqual(status, 200)
+            self.assertEqual(reenviado, primeiro)
+
+    def test_tabela_nova_substitui_versao_antiga(self):
+        status, resultado = _chamar(
+            {"ofertas_raw": OFERTAS, "mapeamentos": MAPEAMENTOS[:1], "mapeamentos_versao": "versao-antiga"}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(resultado["mapeamentos_versao"], function_app.mapping_set_version(MAPEAMENTOS[:1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+"""
+Regressão do normalizar-ofertas: o relatório calculado coluna a coluna deve ser
+igual ao do cálculo linha a linha original, inclusive com tipos mistos
+(números, booleanos e strings) nos campos choice.
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import json
+import os
+import random
+import sys
+import unittest
+
+import azure.functions as func
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+CAMPOS = ["Status", "Mercado", "TipoServico"]
+VALORES = ["Zeta", "Alpha", "A", " a ", "1", "True", "10", 1, 2, 0, 1.0, 2.5, 10, True, False, None, "", "nan", "-"]
+
+NULL_VALUES = ["nan", "none", "null", "n/a", "na", "#n/a", "", " ", "-", "--", "undefined"]
+
+
+def _valor_normalizado(val):
+    if pd.isna(val) or val is None:
+        return None
+    if isinstance(val, str) and val.strip().lower() in NULL_VALUES:
+        return None
+    val_str = str(val).strip()
+    return val_str if val_str else None
+
+
+def relatorio_linha_a_linha(ofertas_raw, mapeamentos, campos_choice, unmapped_value):
+    """Cálculo original (linha a linha) do relatório e das ofertas normalizadas."""
+    mapping_by_field = {field: {} for field in campos_choice}
+    for item in mapeamentos:
+        field = item.get("Campo")
+        ativo = item.get("Ativo")
+        if field not in mapping_by_field or (ativo is not None and not ativo):
+            continue
+        # Como no original, valores falsy (0, False, "") contam como ausentes
+        raw_key = _valor_normalizado(item.get("ValorRaw") or None)
+        if raw_key is not None:
+            mapping_by_field[field][raw_key] = _valor_normalizado(item.get("ValorNormalizado") or None)
+
+    relatorio = {
+        field: {"total": 0, "nulos": 0, "mapeados": 0, "nao_mapeados": 0, "nao": {}, "sim": {}}
+        for field in campos_choice
+    }
+    usados = {field: set() for field in campos_choice}
+    ofertas = []
+    for rec in pd.DataFrame(ofertas_raw).to_dict("records"):
+        rec_norm = {}
+        for field in campos_choice:
+            if field not in rec:
+                continue
+            stats = relatorio[field]
+            stats["total"] += 1
+            raw_key = _valor_normalizado(rec[field])
+            if raw_key is None:
+                stats["nulos"] += 1
+                rec_norm[field] = None
+            elif raw_key in mapping_by_field[field]:
+                mapped_val = mapping_by_field[field][raw_key]
+                usados[field].add(raw_key)
+                stats["mapeados"] += 1
+                stats["sim"][mapped_val] = stats["sim"].get(mapped_val, 0) + 1
+                rec_norm[field] = mapped_val
+            else:
+                stats["nao_mapeados"] += 1
+                stats["nao"][raw_key] = stats["nao"].get(raw_key, 0) + 1
+                rec_norm[field] = unmapped_value
+        ofertas.append(rec_norm)
+
+    normalizacao = {
+        field: {
+            "total": stats["total"],
+            "nulos": stats["nulos"],
+            "mapeados": stats["mapeados"],
+            "nao_mapeados": stats["nao_mapeados"],
+            "valores_nao_mapeados": [{"valor": k, "quantidade": v} for k, v in stats["nao"].items()],
+            "valores_mapeados": [{"valor": k, "quantidade": v} for k, v in stats["sim"].items()],
+        }
+        for field, stats in relatorio.items()
+    }
+    nao_usados = {}
+    for field, mapping in mapping_by_field.items():
+        unused = [k for k in mapping if k not in usados[field]]
+        if unused:
+            nao_usados[field] = unused
+    return normalizacao, nao_usados, ofertas
+
+
+def _chamar(body):
+    handler = function_app.normalizar_ofertas
+    built = getattr(handler, "_function", None)
+    handler = built._func if built is not None else handler
+    req = func.HttpRequest(
+        method="POST",
+        url="http://localhost/api/normalizar-ofertas",
+        headers={},
+        params={},
+        body=json.dumps(body).encode("utf-8"),
+    )
+    resp = handler(req)
+    return resp.status_code, json.loads(resp.get_body())
+
+
+class NormalizarOfertasRelatorioTest(unittest.TestCase):
+    def assert_igual_ao_linha_a_linha(self, ofertas_raw, mapeamentos, unmapped_value="UNMAPPED/OUTROS"):
+        status, resultado = _chamar(
+            {
+                "ofertas_raw": ofertas_raw,
+                "mapeamentos": mapeamentos,
+                "campos_choice": CAMPOS,
+                "unmapped_value": unmapped_value,
+            }
+        )
+        self.assertEqual(status, 200)
+        normalizacao, nao_usados, ofertas = relatorio_linha_a_linha(
+            ofertas_raw, mapeamentos, CAMPOS, unmapped_value
+        )
+        self.assertEqual(resultado["relatorio"]["normalizacao"], normalizacao)
+        self.assertEqual(resultado["relatorio"]["mapeamentos_nao_usados"], nao_usados)
+        obtidas = [
+            {field: rec[field] for field in esperado}
+            for rec, esperado in zip(resultado["ofertas_normalizadas"], ofertas)
+        ]
+        self.assertEqual(obtidas, ofertas)
+
+    def test_tipos_mistos_mantem_ordem_da_primeira_ocorrencia(self):
+        ofertas_raw = [{"Status": v} for v in ["Zeta", 1, "Alpha", True, None, "Zeta", 1.0, "1"]]
+        mapeamentos = [{"Campo": "Status", "ValorRaw": "Alpha", "ValorNormalizado": "A"}]
+        self.assert_igual_ao_linha_a_linha(ofertas_raw, mapeamentos)
+
+    def test_ofertas_aleatorias_com_tipos_mistos(self):
+        for seed in range(200):
+            rnd = random.Random(seed)
+            ofertas_raw = [
+                {field: rnd.choice(VALORES) for field in CAMPOS if rnd.random() < 0.9}
+                for _ in range(rnd.randint(1, 40))
+            ]
+            mapeamentos = [
+                {
+                    "Campo": rnd.choice(CAMPOS),
+                    "ValorRaw": rnd.choice(VALORES),
+                    "ValorNormalizado": rnd.choice(["X", "Y", "Z", None]),
+                    "Ativo": rnd.random() < 0.9,
+                }
+                for _ in range(rnd.randint(0, 8))
+            ]
+            with self.subTest(seed=seed):
+                self.assert_igual_ao_linha_a_linha(ofertas_raw, mapeamentos)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Parse de datas por coluna: parse_date_series deve bater com
+o parse célula a célula original (pd.to_datetime(dayfirst=True)), com e sem
+formato dominante na coluna.
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import os
+import random
+import sys
+import unittest
+import warnings
+from datetime import date, datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+FORMATOS = [
+    lambda d: d.strftime("%d/%m/%Y"),
+    lambda d: d.strftime("%d/%m/%Y %H:%M"),
+    lambda d: d.strftime("%d/%m/%y %H:%M"),
+    lambda d: d.strftime("%Y-%m-%d"),
+    lambda d: d.strftime("%Y-%m-%dT%H:%M:%SZ"),
+    lambda d: d.strftime("%Y-%m-%dT%H:%M:%S.000+0000"),
+    lambda d: d.strftime("%m/%d/%Y"),
+    lambda d: d.strftime("%d-%b-%Y"),
+]
+LIXO = [None, "", " ", "nan", "N/A", "-", "abc", "31/02/2025", "13/13/2025", 0, 1735689600000]
+
+
+def parse_date_celula(val):
+    """parse_date_safe original (sem cache nem parse por coluna)."""
+    if function_app.is_null_like(val):
+        return None
+    try:
+        if isinstance(val, (datetime, date)):
+            return val if isinstance(val, datetime) else datetime.combine(val, datetime.min.time())
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            dt = pd.to_datetime(val, errors="coerce", dayfirst=True)
+        return dt.to_pydatetime() if pd.notna(dt) else None
+    except Exception:
+        return None
+
+
+def coluna(seed, n=50, dominante=True):
+    rnd = random.Random(seed)
+    fmt_principal = rnd.choice(FORMATOS)
+    valores = []
+    for _ in range(n):
+        d = datetime(2020, 1, 1) + pd.Timedelta(minutes=rnd.randint(0, 6 * 365 * 24 * 60))
+        r = rnd.random()
+        if r < 0.1:
+            valores.append(rnd.choice(LIXO))
+        elif r < 0.15:
+            valores.append(d.date() if rnd.random() < 0.5 else d)
+        elif dominante and r < 0.9:
+            valores.append(fmt_principal(d))
+        else:
+            valores.append(rnd.choice(FORMATOS)(d))
+    return pd.Series(valores, dtype=object)
+
+
+class ParseDateSeriesTest(unittest.TestCase):
+    def assert_igual_celula_a_celula(self, series):
+        esperado = series.apply(parse_date_celula)
+        obtido = function_app.parse_date_series(series)
+        self.assertEqual(obtido.dtype, esperado.dtype)
+        self.assertEqual(
+            [None if pd.isna(v) else pd.Timestamp(v) for v in obtido.tolist()],
+            [None if pd.isna(v) else pd.Timestamp(v) for v in esperado.tolist()],
+        )
+
+    def test_formato_dominante(self):
+        for seed in range(60):
+            with self.subTest(seed=seed):
+                self.assert_igual_celula_a_celula(coluna(seed))
+
+    def test_formatos_misturados(self):
+        for seed in range(60):
+            with self.subTest(seed=seed):
+                self.assert_igual_celula_a_celula(coluna(seed, dominante=False))
+
+    def test_dia_primeiro(self):
+        obtido = function_app.parse_date_series(pd.Series(["05/03/2025", "31/12/27 13:18", None]))
+        self.assertEqual(obtido[0].date(), date(2025, 3, 5))
+        self.assertEqual(obtido[1], pd.Timestamp(2027, 12, 31, 13, 18))
+        self.assertTrue(pd.isna(obtido[2]))
+
+    def test_coluna_vazia(self):
+        obtido = function_app.parse_date_series(pd.Series([], dtype=object))
+        self.assertEqual(len(obtido), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
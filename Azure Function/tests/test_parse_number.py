@@ -0,0 +1,113 @@
+"""
+Parse de números por coluna: parse_number_series deve bater com
+series.apply(parse_number) e parse_number_column com o parse célula a célula
+original do import-jira (valores e dtype).
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import os
+import random
+import re
+import sys
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+AMOSTRAS = [
+    None, float("nan"), "", " ", "nan", "N/A", "-", "--", "abc", True, False,
+    0, 5, -3, 2.5, 1e6, np.int64(7), np.float64(1.25),
+    "1.234,56", "1,234.56", "R$ 1.234,56", "$1,000", "€1000", "12,5", "12.5", " 12 345,6 ",
+    "24%", " 12.5%", "150%", "1.234", "1,234", "--5", "1-2", "-.", ".5", "5.", "1 000,00",
+]
+
+
+def parse_number_celula(val, *, default=0, allow_null=False, percent=False):
+    """parse_number original do import-jira (uma célula por vez)."""
+    if function_app.is_null_value(val):
+        return None if allow_null else default
+    if isinstance(val, (int, float)) and not pd.isna(val):
+        num = float(val)
+    else:
+        s = str(val).strip()
+        s = s.replace("R$", "").replace("€", "").replace("$", "")
+        s = s.replace("\u00a0", " ").replace(" ", "")
+        has_percent = "%" in s
+        s = s.replace("%", "")
+        if "." in s and "," in s:
+            if s.rfind(",") > s.rfind("."):
+                s = s.replace(".", "").replace(",", ".")
+            else:
+                s = s.replace(",", "")
+        else:
+            s = s.replace(",", ".")
+        s = re.sub(r"[^0-9.\-]", "", s)
+        if s in ("", "-", ".", "-."):
+            return None if allow_null else default
+        try:
+            num = float(s)
+        except ValueError:
+            return None if allow_null else default
+        if has_percent and not percent:
+            num = num / 100
+    if percent and num > 1:
+        num = num / 100
+    return int(num) if num == int(num) else num
+
+
+def amostra(seed, n=60):
+    rnd = random.Random(seed)
+    return pd.Series([rnd.choice(AMOSTRAS) for _ in range(n)], dtype=object)
+
+
+class ParseNumberSeriesTest(unittest.TestCase):
+    def test_igual_ao_apply_de_parse_number(self):
+        for seed in range(100):
+            series = amostra(seed)
+            with self.subTest(seed=seed):
+                esperado = series.apply(function_app.parse_number)
+                obtido = function_app.parse_number_series(series)
+                pd.testing.assert_series_equal(obtido, esperado, check_dtype=False)
+
+    def test_default(self):
+        obtido = function_app.parse_number_series(pd.Series(["abc", None, "1,5"]), default=-1.0)
+        self.assertEqual(obtido.tolist(), [-1.0, -1.0, 1.5])
+
+
+class ParseNumberColumnTest(unittest.TestCase):
+    def assert_igual_celula_a_celula(self, series, **kwargs):
+        esperado = series.apply(lambda v: parse_number_celula(v, **kwargs))
+        obtido = function_app.parse_number_column(series, **kwargs)
+        self.assertEqual(obtido.dtype, esperado.dtype)
+        self.assertEqual(
+            [(type(v), v) for v in obtido.tolist() if v == v],
+            [(type(v), v) for v in esperado.tolist() if v == v],
+        )
+        self.assertEqual(obtido.isna().tolist(), esperado.isna().tolist())
+
+    def test_inteiros_viram_float_quando_a_coluna_tem_decimais(self):
+        obtido = function_app.parse_number_column(pd.Series(["5", "2,5"], dtype=object))
+        self.assertEqual(obtido.dtype, np.float64)
+        self.assertEqual(obtido.tolist(), [5.0, 2.5])
+
+    def test_coluna_so_de_inteiros_continua_int(self):
+        obtido = function_app.parse_number_column(pd.Series(["5", "1.000,00"], dtype=object))
+        self.assertEqual(obtido.tolist(), [5, 1000])
+        self.assertIsInstance(obtido.tolist()[0], int)
+
+    def test_amostras_aleatorias(self):
+        for seed in range(100):
+            series = amostra(seed, n=random.Random(seed).randint(1, 30))
+            for kwargs in ({"default": 0}, {"default": 0, "percent": True}, {"allow_null": True}):
+                with self.subTest(seed=seed, **kwargs):
+                    self.assert_igual_celula_a_celula(series, **kwargs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Cache de resultados do consolidar/consolidar-v2 (chave e bypass) e leitura
+dos app settings numéricos (get_env_int / get_env_float).
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import azure.functions as func
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+HOJE = datetime(2025, 6, 15, 9, 30)
+
+
+def _req(headers):
+    return func.HttpRequest(method="POST", url="http://localhost/api/consolidar", headers=headers, body=b"{}")
+
+
+class ResultCacheKeyTest(unittest.TestCase):
+    def test_ordem_das_chaves_nao_muda_a_chave(self):
+        a = function_app.result_cache_key("consolidar", {"ofertas": [{"a": 1, "b": 2}], "atualizacoes": []}, HOJE)
+        b = function_app.result_cache_key("consolidar", {"atualizacoes": [], "ofertas": [{"b": 2, "a": 1}]}, HOJE)
+        self.assertEqual(a, b)
+
+    def test_mesmo_dia_mesma_chave(self):
+        body = {"ofertas": [{"JiraKey": "OF-1"}]}
+        self.assertEqual(
+            function_app.result_cache_key("consolidar", body, HOJE),
+            function_app.result_cache_key("consolidar", body, HOJE.replace(hour=23, minute=59)),
+        )
+
+    def test_dia_rota_e_body_mudam_a_chave(self):
+        body = {"ofertas": [{"JiraKey": "OF-1"}]}
+        base = function_app.result_cache_key("consolidar", body, HOJE)
+        self.assertNotEqual(base, function_app.result_cache_key("consolidar", body, HOJE.replace(day=16)))
+        self.assertNotEqual(base, function_app.result_cache_key("consolidar-v2", body, HOJE))
+        self.assertNotEqual(base, function_app.result_cache_key("consolidar", {"ofertas": [{"JiraKey": "OF-2"}]}, HOJE))
+        self.assertNotEqual(base, function_app.result_cache_key("consolidar", {"ofertas": [{"JiraKey": 1}]}, HOJE))
+
+
+class ResultCacheBypassTest(unittest.TestCase):
+    def test_headers(self):
+        casos = [
+            ({}, False),
+            ({"X-Cache-Bypass": "true"}, True),
+            ({"x-cache-bypass": " 1 "}, True),
+            ({"X-Cache-Bypass": "false"}, False),
+            ({"X-Cache-Bypass": "sim"}, False),
+            ({"Cache-Control": "no-cache"}, True),
+            ({"Cache-Control": "max-age=0, No-Cache"}, True),
+            ({"Cache-Control": "max-age=60"}, False),
+        ]
+        for headers, esperado in casos:
+            with self.subTest(headers=headers):
+                self.assertEqual(function_app.result_cache_bypass(_req(headers)), esperado)
+
+
+class GetEnvNumberTest(unittest.TestCase):
+    def test_valores(self):
+        casos = [
+            (None, 7, 7.0),
+            ("", 7, 7.0),
+            ("  ", 7, 7.0),
+            ("12", 12, 12.0),
+            (" 12 ", 12, 12.0),
+            ("2.5", 7, 2.5),
+            ("abc", 7, 7.0),
+        ]
+        for raw, esperado_int, esperado_float in casos:
+            env = {} if raw is None else {"TESTE_APP_SETTING": raw}
+            with self.subTest(raw=raw), mock.patch.dict(os.environ, env):
+                if raw is None:
+                    os.environ.pop("TESTE_APP_SETTING", None)
+                obtido_int = function_app.get_env_int("TESTE_APP_SETTING", 7)
+                obtido_float = function_app.get_env_float("TESTE_APP_SETTING", 7.0)
+                self.assertEqual((type(obtido_int), obtido_int), (int, esperado_int))
+                self.assertEqual((type(obtido_float), obtido_float), (float, esperado_float))
+
+    def test_valor_invalido_gera_warning(self):
+        with mock.patch.dict(os.environ, {"TESTE_APP_SETTING": "10s"}):
+            with self.assertLogs(level="WARNING") as logs:
+                self.assertEqual(function_app.get_env_int("TESTE_APP_SETTING", 3), 3)
+        self.assertIn("TESTE_APP_SETTING", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
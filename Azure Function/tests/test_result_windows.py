@@ -0,0 +1,95 @@
+"""
+Blocos de resultados do consolidar-v2: aggregate_result_windows (uma passada)
+deve bater com o filtro por janela feito uma vez para cada (categoria, janela).
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import os
+import random
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+HOJE = datetime(2025, 6, 15, 12, 0)
+CATEGORIAS = ["won", "lost", "canceladas", "entregue", "desenvolvimento", "outro"]
+
+
+def janela_a_janela(df, updated, windows, hoje, key_col=None):
+    """Cálculo direto: um filtro por (categoria, janela)."""
+    resultado = {}
+    for categoria in function_app.CATEGORIA_DTYPE.categories:
+        for dias in sorted(set(windows)):
+            mask = (df["_categoria"] == categoria) & (updated >= pd.Timestamp(hoje) - timedelta(days=dias))
+            linhas = df[mask]
+            resultado[(categoria, dias)] = {
+                "linhas": int(mask.sum()),
+                "valor": float(linhas["_valor"].sum()),
+                "margem_soma": float(linhas["_margem"].sum()) if "_margem" in df.columns else 0.0,
+                "unicos": int(linhas[key_col].nunique()) if key_col else int(mask.sum()),
+            }
+    return resultado
+
+
+def ofertas(seed, n):
+    rnd = random.Random(seed)
+    df = pd.DataFrame({
+        "_categoria": [rnd.choice(CATEGORIAS) for _ in range(n)],
+        "_valor": [round(rnd.uniform(0, 1000), 2) for _ in range(n)],
+        "_margem": [round(rnd.uniform(-10, 40), 1) for _ in range(n)],
+        "JiraKey": [rnd.choice([f"OF-{i}" for i in range(n // 2 + 1)] + [None]) for _ in range(n)],
+    })
+    updated = pd.Series([
+        None if rnd.random() < 0.1
+        else HOJE - timedelta(days=rnd.choice([0, 7, 15, 30, 90]), hours=rnd.choice([-1, 0, 1]))
+        if rnd.random() < 0.3
+        else HOJE - timedelta(minutes=rnd.randint(-2 * 24 * 60, 120 * 24 * 60))
+        for _ in range(n)
+    ])
+    return df, pd.to_datetime(updated)
+
+
+class AggregateResultWindowsTest(unittest.TestCase):
+    def assert_igual_janela_a_janela(self, df, updated, windows, key_col=None):
+        obtido = function_app.aggregate_result_windows(df, updated, windows, HOJE, key_col=key_col)
+        esperado = janela_a_janela(df, updated, windows, HOJE, key_col=key_col)
+        self.assertEqual(set(obtido), set(esperado))
+        for chave, valores in esperado.items():
+            with self.subTest(chave=chave):
+                self.assertEqual(int(obtido[chave]["linhas"]), valores["linhas"])
+                self.assertEqual(int(obtido[chave]["unicos"]), valores["unicos"])
+                self.assertAlmostEqual(float(obtido[chave]["valor"]), valores["valor"], places=6)
+                self.assertAlmostEqual(float(obtido[chave]["margem_soma"]), valores["margem_soma"], places=6)
+
+    def test_ofertas_aleatorias(self):
+        for seed in range(40):
+            df, updated = ofertas(seed, random.Random(seed).randint(1, 80))
+            windows = function_app.parse_result_windows(random.Random(seed).sample([1, 60, 90, 365], 2))
+            with self.subTest(seed=seed):
+                self.assert_igual_janela_a_janela(df, updated, windows)
+                self.assert_igual_janela_a_janela(df, updated, windows, key_col="JiraKey")
+
+    def test_limite_da_janela_inclusivo(self):
+        df = pd.DataFrame({"_categoria": ["won", "won"], "_valor": [10.0, 20.0], "_margem": [1.0, 2.0]})
+        updated = pd.Series([HOJE - timedelta(days=7), HOJE - timedelta(days=7, seconds=1)])
+        obtido = function_app.aggregate_result_windows(df, updated, [7, 15], HOJE)
+        self.assertEqual(int(obtido[("won", 7)]["linhas"]), 1)
+        self.assertEqual(int(obtido[("won", 15)]["linhas"]), 2)
+
+    def test_datas_em_texto_e_sem_margem(self):
+        df = pd.DataFrame({"_categoria": ["lost", "lost"], "_valor": [5.0, 7.0]})
+        updated = pd.Series(["2025-06-14", "invalida"])
+        obtido = function_app.aggregate_result_windows(df, updated, [7], HOJE)
+        self.assertEqual(int(obtido[("lost", 7)]["linhas"]), 1)
+        self.assertEqual(float(obtido[("lost", 7)]["margem_soma"]), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Header Retry-After (Graph / Power BI): delta em segundos ou HTTP-date.
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+AGORA = datetime(2025, 6, 15, 12, 0, 0, tzinfo=timezone.utc)
+
+
+class AgoraFixa(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return AGORA if tz is None else AGORA.astimezone(tz)
+
+
+class ParseRetryAfterTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch.object(function_app, "datetime", AgoraFixa)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_segundos(self):
+        casos = [("120", 120.0), ("0", 0.0), ("1.5", 1.5), (" 7 ", 7.0), ("-5", 0.0), (30, 30.0)]
+        for valor, esperado in casos:
+            with self.subTest(valor=valor):
+                self.assertEqual(function_app.parse_retry_after(valor), esperado)
+
+    def test_http_date(self):
+        futuro = format_datetime(AGORA + timedelta(seconds=90), usegmt=True)
+        passado = format_datetime(AGORA - timedelta(minutes=5), usegmt=True)
+        self.assertEqual(function_app.parse_retry_after(futuro), 90.0)
+        self.assertEqual(function_app.parse_retry_after(passado), 0.0)
+
+    def test_http_date_sem_fuso_vale_como_utc(self):
+        self.assertEqual(function_app.parse_retry_after("Sun, 15 Jun 2025 12:01:00 -0000"), 60.0)
+
+    def test_ausente_ou_invalido(self):
+        for valor in (None, "", "abc", "Sun, 99 Foo 2025"):
+            with self.subTest(valor=valor):
+                self.assertIsNone(function_app.parse_retry_after(valor))
+
+
+if __name__ == "__main__":
+    unittest.main()
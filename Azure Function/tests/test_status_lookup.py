@@ -0,0 +1,56 @@
+"""
+Tabela de categorias de status: status extras de STATUS_CATEGORIAS_EXTRA
+(lista ou status avulso) e prioridade das categorias padrão.
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+class BuildStatusLookupTest(unittest.TestCase):
+    def test_extra_em_lista(self):
+        lookup = function_app.build_status_lookup({"won": ["Closed Won", " Fechada "]})
+        self.assertEqual(lookup["closed won"], "won")
+        self.assertEqual(lookup["fechada"], "won")
+
+    def test_extra_string_avulsa_nao_vira_caracteres(self):
+        lookup = function_app.build_status_lookup({"won": "Closed Won"})
+        self.assertEqual(lookup["closed won"], "won")
+        self.assertNotIn("c", lookup)
+        self.assertEqual(len(lookup), len(function_app.build_status_lookup()) + 1)
+
+    def test_extra_nao_sobrescreve_categoria_padrao(self):
+        lookup = function_app.build_status_lookup({"lost": ["Won"]})
+        self.assertEqual(lookup["won"], "won")
+
+    def test_categoria_desconhecida_ignorada(self):
+        with self.assertLogs(level="WARNING"):
+            lookup = function_app.build_status_lookup({"ganha": ["Closed Won"]})
+        self.assertNotIn("closed won", lookup)
+
+    def test_env_com_string_avulsa(self):
+        with mock.patch.dict(os.environ, {"STATUS_CATEGORIAS_EXTRA": '{"canceladas": "Descartada"}'}):
+            lookup = function_app.load_status_lookup()
+        self.assertEqual(lookup["descartada"], "canceladas")
+
+
+class CategorizeStatusSeriesTest(unittest.TestCase):
+    def test_categorias(self):
+        series = pd.Series(["Won", " lost ", "Proposal", "Qualquer", "Follow-up"])
+        obtido = function_app.categorize_status_series(series)
+        self.assertEqual(obtido.tolist(), ["won", "lost", "desenvolvimento", "outro", "entregue"])
+        self.assertEqual(obtido.dtype, function_app.CATEGORIA_DTYPE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+strip_html_to_text (Observacoes do import-jira): saída fixada para HTML típico
+de JIRA/Outlook e igual ao pipeline de regex original em entradas aleatórias.
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import html
+import os
+import random
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+# Espaços e TABs repetidos viram um espaço; "\" e a letra "t" ficam como estão
+# (o regex original r"[ \\t]+" os trocava por espaço e não tratava TAB).
+FIXTURES = [
+    ("Linha 1<br>Linha 2<BR/>Linha 3<br />fim", "Linha 1\nLinha 2\nLinha 3\nfim"),
+    ("<p>Parágrafo um</p><p>Parágrafo dois</p>", "Parágrafo um\nParágrafo dois"),
+    ("<div>Bloco</div><h2>Título</h2><table><tr><td>a</td><td>b</td></tr></table>", "Bloco\nTítulo\nab"),
+    ('<ul><li>um</li><li class="x">dois</li></ul>', "- um\n- dois"),
+    ("a &lt; b &amp;&amp; c &gt; d&nbsp;e", "a d\u00a0e"),
+    ("&lt;b&gt;negrito codificado&lt;/b&gt;", "negrito codificado"),
+    ("linha\r\nnova\rvelha", "linha\nnova\nvelha"),
+    ("<p>a</p>\n\n\n\n<p>b</p>", "a\n\nb"),
+    ("   espaços    repetidos   <br>   ", "espaços repetidos"),
+    ("04/11 =< cliente pediu revisão\n25/10 => em andamento", "04/11 = em andamento"),
+    ("texto com tab\te barra \\ invertida", "texto com tab e barra \\ invertida"),
+    ("<b>sem fechamento de bloco</b> <i>itálico</i>", "sem fechamento de bloco itálico"),
+]
+
+PEDACOS = [
+    "<br>", "<BR/>", "<br />", "<p>", "</p>", "<div class='x'>", "</div>", "<li>", "</li>", "<ul>", "</h2>",
+    "<tr>", "</td>", "<b>", "<link rel=x>", "<>", "&lt;", "&gt;", "&amp;", "&nbsp;", "texto", " ", "  ",
+    "\t", "\\", "\n", "\r\n", "=<", "=>", "<", ">", "Olá", "\n\n\n",
+]
+
+
+def strip_html_regex(val_str):
+    """Pipeline de regex original (uma substituição por vez), com a classe de espaços corrigida."""
+    s = html.unescape(val_str)
+    s = s.replace("\r\n", "\n").replace("\r", "\n")
+    s = re.sub(r"(?i)<br\s*/?>", "\n", s)
+    s = re.sub(r"(?i)</(div|p|tr|h\d)>", "\n", s)
+    s = re.sub(r"(?i)<li[^>]*>", "- ", s)
+    s = re.sub(r"(?i)</li>", "\n", s)
+    s = re.sub(r"<[^>]+>", "", s)
+    s = re.sub(r"[ \t]+", " ", s)
+    s = "\n".join(line.strip() for line in s.split("\n"))
+    s = re.sub(r"\n{3,}", "\n\n", s)
+    return s.strip()
+
+
+class StripHtmlToTextTest(unittest.TestCase):
+    def test_fixtures(self):
+        for entrada, esperado in FIXTURES:
+            with self.subTest(entrada=entrada):
+                self.assertEqual(function_app.strip_html_to_text(entrada), esperado)
+
+    def test_igual_ao_pipeline_de_regex(self):
+        rnd = random.Random(0)
+        for _ in range(5000):
+            entrada = "".join(rnd.choice(PEDACOS) for _ in range(rnd.randint(0, 20)))
+            with self.subTest(entrada=entrada):
+                self.assertEqual(function_app.strip_html_to_text(entrada), strip_html_regex(entrada))
+
+
+if __name__ == "__main__":
+    unittest.main()
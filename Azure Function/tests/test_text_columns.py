@@ -0,0 +1,87 @@
+"""
+Campos de texto do import-jira: normalize_text_column e
+normalize_observacoes_column devem bater com a normalização célula a célula
+original (valores e quantidade de truncados).
+
+Rodar a partir de "Azure Function": python -m unittest discover tests
+"""
+
+import html
+import os
+import random
+import re
+import sys
+import unittest
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+AMOSTRAS = [
+    None, float("nan"), "", " ", "nan", "N/A", "-", "undefined", 0, 12.5, True,
+    "texto", "  dois   espaços ", "linha\r\nnova", "tab\tseparado", "a b",
+    "x" * 20, "y" * 30, "<p>Olá&nbsp;<b>mundo</b></p>", "a &lt; b &amp;&amp; c &gt; d",
+    "<ul><li>um</li><li>dois</li></ul>", "sem html\r\ncom CRLF", "<br/>só quebra<br>",
+]
+
+
+def normalize_text_celula(val, max_length):
+    """normalize_text original (uma célula por vez)."""
+    if function_app.is_null_value(val):
+        return None
+    val_str = re.sub(r"\s+", " ", str(val).strip())
+    val_str = val_str.replace("\r\n", "\n").replace("\r", "\n")
+    if len(val_str) > max_length:
+        val_str = val_str[: max_length - 3] + "..."
+    return val_str if val_str else None
+
+
+def normalize_observacoes_celula(val, max_length, strip_html=True):
+    """normalize_observacoes original (uma célula por vez)."""
+    if function_app.is_null_value(val):
+        return None
+    s = str(val).strip()
+    if strip_html and ("<" in s or "&lt;" in s or "&gt;" in s or "&amp;" in s):
+        s = function_app.strip_html_to_text(s)
+    else:
+        s = html.unescape(s).replace("\r\n", "\n").replace("\r", "\n").strip()
+    if not s:
+        return None
+    if len(s) > max_length:
+        s = s[: max_length - 3] + "..."
+    return s
+
+
+def amostra(seed):
+    rnd = random.Random(seed)
+    return pd.Series([rnd.choice(AMOSTRAS) for _ in range(rnd.randint(1, 40))], dtype=object)
+
+
+class TextColumnsTest(unittest.TestCase):
+    def assert_igual_celula_a_celula(self, obtido, truncados, esperado):
+        self.assertEqual(obtido.tolist(), esperado.tolist())
+        self.assertEqual(truncados, int((esperado.fillna("").str.endswith("...")).sum()))
+
+    def test_normalize_text_column(self):
+        for seed in range(100):
+            series = amostra(seed)
+            with self.subTest(seed=seed):
+                obtido, truncados = function_app.normalize_text_column(series, 25)
+                esperado = series.apply(lambda v: normalize_text_celula(v, 25))
+                self.assert_igual_celula_a_celula(obtido, truncados, esperado)
+
+    def test_normalize_observacoes_column(self):
+        for seed in range(100):
+            series = amostra(seed)
+            for strip_html in (True, False):
+                with self.subTest(seed=seed, strip_html=strip_html):
+                    obtido, truncados = function_app.normalize_observacoes_column(series, 25, strip_html)
+                    esperado = series.apply(lambda v: normalize_observacoes_celula(v, 25, strip_html))
+                    self.assert_igual_celula_a_celula(obtido, truncados, esperado)
+
+
+if __name__ == "__main__":
+    unittest.main()